@@ -0,0 +1,288 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from ollama_client import (DEFAULT_CONNECT_TIMEOUT, DEFAULT_KEEP_ALIVE, DEFAULT_READ_TIMEOUT, OllamaClient,
+                           OllamaError, OllamaHTTPError, OllamaUnavailable)
+
+# =====================
+# CONFIG
+# =====================
+FAIL_THRESHOLD = 3                # errori consecutivi prima di aprire il circuito
+COOLDOWN_S = 30.0                 # circuito aperto: nodo escluso per questo tempo, poi un tentativo di prova
+HEALTH_INTERVAL_S = 15.0
+AFFINITY_BONUS = 2                # un nodo col modello già in memoria vale come 2 richieste in meno
+LATENCY_ALPHA = 0.2               # media mobile esponenziale della latenza
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def model_key(name: str) -> str:
+    # "llama3.2" e "llama3.2:latest" sono lo stesso modello
+    name = (name or "").strip()
+    return name if ":" in name else f"{name}:latest"
+
+def parse_backends(spec: str) -> List[Tuple[str, Optional[Set[str]]]]:
+    # "http://box1:11434=llama3.2,qwen2.5; http://box2:11434"  (senza "=modelli": scoperti da /api/tags)
+    out = []
+    for part in spec.replace("\n", ";").split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        host, _, models = part.partition("=")
+        names = {model_key(m) for m in models.split(",") if m.strip()}
+        out.append((host.strip(), names or None))
+    return out
+
+# =====================
+# BACKEND
+# =====================
+class Backend:
+    def __init__(self, client: OllamaClient, models: Optional[Set[str]] = None):
+        self.client = client
+        self.host = client.host
+        self.configured = models               # modelli dichiarati (None = qualsiasi)
+        self.discovered: Optional[Set[str]] = None
+        self.loaded: Set[str] = set()          # già in memoria (/api/ps): affinità
+        self.missing: Set[str] = set()         # 404 dal nodo, fino al prossimo health check
+        self.inflight = 0
+        self.failures = 0                      # consecutivi
+        self.open_until = 0.0                  # circuito aperto fino a...
+        self.trial = False                     # semi-aperto: una richiesta di prova in corso
+        self.latency_s = 0.0
+        self.counters = {"requests": 0, "errors": 0, "retries": 0, "opened": 0}
+
+    def serves(self, model: str) -> bool:
+        if model in self.missing:
+            return False
+        models = self.configured if self.configured is not None else self.discovered
+        return models is None or model in models
+
+    def state(self, now: float) -> str:
+        if self.failures < FAIL_THRESHOLD:
+            return "closed"
+        return "open" if now < self.open_until else "half-open"
+
+# =====================
+# POOL
+# =====================
+class BackendPool:
+    # Più server Ollama dietro la stessa interfaccia di OllamaClient.
+    # - instradamento: tra i nodi sani che servono il modello, il meno carico (richieste
+    #   in corso), con preferenza per chi ha il modello già caricato (niente attesa di load);
+    # - circuit breaker: dopo FAIL_THRESHOLD errori consecutivi il nodo è escluso per
+    #   COOLDOWN_S, poi passa una sola richiesta di prova (semi-aperto);
+    # - retry: errori di connessione, 5xx/429 e modello mancante ripartono su un altro nodo;
+    #   negli stream solo se non è ancora arrivato nessun token;
+    # - health check periodico in background: modelli installati (/api/tags) e caricati (/api/ps).
+    def __init__(self, backends: List[Tuple[str, Optional[Set[str]]]],
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT, read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE, health_interval_s: float = HEALTH_INTERVAL_S):
+        if not backends:
+            raise ValueError("nessun backend configurato")
+        self.backends = [Backend(OllamaClient(host, connect_timeout, read_timeout, keep_alive), models)
+                         for host, models in backends]
+        self.keep_alive = keep_alive
+        self.read_timeout = read_timeout
+        self.host = ", ".join(b.host for b in self.backends)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health: Optional[threading.Thread] = None
+        if health_interval_s > 0:
+            self._health = threading.Thread(target=self._health_loop, args=(health_interval_s,), daemon=True)
+            self._health.start()
+
+    # ---- instradamento ----
+    def _acquire(self, model: str, exclude: Set[Backend]) -> Optional[Backend]:
+        now = time.time()
+        with self._lock:
+            best, best_score = None, 0.0
+            for b in self.backends:
+                if b in exclude or not b.serves(model):
+                    continue
+                state = b.state(now)
+                if state == "open" or (state == "half-open" and b.trial):
+                    continue
+                score = b.inflight - (AFFINITY_BONUS if model in b.loaded else 0)
+                if best is None or (score, b.latency_s) < (best_score, best.latency_s):
+                    best, best_score = b, score
+            if best is None:
+                return None
+            if best.state(now) == "half-open":
+                best.trial = True
+            best.inflight += 1
+            best.counters["requests"] += 1
+            return best
+
+    def _release(self, b: Backend, model: str, ok: bool, elapsed: float, error: Optional[Exception] = None) -> None:
+        with self._lock:
+            b.inflight -= 1
+            b.trial = False
+            if ok:
+                b.failures = 0
+                b.loaded.add(model)
+                b.latency_s = elapsed if not b.latency_s else (1 - LATENCY_ALPHA) * b.latency_s + LATENCY_ALPHA * elapsed
+                return
+            b.counters["errors"] += 1
+            if isinstance(error, OllamaHTTPError) and error.status == 404:
+                b.missing.add(model)      # il nodo non ha il modello: non è un guasto
+                return
+            b.failures += 1
+            if b.failures >= FAIL_THRESHOLD:
+                if b.open_until <= time.time():
+                    b.counters["opened"] += 1
+                b.open_until = time.time() + COOLDOWN_S
+
+    def _exhausted(self, key: str, last: Optional[OllamaError]) -> OllamaError:
+        if last is not None:
+            return last
+        if not any(b.serves(key) for b in self.backends):
+            # nessun nodo ha il modello: errore esplicito, non "irraggiungibile" (niente ripiego sulla CLI)
+            return OllamaError(f"modello {key} non presente su nessun backend")
+        return OllamaUnavailable(f"nessun backend disponibile per {key} ({self.host})")
+
+    @staticmethod
+    def _retryable(e: OllamaError) -> bool:
+        if isinstance(e, OllamaUnavailable):
+            return True
+        return isinstance(e, OllamaHTTPError) and (e.status in RETRY_STATUSES or e.status == 404)
+
+    def _call(self, model: str, fn: Callable[[OllamaClient], Any]) -> Any:
+        key = model_key(model)
+        tried: Set[Backend] = set()
+        last: Optional[OllamaError] = None
+        while True:
+            b = self._acquire(key, tried)
+            if b is None:
+                raise self._exhausted(key, last)
+            if tried:
+                b.counters["retries"] += 1
+            tried.add(b)
+            t0 = time.perf_counter()
+            try:
+                out = fn(b.client)
+            except OllamaError as e:
+                self._release(b, key, False, 0.0, e)
+                if not self._retryable(e):
+                    raise
+                last = e
+                continue
+            self._release(b, key, True, time.perf_counter() - t0)
+            return out
+
+    def _stream(self, model: str, fn: Callable[[OllamaClient], Iterator[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+        key = model_key(model)
+        tried: Set[Backend] = set()
+        last: Optional[OllamaError] = None
+        while True:
+            b = self._acquire(key, tried)
+            if b is None:
+                raise self._exhausted(key, last)
+            if tried:
+                b.counters["retries"] += 1
+            tried.add(b)
+            t0 = time.perf_counter()
+            first: Optional[float] = None
+            released = False
+            try:
+                for chunk in fn(b.client):
+                    if first is None:
+                        # latenza = tempo al primo chunk, confrontabile tra nodi
+                        first = time.perf_counter() - t0
+                    yield chunk
+            except OllamaError as e:
+                released = True
+                self._release(b, key, False, 0.0, e)
+                if first is not None or not self._retryable(e):
+                    raise
+                last = e
+                continue
+            finally:
+                # anche se chi legge abbandona lo stream a metà
+                if not released:
+                    self._release(b, key, True, first if first is not None else time.perf_counter() - t0)
+            return
+
+    # ---- API (come OllamaClient) ----
+    def generate_raw(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                     context: Optional[List[int]] = None) -> Dict[str, Any]:
+        return self._call(model, lambda c: c.generate_raw(model, prompt, options, context))
+
+    def generate(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        return self._call(model, lambda c: c.generate(model, prompt, options))
+
+    def chat_raw(self, model: str, messages: List[Dict[str, str]],
+                 options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return self._call(model, lambda c: c.chat_raw(model, messages, options))
+
+    def chat(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> str:
+        return self._call(model, lambda c: c.chat(model, messages, options))
+
+    def generate_stream(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                        context: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        return self._stream(model, lambda c: c.generate_stream(model, prompt, options, context))
+
+    def chat_stream(self, model: str, messages: List[Dict[str, str]],
+                    options: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        return self._stream(model, lambda c: c.chat_stream(model, messages, options))
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        return self._call(model, lambda c: c.embed(model, texts))
+
+    def load(self, model: str) -> Dict[str, Any]:
+        # un nodo solo, scelto come per le richieste (preferito chi l'ha già in memoria)
+        return self._call(model, lambda c: c.load(model))
+
+    def unload(self, model: str) -> Dict[str, Any]:
+        key = model_key(model)
+        with self._lock:
+            nodes = [b for b in self.backends if key in b.loaded]
+        for b in nodes:
+            try:
+                b.client.unload(model)
+            except OllamaError:
+                continue
+            with self._lock:
+                b.loaded.discard(key)
+        return {"model": model, "done": True}
+
+    def is_available(self) -> bool:
+        return any(b.client.is_available() for b in self.backends)
+
+    def close(self) -> None:
+        self._stop.set()
+        for b in self.backends:
+            b.client.close()
+
+    # ---- health check ----
+    def check(self) -> None:
+        for b in self.backends:
+            try:
+                models = {model_key(m) for m in b.client.list_models()}
+                loaded = {model_key(m) for m in b.client.running_models()}
+            except OllamaUnavailable:
+                # nodo irraggiungibile: circuito aperto subito, senza aspettare errori sulle richieste
+                with self._lock:
+                    b.failures = max(b.failures + 1, FAIL_THRESHOLD)
+                    if b.open_until <= time.time():
+                        b.counters["opened"] += 1
+                    b.open_until = time.time() + COOLDOWN_S
+                continue
+            except OllamaError:
+                continue
+            with self._lock:
+                b.discovered, b.loaded, b.missing = models, loaded, set()
+                if b.failures >= FAIL_THRESHOLD:
+                    # il nodo risponde di nuovo: semi-aperto, la prossima richiesta fa da prova
+                    b.open_until = 0.0
+
+    def _health_loop(self, interval: float) -> None:
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(interval)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            return [dict(b.counters, host=b.host, state=b.state(now), inflight=b.inflight,
+                         latency_ms=round(b.latency_s * 1000, 1), loaded=sorted(b.loaded),
+                         models=sorted(b.configured if b.configured is not None else b.discovered or []))
+                    for b in self.backends]
@@ -0,0 +1,215 @@
+"""Modalità batch: elabora un JSONL di messaggi/comandi con la stessa pipeline dei bot.
+
+Uso:
+    py batch.py domande.jsonl -o risultati.jsonl [--workers 2] [--bot bot|bot_web] [--retry-errors]
+                [--metrics-port 9108] [--metrics-file batch.prom] [--trace tracce/ [--profile 5]]
+
+Ogni riga di input è un oggetto JSON:
+    {"id": "T-1042", "message": "Outlook non si apre dopo l'aggiornamento", "mode": "helpdesk", "lang": "it"}
+    {"id": "man-7", "file": "C:\\\\docs\\\\manuale.pdf", "message": "/filesum"}
+
+"message" può essere testo (turno di chat) o un comando /...; "file" viene caricato prima
+con /file. Ogni record ha la sua sessione pulita (corpus solo in memoria). I risultati escono in JSONL appena
+pronti (con i tempi per record) e il file di output fa da checkpoint: rilanciando lo
+stesso comando si saltano gli id già completati. Le metriche dei worker (istogrammi per
+fase e comando) vengono riunite nel contatore del batch: --metrics-port le espone su
+/metrics durante l'esecuzione, --metrics-file le scrive alla fine in formato Prometheus.
+--trace salva una traccia JSON (formato Chrome) per richiesta; --profile N aggiunge
+cProfile e tracemalloc per le N richieste più lente.
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from metrics import Metrics, serve_metrics
+
+VALID_MODES = {"helpdesk", "docente"}
+VALID_LANGS = {"auto", "it", "es"}
+
+# modulo del bot caricato da init_worker
+_bot: Any = None
+
+# =====================
+# INPUT / CHECKPOINT
+# =====================
+def read_records(path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for n, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError as e:
+                rec = {"_invalid": f"JSON non valido: {e}"}
+            if not isinstance(rec, dict):
+                rec = {"_invalid": "il record deve essere un oggetto JSON"}
+            rec.setdefault("id", f"line-{n}")
+            yield n, rec
+
+def completed_ids(path: str, retry_errors: bool) -> Set[str]:
+    # il file dei risultati è il checkpoint: una riga scritta = record concluso
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                res = json.loads(line)
+            except ValueError:
+                continue   # ultima riga troncata da un crash
+            if res.get("ok") or not retry_errors:
+                done.add(str(res.get("id")))
+    return done
+
+# =====================
+# WORKER
+# =====================
+def init_worker(bot_name: str, trace_dir: str = "", profile_top: int = 0) -> None:
+    global _bot
+    _bot = importlib.import_module(bot_name)
+    if trace_dir:
+        _bot.tracer.configure(trace_dir, profile_top=profile_top)
+
+def new_session(rec: Dict[str, Any]) -> Any:
+    # corpus solo in memoria: i record non toccano il corpus salvato dell'utente
+    s = _bot.new_session(f"batch-{rec.get('id')}", None)
+    s.mode = rec.get("mode") or _bot.DEFAULT_MODE
+    s.lang = rec.get("lang") or _bot.DEFAULT_LANG
+    if s.mode not in VALID_MODES:
+        raise ValueError(f"mode non valido: {s.mode}")
+    if s.lang not in VALID_LANGS:
+        raise ValueError(f"lang non valido: {s.lang}")
+    return s
+
+def run_record(rec: Dict[str, Any]) -> Dict[str, Any]:
+    b = _bot
+    t0 = time.perf_counter()
+    out: Dict[str, Any] = {"id": rec.get("id"), "ok": False, "worker": threading.current_thread().name}
+    timings: Dict[str, float] = {}
+    s = None
+    try:
+        if "_invalid" in rec:
+            raise ValueError(rec["_invalid"])
+        s = new_session(rec)
+        msg = str(rec.get("message") or "").strip()
+        effective_lang = b.detect_lang(msg) if s.lang == "auto" else s.lang
+        # priorità batch: i record cedono il modello alla chat interattiva (stesso Ollama)
+        with b.sessions.use(s), b.llm.context("batch", s.id):
+            if rec.get("file"):
+                t1 = time.perf_counter()
+                with b.tracer.request("/file", session=s.id):
+                    loaded = b.handle_command(f"/file {rec['file']}", effective_lang)
+                timings["file_s"] = round(time.perf_counter() - t1, 3)
+                if s.last_file_text is None:
+                    raise ValueError(loaded)
+            if not msg:
+                raise ValueError("campo 'message' mancante")
+            t1 = time.perf_counter()
+            answer = b.respond(msg, effective_lang)
+        timings["answer_s"] = round(time.perf_counter() - t1, 3)
+        if "ttft_s" in s.last_stats:
+            timings["ttft_s"] = round(s.last_stats["ttft_s"], 3)
+        out.update(answer=answer, lang=effective_lang, cache=s.last_stats.get("cache"))
+        # ok solo con una risposta vera: vuota, messaggio d'errore del bot o chiamata al modello fallita = errore
+        if not answer.strip() or answer == "[Nessuna risposta]":
+            out["error"] = "risposta vuota"
+        elif answer.startswith(b.ERROR_PREFIXES):
+            out["error"] = answer
+        elif "error" in s.last_stats:
+            out["error"] = str(s.last_stats["error"])
+        else:
+            out["ok"] = True
+    except Exception as e:
+        out["error"] = f"{e.__class__.__name__}: {e}"
+    finally:
+        if s is not None:
+            b.models.forget(s.id)     # una sessione per record: il keep-alive non deve accumularle
+    timings["total_s"] = round(time.perf_counter() - t0, 3)
+    out["timings"] = timings
+    # metriche dall'ultimo drain: run_batch le somma nel contatore del batch
+    out["_metrics"] = b.metrics.drain() if b is not None else None
+    return out
+
+# =====================
+# MAIN
+# =====================
+def write_result(f, res: Dict[str, Any]) -> None:
+    f.write(json.dumps(res, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+def run_batch(input_path: str, output_path: str, workers: int = 1, bot_name: str = "bot",
+              retry_errors: bool = False, progress: bool = True, metrics: Optional[Metrics] = None,
+              trace_dir: str = "", profile_top: int = 0) -> Dict[str, Any]:
+    done = completed_ids(output_path, retry_errors)
+    todo: List[Dict[str, Any]] = [rec for _n, rec in read_records(input_path) if str(rec["id"]) not in done]
+    stats = {"skipped": len(done), "total": len(todo), "ok": 0, "errors": 0}
+    t0 = time.perf_counter()
+
+    def report(res: Dict[str, Any]) -> None:
+        if metrics is not None:
+            metrics.merge(res.get("_metrics"))
+        stats["ok" if res.get("ok") else "errors"] += 1
+        if progress and sys.stderr.isatty():
+            n = stats["ok"] + stats["errors"]
+            print(f"\r📦 Batch: {n}/{stats['total']} (errori {stats['errors']})", end="", file=sys.stderr, flush=True)
+
+    with open(output_path, "a", encoding="utf-8") as f:
+        init_worker(bot_name, trace_dir, profile_top)
+        try:
+            if workers <= 1:
+                for rec in todo:
+                    res = run_record(rec)
+                    write_result(f, {k: v for k, v in res.items() if k != "_metrics"})
+                    report(res)
+            elif todo:
+                # thread nello stesso processo: un solo scheduler, quindi al massimo LLM_MAX_CONCURRENT
+                # chiamate al modello per tutto il batch (un processo per worker le moltiplicava);
+                # le pagine dei PDF si estraggono già in un pool di processi a parte
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+                    futures = [pool.submit(run_record, rec) for rec in todo]
+                    for fut in as_completed(futures):
+                        res = fut.result()
+                        write_result(f, {k: v for k, v in res.items() if k != "_metrics"})
+                        report(res)
+        finally:
+            _bot.release_models()    # come all'uscita della CLI: keep_alive=0 ai modelli caricati da qui
+    if progress and sys.stderr.isatty() and todo:
+        print(file=sys.stderr)
+    stats["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    return stats
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="BotIA batch (JSONL)")
+    ap.add_argument("input")
+    ap.add_argument("-o", "--output", default="")
+    ap.add_argument("--workers", type=int, default=1, help="record in parallelo (condividono la concorrenza verso il modello)")
+    ap.add_argument("--bot", default="bot", choices=["bot", "bot_web"])
+    ap.add_argument("--retry-errors", action="store_true", help="ripete anche i record finiti in errore")
+    ap.add_argument("--metrics-port", type=int, default=0, help="espone /metrics (Prometheus) durante il batch")
+    ap.add_argument("--metrics-file", default="", help="scrive le metriche Prometheus alla fine (textfile collector)")
+    ap.add_argument("--trace", default="", help="cartella per le tracce delle richieste (JSON Chrome)")
+    ap.add_argument("--profile", type=int, default=0, metavar="N",
+                    help="cProfile + tracemalloc per le N richieste più lente")
+    args = ap.parse_args(argv)
+    trace_dir = args.trace or ("traces" if args.profile else "")
+    output = args.output or os.path.splitext(args.input)[0] + ".results.jsonl"
+    metrics = Metrics()
+    if args.metrics_port:
+        serve_metrics(metrics, args.metrics_port)
+    stats = run_batch(args.input, output, args.workers, args.bot, args.retry_errors, metrics=metrics,
+                      trace_dir=trace_dir, profile_top=args.profile)
+    if args.metrics_file:
+        with open(args.metrics_file, "w", encoding="utf-8") as f:
+            f.write(metrics.prometheus())
+    print(json.dumps(dict(stats, output=output), ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark estrazione testo HTML: BeautifulSoup completo vs estrattori incrementali.
+
+Uso:
+    py benchmarks/bench_html.py [--pages cartella_con_html] [--synthetic 20] [--size-kb 2000] [--max-chars 6000]
+
+Con --pages usa le pagine salvate (*.html, *.htm); altrimenti genera pagine sintetiche
+di documentazione (menu, script, tabelle) della dimensione indicata.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_text import extract_content, extract_text, soup_text  # noqa: E402
+
+WORDS = ("configurare profilo outlook certificato proxy dns criterio gruppo dominio utente server "
+         "installazione aggiornamento licenza firewall porta servizio registro errore").split()
+
+def make_page(rng: random.Random, size_kb: int) -> str:
+    nav = "<nav><ul>" + "".join(f"<li><a href='/p{i}'>Voce {i}</a></li>" for i in range(200)) + "</ul></nav>"
+    script = "<script>var cfg = {" + ",".join(f"k{i}: {i}" for i in range(2000)) + "};</script>"
+    parts = ["<html><head><title>Manuale</title><style>body{font:12px sans-serif}</style></head><body>", nav, script]
+    size = sum(len(p) for p in parts)
+    n = 0
+    while size < size_kb * 1024:
+        n += 1
+        if n % 10 == 0:
+            block = "<table>" + "".join(f"<tr><td>{rng.choice(WORDS)}</td><td>{rng.randint(0, 9999)}</td></tr>"
+                                        for _ in range(20)) + "</table>"
+        else:
+            block = f"<h2>Sezione {n}</h2><p>" + " ".join(rng.choices(WORDS, k=80)) + "</p>"
+        parts.append(block)
+        size += len(block)
+    parts.append("</body></html>")
+    return "".join(parts)
+
+def measure(fn, html: str):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn(html)
+    dt = time.perf_counter() - t0
+    _cur, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dt * 1000, peak, out
+
+def summary(values):
+    values = sorted(values)
+    return {"p50": round(statistics.median(values), 2), "max": round(values[-1], 2)}
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", default="")
+    ap.add_argument("--synthetic", type=int, default=20)
+    ap.add_argument("--size-kb", type=int, default=2000)
+    ap.add_argument("--max-chars", type=int, default=6000)
+    args = ap.parse_args()
+
+    if args.pages:
+        files = sorted(glob.glob(os.path.join(args.pages, "*.htm*")))
+        pages = []
+        for p in files:
+            with open(p, "rb") as f:
+                pages.append(f.read().decode("utf-8", errors="replace"))
+    else:
+        rng = random.Random(42)
+        pages = [make_page(rng, args.size_kb) for _ in range(args.synthetic)]
+    if not pages:
+        sys.exit("Nessuna pagina trovata.")
+
+    soup_ms, soup_mem, fast_ms, fast_mem, content_ms, content_chars = [], [], [], [], [], []
+    for html in pages:
+        ms, mem, _ = measure(lambda h: soup_text(h)[:args.max_chars], html)
+        soup_ms.append(ms)
+        soup_mem.append(mem / 1e6)
+        ms, mem, _ = measure(lambda h: extract_text(h, args.max_chars), html)
+        fast_ms.append(ms)
+        fast_mem.append(mem / 1e6)
+        # contenuto principale: testo utile senza menu/footer, con lo stesso budget
+        ms, _mem, out = measure(lambda h: extract_content(h, args.max_chars), html)
+        content_ms.append(ms)
+        content_chars.append(len(out))
+
+    print(json.dumps({
+        "pages": len(pages),
+        "avg_page_kb": round(sum(len(p) for p in pages) / len(pages) / 1024, 1),
+        "max_chars": args.max_chars,
+        "soup_ms": summary(soup_ms),
+        "soup_peak_mb": summary(soup_mem),
+        "fast_ms": summary(fast_ms),
+        "fast_peak_mb": summary(fast_mem),
+        "content_ms": summary(content_ms),
+        "content_chars": summary(content_chars),
+        "speedup_p50": round(statistics.median(soup_ms) / max(statistics.median(fast_ms), 1e-6), 1),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark indicizzazione e ricerca ibrida su un corpus sintetico.
+
+Uso:
+    py benchmarks/bench_retrieval.py [--docs 20] [--lines 2000] [--queries 50] [--ollama-model nomic-embed-text]
+
+Senza --ollama-model usa HashEmbedder (nessun server necessario).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doc_store import DocumentStore, HashEmbedder, OllamaEmbedder  # noqa: E402
+from ollama_client import OllamaClient  # noqa: E402
+
+WORDS = ("errore rete vpn proxy dns driver stampante outlook profilo utente server disco backup "
+         "certificato firewall aggiornamento licenza timeout porta servizio registro evento").split()
+
+def make_doc(rng: random.Random, lines: int) -> str:
+    return "\n".join(
+        f"2024-05-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00 " + " ".join(rng.choices(WORDS, k=12))
+        for _ in range(lines)
+    )
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=20)
+    ap.add_argument("--lines", type=int, default=2000)
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--ollama-model", default="")
+    ap.add_argument("--host", default=os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434"))
+    args = ap.parse_args()
+
+    rng = random.Random(42)
+    embedder = OllamaEmbedder(OllamaClient(args.host), args.ollama_model) if args.ollama_model else HashEmbedder()
+    store = DocumentStore("bench", None, embedder)
+
+    t0 = time.perf_counter()
+    chunks = 0
+    embed_s = 0.0
+    for d in range(args.docs):
+        info = store.add(f"doc{d}.log", make_doc(rng, args.lines), "text")
+        chunks += info["chunks"]
+        embed_s += store.timings.get("embed_s", 0.0)
+    ingest_s = time.perf_counter() - t0
+
+    lat = []
+    for _ in range(args.queries):
+        q = " ".join(rng.choices(WORDS, k=4))
+        t1 = time.perf_counter()
+        store.search(q, 5)
+        lat.append((time.perf_counter() - t1) * 1000)
+    lat.sort()
+
+    print(json.dumps({
+        "embedder": getattr(embedder, "model", "?"),
+        "docs": args.docs,
+        "chunks": chunks,
+        "ingest_s": round(ingest_s, 3),
+        "embed_chunks_per_s": round(chunks / embed_s, 1) if embed_s else None,
+        "query_ms_p50": round(statistics.median(lat), 3),
+        "query_ms_p95": round(lat[int(len(lat) * 0.95) - 1], 3),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark dell'avvio a freddo di bot.py e bot_web.py (python -X importtime).
+
+Uso:
+    py benchmarks/bench_startup.py [--reps 7] [--bots bot,bot_web] [--out risultati.json]
+                                   [--baseline risultati_precedenti.json] [--threshold 0.15]
+                                   [--max-import-ms 150]
+
+Per ogni bot, in processi nuovi: tempo di import del modulo (dal report di -X importtime,
+senza l'avvio dell'interprete) e tempo fino al prompt (processo completo che riceve
+"exit"). Controlla anche che i moduli pesanti (pypdf, python-docx, numpy, requests,
+duckduckgo_search, ...) non vengano importati all'avvio: se compaiono, o se un p50
+peggiora oltre --threshold rispetto a --baseline, o supera --max-import-ms, il codice di
+uscita è 1. I risultati escono in JSON come quelli di bench_suite.py.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Set, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from bench_suite import compare, git_commit  # noqa: E402
+
+# devono arrivare solo col primo comando che li usa (vedi lazy_import.py)
+HEAVY_MODULES = ("numpy", "pypdf", "docx", "requests", "urllib3", "duckduckgo_search", "bs4", "lxml")
+
+def import_profile(bot: str, env: Dict[str, str]) -> Tuple[float, Set[str], List[Tuple[float, str]]]:
+    # (ms di import del bot, moduli importati, moduli diretti più lenti)
+    r = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {bot}"], cwd=ROOT, env=env,
+                       capture_output=True, text=True, check=True)
+    total_us, modules, top, children = 0, set(), [], []
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _self, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue    # intestazione
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        modules.add(name.split(".")[0])
+        # i figli compaiono prima del genitore: quelli di "site" non contano
+        if depth == 1:
+            children.append((int(cumulative) / 1000, name))
+        elif depth == 0:
+            if name == bot:
+                total_us, top = int(cumulative), children
+            children = []
+    return total_us / 1000, modules, sorted(top, reverse=True)[:8]
+
+def time_to_prompt(bot: str, env: Dict[str, str]) -> float:
+    # processo intero: interprete, import, sessione, banner, prompt, "exit"
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, f"{bot}.py"], cwd=ROOT, env=env, input="exit\n",
+                   capture_output=True, text=True, encoding="utf-8", check=True, timeout=60)
+    return (time.perf_counter() - t0) * 1000
+
+def stats(values: List[float]) -> Dict[str, Any]:
+    s = sorted(values)
+    return {"n": len(s), "p50_ms": round(statistics.median(s), 1),
+            "p95_ms": round(s[min(len(s) - 1, int(0.95 * len(s)))], 1), "max_ms": round(s[-1], 1)}
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--reps", type=int, default=7)
+    ap.add_argument("--bots", default="bot,bot_web")
+    ap.add_argument("--out", default="")
+    ap.add_argument("--baseline", default="")
+    ap.add_argument("--threshold", type=float, default=0.15)
+    ap.add_argument("--max-import-ms", type=float, default=0.0, help="tetto assoluto del p50 di import (0 = nessuno)")
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="botia-startup-")
+    env = dict(os.environ, PYTHONIOENCODING="utf-8", PYTHONDONTWRITEBYTECODE="1", BOTIA_WARMUP="0",
+               BOTIA_OLLAMA_BACKENDS="", BOTIA_TRACE_DIR="",
+               BOTIA_CACHE_DIR=os.path.join(tmp, "cache"), BOTIA_DOCS_DIR=os.path.join(tmp, "docs"),
+               BOTIA_FILE_CACHE_DIR=os.path.join(tmp, "files"), BOTIA_PAGE_CACHE_DIR=os.path.join(tmp, "pages"))
+    results: Dict[str, Any] = {}
+    failures: List[str] = []
+    try:
+        for bot in [b for b in args.bots.split(",") if b]:
+            import_profile(bot, env)   # riscalda la cache del disco e i .pyc
+            imports, prompts, heavy, top = [], [], set(), []
+            for _ in range(args.reps):
+                ms, modules, top = import_profile(bot, env)
+                imports.append(ms)
+                heavy |= modules & set(HEAVY_MODULES)
+                prompts.append(time_to_prompt(bot, env))
+            results[f"import:{bot}"] = dict(stats(imports), heavy_modules=sorted(heavy),
+                                            slowest=[{"module": n, "ms": round(v, 1)} for v, n in top])
+            results[f"prompt:{bot}"] = stats(prompts)
+            print(f"{bot:<10} import p50={results[f'import:{bot}']['p50_ms']:.0f}ms  "
+                  f"prompt p50={results[f'prompt:{bot}']['p50_ms']:.0f}ms  "
+                  f"lenti: {', '.join(f'{n} {v:.0f}ms' for v, n in top[:4])}", file=sys.stderr)
+            if heavy:
+                failures.append(f"{bot} importa all'avvio {', '.join(sorted(heavy))}")
+            if args.max_import_ms and results[f"import:{bot}"]["p50_ms"] > args.max_import_ms:
+                failures.append(f"{bot}: import oltre {args.max_import_ms:.0f}ms")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    report = {
+        "meta": {"commit": git_commit(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                 "python": platform.python_version(), "platform": platform.platform(), "args": vars(args)},
+        "results": results,
+    }
+    out = args.out or os.path.join(BENCH_DIR, "results", f"startup-{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Risultati: {out}", file=sys.stderr)
+    regressions = compare(results, args.baseline, args.threshold) if args.baseline else []
+    failures += [f"regressione {name} oltre {args.threshold:.0%}" for name in regressions]
+    if failures:
+        print("\n" + "\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
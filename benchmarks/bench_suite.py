@@ -0,0 +1,335 @@
+"""Suite di benchmark end-to-end: chat, /file, /filesum, /askfile, /web, /read.
+
+Uso:
+    py benchmarks/bench_suite.py [--sizes small,medium] [--reps 3] [--users 4] [--only chat,file,web]
+                                 [--ttft 0.05] [--tps 200] [--prompt-tps 0] [--fail-rate 0]
+                                 [--pages cartella_con_html] [--out risultati.json]
+                                 [--baseline risultati_precedenti.json] [--threshold 0.15]
+
+Avvia nello stesso processo un Ollama finto (fake_ollama.py) e un server di pagine
+locali (page_server.py), genera un corpus fisso (log, PDF, DOCX per ogni taglia, con
+seme fisso) e misura latenza (p50/p95/max), TTFT e throughput di ogni comando con cache
+fredde. I risultati escono in JSON insieme al commit git: con --baseline si confrontano
+con un'esecuzione precedente e il codice di uscita è 1 se un p50 peggiora oltre --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_ollama import FakeOllama  # noqa: E402
+from page_server import PageServer  # noqa: E402
+
+WORDS = ("errore rete vpn proxy dns driver stampante outlook profilo utente server disco backup "
+         "certificato firewall aggiornamento licenza timeout porta servizio registro evento").split()
+# taglia -> (byte del log, pagine PDF, paragrafi DOCX, KB della pagina web)
+SIZES = {
+    "small": (50_000, 10, 50, 50),
+    "medium": (1_000_000, 100, 500, 500),
+    "large": (10_000_000, 500, 3000, 2500),
+}
+SCENARIOS = ("chat", "file", "filesum", "askfile", "web", "read")
+QUESTION = "quali errori di certificato e proxy compaiono e come si risolvono?"
+
+# =====================
+# CORPUS
+# =====================
+def make_log(path: str, size: int, rng: random.Random) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        n = 0
+        while n < size:
+            line = (f"2024-05-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00 "
+                    f"{rng.choice(['INFO', 'WARN', 'ERROR'])} " + " ".join(rng.choices(WORDS, k=12)) + "\n")
+            f.write(line)
+            n += len(line)
+
+def make_pdf(path: str, pages: int, rng: random.Random) -> None:
+    # PDF minimale scritto a mano (testo Helvetica, 30 righe per pagina): nessuna dipendenza
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(pages))
+    objs.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    font_id = 3 + 2 * pages
+    for i in range(pages):
+        objs.append((f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+                     f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>").encode())
+        lines = [f"Pagina {i + 1}: " + " ".join(rng.choices(WORDS, k=10)) for _ in range(30)]
+        ops = "BT /F1 10 Tf 50 750 Td 14 TL " + " ".join(f"({t}) Tj T*" for t in lines) + " ET"
+        stream = ops.encode("latin-1")
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objs.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for n, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % n + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1) + b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+def make_docx(path: str, paras: int, rng: random.Random) -> None:
+    from docx import Document
+    doc = Document()
+    for i in range(paras):
+        if i % 20 == 0:
+            doc.add_heading(f"Sezione {i // 20 + 1}", level=2)
+        doc.add_paragraph(" ".join(rng.choices(WORDS, k=40)))
+    doc.save(path)
+
+def build_corpus(directory: str, sizes: List[str]) -> Dict[Tuple[str, str], str]:
+    corpus = {}
+    for size in sizes:
+        log_bytes, pdf_pages, docx_paras, _kb = SIZES[size]
+        rng = random.Random(f"corpus-{size}")
+        for kind, ext, make, arg in (("log", "log", make_log, log_bytes), ("pdf", "pdf", make_pdf, pdf_pages),
+                                     ("docx", "docx", make_docx, docx_paras)):
+            path = os.path.join(directory, f"{kind}-{size}.{ext}")
+            make(path, arg, rng)
+            corpus[(kind, size)] = path
+    return corpus
+
+# =====================
+# MISURE
+# =====================
+def summarize_runs(lat: List[float], ttft: List[float], errors: int, wall_s: float) -> Dict[str, Any]:
+    lat = sorted(lat)
+    out: Dict[str, Any] = {"n": len(lat), "errors": errors}
+    if lat:
+        out.update(mean_ms=round(statistics.mean(lat) * 1000, 1), p50_ms=round(statistics.median(lat) * 1000, 1),
+                   p95_ms=round(lat[max(0, -(-len(lat) * 95 // 100) - 1)] * 1000, 1), max_ms=round(lat[-1] * 1000, 1),
+                   ops_per_s=round(len(lat) / wall_s, 2) if wall_s > 0 else 0.0)
+    if ttft:
+        out["ttft_p50_ms"] = round(statistics.median(ttft) * 1000, 1)
+    return out
+
+def is_error(answer: str) -> bool:
+    return answer.startswith(("[Errore", "Errore", "Error ", "[Nessuna risposta]"))
+
+class Bench:
+    def __init__(self, bot: Any, reps: int):
+        self.bot = bot
+        self.reps = reps
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def cold(self) -> None:
+        b = self.bot
+        b.response_cache.clear()
+        b.file_cache.clear()
+        b.web.cache.clear()
+        b.search.clear()
+
+    def session(self, name: str) -> Any:
+        return self.bot.new_session(name, None)
+
+    def turn(self, s: Any, msg: str) -> Tuple[float, Optional[float], bool]:
+        b = self.bot
+        with b.sessions.use(s):
+            t0 = time.perf_counter()
+            answer = b.respond(msg, "it")
+            dt = time.perf_counter() - t0
+        return dt, s.last_stats.get("ttft_s"), is_error(answer)
+
+    def measure(self, name: str, op: Callable[[int], Tuple[float, Optional[float], bool]]) -> None:
+        lat, ttft, errors = [], [], 0
+        t0 = time.perf_counter()
+        for i in range(self.reps):
+            dt, first, err = op(i)
+            lat.append(dt)
+            if first is not None:
+                ttft.append(first)
+            errors += err
+        self.results[name] = summarize_runs(lat, ttft, errors, time.perf_counter() - t0)
+        print(f"  {name:<24} p50 {self.results[name].get('p50_ms', 0):>9.1f} ms  errori {errors}", file=sys.stderr)
+
+    # ---- scenari ----
+    def chat(self, users: int) -> None:
+        s = self.session("chat")
+        self.measure("chat", lambda i: self.turn(s, f"Outlook non si apre dopo l'aggiornamento, tentativo {i}"))
+        # più utenti insieme: throughput complessivo con lo scheduler davanti al modello
+        lat: List[float] = []
+        ttft: List[float] = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def user(u: int) -> None:
+            su = self.session(f"user-{u}")
+            for i in range(self.reps):
+                dt, first, err = self.turn(su, f"utente {u}: la VPN cade ogni {i + 5} minuti")
+                with lock:
+                    lat.append(dt)
+                    if first is not None:
+                        ttft.append(first)
+                    errors[0] += err
+
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=user, args=(u,)) for u in range(users)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.results[f"chat:{users}users"] = summarize_runs(lat, ttft, errors[0], time.perf_counter() - t0)
+        print(f"  {'chat:' + str(users) + 'users':<24} {self.results[f'chat:{users}users'].get('ops_per_s', 0):>9.2f} op/s",
+              file=sys.stderr)
+
+    def files(self, corpus: Dict[Tuple[str, str], str], which: List[str]) -> None:
+        for (kind, size), path in corpus.items():
+            def load(i: int) -> Tuple[float, Optional[float], bool]:
+                self.cold()
+                return self.turn(self.session(f"file-{i}"), f"/file {path}")
+
+            def with_file(cmd: str) -> Callable[[int], Tuple[float, Optional[float], bool]]:
+                def op(i: int) -> Tuple[float, Optional[float], bool]:
+                    s = self.session(f"{cmd}-{i}")
+                    self.turn(s, f"/file {path}")
+                    self.bot.response_cache.clear()
+                    return self.turn(s, cmd)
+                return op
+
+            if "file" in which:
+                self.measure(f"file:{kind}:{size}", load)
+            if "filesum" in which:
+                self.measure(f"filesum:{kind}:{size}", with_file("/filesum"))
+            if "askfile" in which:
+                self.measure(f"askfile:{kind}:{size}", with_file(f"/askfile {QUESTION}"))
+
+    def web(self, pages_url: str, sizes: List[str], which: List[str]) -> None:
+        if "web" in which:
+            for deep in ("", "--deep "):
+                def search(i: int, deep: str = deep) -> Tuple[float, Optional[float], bool]:
+                    self.cold()
+                    return self.turn(self.session(f"web-{i}"), f"/web {deep}configurare proxy outlook {i}")
+                self.measure("web:deep" if deep else "web", search)
+        if "read" in which:
+            for size in sizes:
+                kb = SIZES[size][3]
+
+                def read(i: int, kb: int = kb) -> Tuple[float, Optional[float], bool]:
+                    self.cold()
+                    return self.turn(self.session(f"read-{i}"), f"/read {pages_url}/kb{kb}/manuale-{i}")
+                self.measure(f"read:{size}", read)
+
+# =====================
+# CONFRONTO
+# =====================
+def compare(results: Dict[str, Any], baseline_path: str, threshold: float) -> List[str]:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        base = json.load(f).get("results", {})
+    regressions = []
+    print(f"\n{'scenario':<26}{'prima':>10}{'ora':>10}{'delta':>9}", file=sys.stderr)
+    for name, cur in results.items():
+        old = base.get(name)
+        if not old or not old.get("p50_ms") or "p50_ms" not in cur:
+            continue
+        delta = cur["p50_ms"] / old["p50_ms"] - 1
+        flag = "  ⚠️" if delta > threshold else ""
+        print(f"{name:<26}{old['p50_ms']:>10.1f}{cur['p50_ms']:>10.1f}{delta:>+9.0%}{flag}", file=sys.stderr)
+        if delta > threshold:
+            regressions.append(name)
+    return regressions
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# =====================
+# MAIN
+# =====================
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="small,medium")
+    ap.add_argument("--reps", type=int, default=3)
+    ap.add_argument("--users", type=int, default=4)
+    ap.add_argument("--only", default=",".join(SCENARIOS))
+    ap.add_argument("--ttft", type=float, default=0.05)
+    ap.add_argument("--tps", type=float, default=200.0)
+    ap.add_argument("--prompt-tps", type=float, default=0.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--reply-tokens", type=int, default=64)
+    ap.add_argument("--pages", default="")
+    ap.add_argument("--page-latency", type=float, default=0.02)
+    ap.add_argument("--out", default="")
+    ap.add_argument("--baseline", default="")
+    ap.add_argument("--threshold", type=float, default=0.15)
+    args = ap.parse_args()
+    sizes = [s for s in args.sizes.split(",") if s]
+    which = [s for s in args.only.split(",") if s]
+    unknown = [s for s in sizes if s not in SIZES] + [s for s in which if s not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Valori sconosciuti: {', '.join(unknown)}")
+
+    tmp = tempfile.mkdtemp(prefix="botia-bench-")
+    ollama = FakeOllama(ttft_s=args.ttft, tokens_per_s=args.tps, prompt_tokens_per_s=args.prompt_tps,
+                        fail_rate=args.fail_rate, reply_tokens=args.reply_tokens).start()
+    pages = PageServer(pages_dir=args.pages, latency_s=args.page_latency).start()
+    # i bot leggono la configurazione all'import: ambiente isolato prima di importarli
+    os.environ.update({
+        "OLLAMA_HOST": ollama.url, "BOTIA_BACKEND": "http", "BOTIA_OLLAMA_BACKENDS": "",
+        "BOTIA_SEARCH_PROVIDER": "fake",
+        "BOTIA_CACHE_DIR": os.path.join(tmp, "cache"), "BOTIA_DOCS_DIR": os.path.join(tmp, "docs"),
+        "BOTIA_FILE_CACHE_DIR": os.path.join(tmp, "files"), "BOTIA_PAGE_CACHE_DIR": os.path.join(tmp, "pages"),
+    })
+    try:
+        import bot_web as bot
+        from lazy_import import warm_up
+        from search_cache import FakeSearchProvider
+        bot.search.provider = FakeSearchProvider(pages.url)
+        # come il warm-up della console: si misurano i comandi, non il primo import di
+        # pypdf/numpy/requests (l'avvio ha il suo benchmark, bench_startup.py)
+        warm_up().join()
+
+        t0 = time.perf_counter()
+        corpus = build_corpus(tmp, sizes) if {"file", "filesum", "askfile"} & set(which) else {}
+        print(f"Corpus: {len(corpus)} file in {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        bench = Bench(bot, args.reps)
+        if "chat" in which:
+            bench.chat(args.users)
+        bench.files(corpus, which)
+        bench.web(pages.url, sizes, which)
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": vars(args),
+                "corpus_bytes": {os.path.basename(p): os.path.getsize(p) for p in corpus.values()},
+                "fake_ollama": ollama.counters,
+                "page_server": pages.counters,
+            },
+            "results": bench.results,
+        }
+        out = args.out or os.path.join(BENCH_DIR, "results", f"bench-{report['meta']['commit']}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Risultati: {out}", file=sys.stderr)
+        regressions = compare(bench.results, args.baseline, args.threshold) if args.baseline else []
+    finally:
+        ollama.stop()
+        pages.stop()
+        shutil.rmtree(tmp, ignore_errors=True)
+    if regressions:
+        print(f"\nRegressioni oltre {args.threshold:.0%}: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Server Ollama finto e deterministico per benchmark e prove (stessa API HTTP del vero).
+
+Uso:
+    py benchmarks/fake_ollama.py [--port 11434] [--ttft 0.2] [--tps 40] [--prompt-tps 2000]
+                                 [--fail-rate 0.0] [--fail-status 500] [--fail-after 0] [--reply-tokens 64]
+
+Risponde a /api/version, /api/tags, /api/ps, /api/generate, /api/chat (con e senza
+streaming), /api/embed e /api/embeddings. Le risposte dipendono solo dal prompt; i tempi
+seguono TTFT, token/s di generazione e di valutazione del prompt configurati; gli errori
+sono estratti con un seme fisso. Con --fail-after N gli stream si interrompono con un
+errore dopo N token (nodo che cade a metà risposta). Più istanze su porte diverse simulano un pool di nodi.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+VOCAB = ("il la di che per con una sono verifica riavvia servizio profilo utente rete proxy certificato "
+         "driver aggiornamento criterio registro evento errore porta dominio server backup licenza").split()
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def reply_for(prompt: str, n_tokens: int) -> List[str]:
+    # stessa domanda -> stessa risposta, su qualsiasi processo (crc32, non hash())
+    rng = random.Random(zlib.crc32(prompt.encode("utf-8")))
+    return [w + " " for w in rng.choices(VOCAB, k=n_tokens)]
+
+def embed_text(text: str, dim: int) -> List[float]:
+    # bag of words con hashing: testi con parole in comune hanno vettori vicini
+    vec = [0.0] * dim
+    for w in WORD_RE.findall(text.lower()):
+        vec[zlib.crc32(w.encode("utf-8")) % dim] += 1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+class FakeOllama(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, ttft_s: float = 0.05, tokens_per_s: float = 200.0,
+                 prompt_tokens_per_s: float = 0.0, fail_rate: float = 0.0, fail_status: int = 500,
+                 reply_tokens: int = 64, models: Optional[List[str]] = None, embed_dim: int = 64,
+                 load_s: float = 0.0, seed: int = 42, host: str = "127.0.0.1", fail_after_tokens: int = 0,
+                 legacy_embed: bool = False):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.ttft_s = ttft_s
+        self.tokens_per_s = tokens_per_s
+        self.prompt_tokens_per_s = prompt_tokens_per_s   # 0 = valutazione del prompt gratuita
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.fail_after_tokens = fail_after_tokens       # 0 = stream sempre completi
+        self.legacy_embed = legacy_embed                 # server vecchio: solo /api/embeddings
+        self.reply_tokens = reply_tokens
+        self.models = models or ["llama3.2:latest", "nomic-embed-text:latest"]
+        self.embed_dim = embed_dim
+        self.load_s = load_s                             # primo uso di un modello: caricamento simulato
+        self.loaded: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {"requests": 0, "failures": 0, "tokens": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self) -> "FakeOllama":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # client che chiude in anticipo (stop anticipato, timeout): non è un errore del server
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.counters["requests"] += 1
+            fail = self.fail_rate > 0 and self._rng.random() < self.fail_rate
+            if fail:
+                self.counters["failures"] += 1
+            return fail
+
+    def load(self, model: str) -> float:
+        # secondi di caricamento da pagare (solo la prima volta)
+        with self._lock:
+            if model in self.loaded:
+                return 0.0
+            self.loaded[model] = time.time()
+            return self.load_s
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeOllama
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def _send(self, obj: Any, status: int = 200) -> None:
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _chunk(self, obj: Dict[str, Any]) -> None:
+        line = (json.dumps(obj) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def do_GET(self) -> None:
+        if self.path == "/api/version":
+            return self._send({"version": "0.0.0-fake"})
+        if self.path == "/api/tags":
+            return self._send({"models": [{"name": m, "model": m} for m in self.server.models]})
+        if self.path == "/api/ps":
+            return self._send({"models": [{"name": m, "model": m} for m in self.server.loaded]})
+        self._send({"error": "not found"}, 404)
+
+    def do_POST(self) -> None:
+        n = int(self.headers.get("Content-Length") or 0)
+        try:
+            req = json.loads(self.rfile.read(n) or b"{}")
+        except ValueError:
+            return self._send({"error": "invalid json"}, 400)
+        srv = self.server
+        if self.path == "/api/embed" and srv.legacy_embed:
+            return self._send({"error": "404 page not found"}, 404)
+        model = req.get("model") or ""
+        if ":" not in model:
+            model += ":latest"
+        if model not in srv.models:
+            return self._send({"error": f"model '{req.get('model')}' not found"}, 404)
+        if srv.should_fail():
+            return self._send({"error": "fake failure"}, srv.fail_status)
+        if self.path == "/api/generate" and req.get("keep_alive") in (0, "0", "0s"):
+            with srv._lock:
+                srv.loaded.pop(model, None)
+            return self._send({"model": req.get("model"), "done": True, "done_reason": "unload"})
+        load_s = srv.load(model)
+        if self.path == "/api/generate" and "prompt" not in req:
+            # solo caricamento (preload / keep-alive del client)
+            time.sleep(load_s)
+            return self._send({"model": req.get("model"), "done": True, "done_reason": "load",
+                               "load_duration": int(load_s * 1e9)})
+        if self.path in ("/api/embed", "/api/embeddings"):
+            texts = req.get("input") if self.path == "/api/embed" else req.get("prompt")
+            texts = [texts] if isinstance(texts, str) else texts or []
+            time.sleep(load_s)
+            vecs = [embed_text(t, srv.embed_dim) for t in texts]
+            return self._send({"embeddings": vecs} if self.path == "/api/embed" else {"embedding": vecs[0]})
+        if self.path == "/api/generate":
+            prompt = req.get("prompt") or ""
+        elif self.path == "/api/chat":
+            prompt = "\n".join(m.get("content") or "" for m in req.get("messages") or [])
+        else:
+            return self._send({"error": "not found"}, 404)
+        self._generate(req, prompt, load_s)
+
+    def _generate(self, req: Dict[str, Any], prompt: str, load_s: float) -> None:
+        srv = self.server
+        chat = self.path == "/api/chat"
+        toks = reply_for(prompt, srv.reply_tokens)
+        prompt_tokens = max(1, len(prompt) // 4)
+        eval_prompt_s = prompt_tokens / srv.prompt_tokens_per_s if srv.prompt_tokens_per_s else 0.0
+        step = 1.0 / srv.tokens_per_s if srv.tokens_per_s else 0.0
+        with srv._lock:
+            srv.counters["tokens"] += len(toks)
+        done = {"done": True, "model": req.get("model"), "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(eval_prompt_s * 1e9), "eval_count": len(toks),
+                "eval_duration": int(max(step * len(toks), 1e-6) * 1e9), "load_duration": int(load_s * 1e9)}
+        time.sleep(load_s + srv.ttft_s + eval_prompt_s)
+        if not req.get("stream", True):
+            time.sleep(step * len(toks))
+            text = "".join(toks).strip()
+            done.update({"message": {"role": "assistant", "content": text}} if chat else {"response": text})
+            return self._send(done)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        t0 = time.perf_counter()
+        for i, tok in enumerate(toks):
+            # ritmo costante senza accumulare l'errore dei singoli sleep
+            delay = t0 + i * step - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if srv.fail_after_tokens and i == srv.fail_after_tokens:
+                # come Ollama quando il runner muore: riga di errore dentro lo stream
+                with srv._lock:
+                    srv.counters["failures"] += 1
+                self._chunk({"error": "fake failure mid-stream"})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+                return
+            self._chunk({"message": {"role": "assistant", "content": tok}, "done": False} if chat
+                        else {"response": tok, "done": False})
+        done.update({"message": {"role": "assistant", "content": ""}} if chat else {"response": "", "context": [1, 2, 3]})
+        self._chunk(done)
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Ollama finto per benchmark")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11434)
+    ap.add_argument("--ttft", type=float, default=0.2, help="secondi prima del primo token")
+    ap.add_argument("--tps", type=float, default=40.0, help="token/s in generazione")
+    ap.add_argument("--prompt-tps", type=float, default=0.0, help="token/s di valutazione del prompt (0 = istantanea)")
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--fail-status", type=int, default=500)
+    ap.add_argument("--fail-after", type=int, default=0, help="interrompe gli stream con un errore dopo N token")
+    ap.add_argument("--reply-tokens", type=int, default=64)
+    ap.add_argument("--load", type=float, default=0.0, help="secondi di caricamento al primo uso di un modello")
+    ap.add_argument("--models", default="llama3.2,nomic-embed-text")
+    args = ap.parse_args()
+    models = [m if ":" in m else m + ":latest" for m in args.models.split(",") if m]
+    srv = FakeOllama(args.port, args.ttft, args.tps, args.prompt_tps, args.fail_rate, args.fail_status,
+                     args.reply_tokens, models, load_s=args.load, host=args.host, fail_after_tokens=args.fail_after)
+    print(f"Ollama finto su {srv.url} (ttft={args.ttft}s, {args.tps} tok/s, errori={args.fail_rate:.0%})")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
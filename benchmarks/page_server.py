@@ -0,0 +1,137 @@
+"""Server HTTP locale di pagine per benchmark di /web e /read (niente Internet).
+
+Uso:
+    py benchmarks/page_server.py [--port 8000] [--pages cartella_con_html] [--size-kb 200] [--latency 0.05]
+                                 [--drip 0.1]
+
+Con --pages serve le pagine salvate (*.html, *.htm) scelte in modo stabile in base al
+percorso richiesto; altrimenti genera pagine sintetiche deterministiche (come
+bench_html.py). Un percorso /kb<N>/... forza una pagina di N KB. Risponde con ETag
+e 304, così anche le richieste condizionali della cache pagine vengono misurate. Con
+--drip il corpo arriva a pezzi da 16 KB con una pausa tra l'uno e l'altro (server lento).
+"""
+import argparse
+import glob
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_html import make_page  # noqa: E402
+
+SIZE_RE = re.compile(r"^/kb(\d+)(/|$)")
+DRIP_CHUNK = 16 * 1024
+
+class PageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, pages_dir: str = "", size_kb: int = 200, latency_s: float = 0.0,
+                 host: str = "127.0.0.1", drip_s: float = 0.0):
+        super().__init__((host, port), PageHandler)
+        self.size_kb = size_kb
+        self.latency_s = latency_s
+        self.drip_s = drip_s          # pausa tra un pezzo e l'altro del corpo (0 = tutto insieme)
+        self.saved: List[bytes] = []
+        for p in sorted(glob.glob(os.path.join(pages_dir, "*.htm*"))) if pages_dir else []:
+            with open(p, "rb") as f:
+                self.saved.append(f.read())
+        self.counters = {"requests": 0, "not_modified": 0, "bytes": 0}
+        self._pages: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self) -> "PageServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # client che chiude in anticipo (stop anticipato, timeout): non è un errore del server
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def page(self, path: str) -> bytes:
+        seed = zlib.crc32(path.encode("utf-8"))
+        if self.saved:
+            return self.saved[seed % len(self.saved)]
+        with self._lock:
+            body = self._pages.get(path)
+        if body is None:
+            m = SIZE_RE.match(path)
+            body = make_page(random.Random(seed), int(m.group(1)) if m else self.size_kb).encode("utf-8")
+            with self._lock:
+                self._pages[path] = body
+        return body
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: PageServer
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        srv = self.server
+        if srv.latency_s:
+            time.sleep(srv.latency_s)
+        body = srv.page(self.path.split("?", 1)[0])
+        etag = f'"{zlib.crc32(body):08x}"'
+        with srv._lock:
+            srv.counters["requests"] += 1
+        if self.headers.get("If-None-Match") == etag:
+            with srv._lock:
+                srv.counters["not_modified"] += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        try:
+            if srv.drip_s:
+                for i in range(0, len(body), DRIP_CHUNK):
+                    self.wfile.write(body[i:i + DRIP_CHUNK])
+                    self.wfile.flush()
+                    time.sleep(srv.drip_s)
+            else:
+                self.wfile.write(body)
+            with srv._lock:
+                srv.counters["bytes"] += len(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass   # il client ha chiuso dopo aver letto abbastanza (stop anticipato)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="Pagine locali per benchmark")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--pages", default="")
+    ap.add_argument("--size-kb", type=int, default=200)
+    ap.add_argument("--latency", type=float, default=0.0)
+    ap.add_argument("--drip", type=float, default=0.0, help="secondi tra un pezzo da 16 KB e l'altro")
+    args = ap.parse_args(argv)
+    srv = PageServer(args.port, args.pages, args.size_kb, args.latency, args.host, args.drip)
+    print(f"Pagine su {srv.url} ({len(srv.saved) or 'sintetiche'})")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import contextvars
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# =====================
+# SESSIONE
+# =====================
+class BotSession:
+    # Stato di una conversazione (prima erano globali dei bot: un solo utente per processo).
+    # Le risorse condivise (client Ollama, cache, client web) restano a livello di modulo.
+    def __init__(self, session_id: str, model: str, mode: str, lang: str, chat: Any, docs: Any,
+                 webmode: bool = False, webdeep: bool = False):
+        self.id = session_id
+        self.model = model
+        self.mode = mode
+        self.lang = lang
+        self.chat = chat          # ChatSession
+        self.docs = docs          # DocumentStore
+        self.webmode = webmode
+        self.webdeep = webdeep
+        self.last_answer: Optional[str] = None
+        self.last_file_text: Optional[str] = None
+        self.last_file_path: Optional[str] = None
+        self.last_file_type: Optional[str] = None
+        self.last_web_sources: List[Tuple[str, str, str]] = []
+        self.stream_sink: Optional[Callable[[str], None]] = None
+        self.last_stats: Dict[str, Any] = {}
+        self.created = time.time()
+        self.last_used = self.created
+
+    def touch(self) -> None:
+        self.last_used = time.time()
+
+    def approx_bytes(self) -> int:
+        # stima grossolana per il tetto di memoria del server: testi + blocchi + vettori
+        n = sys.getsizeof(self.last_file_text or "") + sys.getsizeof(self.last_answer or "")
+        n += sum(len(m.get("content", "")) for m in self.chat.messages)
+        n += sum(len(body) for _doc, _label, body in self.docs.chunks)
+        vectors = getattr(self.docs, "vectors", None)
+        if vectors is not None:
+            n += int(getattr(vectors, "nbytes", 0))
+        return n
+
+class SessionContext:
+    # sessione corrente per il thread/task in corso; senza use() vale quella di default,
+    # creata dalla factory al primo uso: importare il bot (server, batch, worker dei PDF)
+    # non carica il corpus su disco della CLI
+    def __init__(self, factory: Callable[[], BotSession]):
+        self.factory = factory
+        self._default: Optional[BotSession] = None
+        self._lock = threading.Lock()
+        self._var: contextvars.ContextVar = contextvars.ContextVar("botia_session", default=None)
+
+    @property
+    def default(self) -> BotSession:
+        with self._lock:
+            if self._default is None:
+                self._default = self.factory()
+            return self._default
+
+    def set_default(self, factory: Callable[[], BotSession]) -> None:
+        # il server sostituisce la sessione CLI con una propria, senza stato su disco
+        with self._lock:
+            self.factory = factory
+            self._default = None
+
+    def get(self) -> BotSession:
+        s = self._var.get()
+        return s if s is not None else self.default
+
+    @contextmanager
+    def use(self, session: BotSession) -> Iterator[BotSession]:
+        token = self._var.set(session)
+        try:
+            yield session
+        finally:
+            self._var.reset(token)
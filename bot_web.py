@@ -1,32 +1,120 @@
-import subprocess
+import argparse
 import datetime
 import os
-import requests
-from bs4 import BeautifulSoup
-from duckduckgo_search import DDGS
-from typing import List, Optional, Tuple
-
-from pypdf import PdfReader
-from docx import Document
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from backend_pool import BackendPool, parse_backends
+from bot_session import BotSession, SessionContext
+from chat_session import ChatSession
+from doc_store import DocumentStore, OllamaEmbedder, format_doc_chunks
+from file_cache import DEFAULT_CACHE_DIR as DEFAULT_FILE_CACHE_DIR, ParsedFileCache
+from lazy_import import LazyModule, warm_up
+from log_reader import SAMPLE_BYTES, detect_encoding, parse_file_args, read_log
+from metrics import Metrics, format_stats
+from model_keeper import ModelKeeper
+from pdf_ingest import iter_pdf_pages
+from ollama_client import OllamaClient, OllamaError, OllamaUnavailable, TokenPrinter, collect, run_ollama_cli, stream_generate
+from response_cache import DEFAULT_CACHE_DIR, ResponseCache, make_key
+from search_cache import DDGSProvider, FakeSearchProvider, SearchCache
+from retrieval import Chunk, chunk_document, chunk_paragraphs, chunk_pdf_page, select_passages
+from scheduler import FairScheduler, ScheduledClient
+from summarize import console_progress, map_prompt, map_summaries, reduce_partials, split_for_summary
+from tracing import Tracer, add_span, carry_trace
+from web_client import DEFAULT_CACHE_DIR as DEFAULT_PAGE_CACHE_DIR, WebClient
+from web_fetch import fetch_many
 
 # =====================
 # CONFIG
 # =====================
 MODEL = "llama3.2"
-MAX_TURNS = 10
+MEMORY_TOKEN_BUDGET = 3000     # token di storia verbatim nel prompt
+MEMORY_MAX_MESSAGES = 200
 DEFAULT_MODE = "helpdesk"
 DEFAULT_LANG = "auto"
 TEMPERATURE_HINT = 0.2
 
+OLLAMA_BACKEND = os.environ.get("BOTIA_BACKEND", "http")   # http | cli
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+OLLAMA_CONNECT_TIMEOUT = 5
+OLLAMA_READ_TIMEOUT = 300
+OLLAMA_KEEP_ALIVE = "10m"
+# più server Ollama: "http://box1:11434=llama3.2,qwen2.5; http://box2:11434" (vuoto = solo OLLAMA_HOST)
+OLLAMA_BACKENDS = os.environ.get("BOTIA_OLLAMA_BACKENDS", "")
+STREAM_OUTPUT = True
+
+# scheduler davanti al modello: più utenti/batch sullo stesso Ollama senza sovraccaricarlo
+LLM_MAX_CONCURRENT = int(os.environ.get("BOTIA_LLM_CONCURRENCY", "2"))   # chiamate contemporanee per nodo
+LLM_MAX_QUEUE = 64                # richieste in attesa oltre cui si rifiuta subito
+LLM_MAX_QUEUE_PER_SESSION = 8
+LLM_MAX_WAIT_S = 120
+LLM_AGING_S = 30                  # ogni 30 s di attesa una richiesta sale di una classe
+
+# moduli pesanti (pypdf, python-docx, numpy, requests, duckduckgo_search) importati al primo uso;
+# con il warm-up vengono caricati in background appena compare il prompt
+WARMUP_IMPORTS = os.environ.get("BOTIA_WARMUP", "1") != "0"
+
+# modello caricato in background all'avvio e dopo /model, tenuto caldo finché la sessione
+# è attiva (ping ogni MODEL_KEEPALIVE_S, sotto OLLAMA_KEEP_ALIVE) e scaricato all'uscita
+MODEL_PRELOAD = os.environ.get("BOTIA_PRELOAD", "1") != "0"
+MODEL_KEEPALIVE_S = 240
+MODEL_RELEASE_ON_EXIT = os.environ.get("BOTIA_RELEASE_ON_EXIT", "1") != "0"
+
+# tracce per richiesta in formato Chrome (chrome://tracing, ui.perfetto.dev); vuoto = spento
+TRACE_DIR = os.environ.get("BOTIA_TRACE_DIR", "")
+TRACE_MIN_MS = float(os.environ.get("BOTIA_TRACE_MIN_MS", "0"))   # salva solo le richieste più lente di così
+PROFILE_TOP = 0                   # --profile N: cProfile + tracemalloc per le N richieste più lente
+
+CACHE_ENABLED = True
+CACHE_DIR = os.environ.get("BOTIA_CACHE_DIR", DEFAULT_CACHE_DIR)
+CACHE_MEM_ENTRIES = 256
+CACHE_DISK_MAX_BYTES = 50_000_000
+FILE_CACHE_DIR = os.environ.get("BOTIA_FILE_CACHE_DIR", DEFAULT_FILE_CACHE_DIR)
+FILE_CACHE_MAX_BYTES = 500_000_000
+FILE_CACHE_HASH = False
+WEB_PAGE_CACHE_DIR = os.environ.get("BOTIA_PAGE_CACHE_DIR", DEFAULT_PAGE_CACHE_DIR)
+WEB_PAGE_FRESH_S = 3600           # entro questo tempo /read non tocca la rete; poi GET condizionale
+WEB_PAGE_CACHE_MAX_BYTES = 100_000_000
+WEB_SEARCH_PROVIDER = os.environ.get("BOTIA_SEARCH_PROVIDER", "ddgs")   # "ddgs" | "fake" (prove locali)
+WEB_SEARCH_TTL_S = 1800           # stessi risultati per la stessa query normalizzata
+WEB_SEARCH_STALE_S = 6 * 3600     # oltre il TTL: risposta immediata col vecchio risultato + aggiornamento in background (0 = off)
+WEB_SEARCH_CACHE_ENTRIES = 256
+# TTL (secondi) per comando; i comandi assenti non usano la cache (es. la chat)
+CACHE_POLICY = {
+    "/filesum": 7 * 24 * 3600,
+    "/filesum:map": 30 * 24 * 3600,   # riassunti parziali dei blocchi (map-reduce)
+    "/askfile": 24 * 3600,
+    "/translate": 30 * 24 * 3600,
+    "/web": 3600,
+    "/read": 3600,
+}
+
 WEB_TOP_K = 5
 WEB_TIMEOUT = 12
 WEB_MAX_CHARS = 6000
+WEB_EXTRACT_CHARS = 30000         # contenuto estratto per pagina, prima di scegliere i passaggi per la domanda
+WEB_MAX_DOWNLOAD_BYTES = 3_000_000   # tetto di byte scaricati per pagina
 WEBMODE_DEFAULT = False
+WEB_DEEP_DEFAULT = False          # /web legge anche le pagine dei risultati (come /web --deep)
+WEB_DEEP_DEADLINE_S = 10          # scadenza globale per leggere tutte le pagine
+WEB_DEEP_PER_HOST = 2             # connessioni contemporanee per host
+WEB_DEEP_MAX_CHARS = 2500         # testo per pagina nel prompt
 
 FILE_MAX_CHARS = 12000
 FILE_READ_MAX_BYTES = 5_000_000
-PDF_MAX_PAGES = 25
+LOG_DEFAULT_TAIL = 500
+PDF_TIME_BUDGET_S = 120
+PDF_MAX_TEXT_BYTES = 20_000_000
+PDF_WORKERS = None
 DOCX_MAX_PARAS = 1500
+RETRIEVAL_TOP_K = 5               # blocchi del file inviati per /askfile
+EMBED_MODEL = "nomic-embed-text"  # modello Ollama per gli embedding (ollama pull nomic-embed-text)
+EMBED_BATCH = 32
+DOCS_DIR = os.environ.get("BOTIA_DOCS_DIR", os.path.join(os.path.expanduser("~"), ".botia_cache", "corpora"))
+DOCS_CORPUS = "default"
+SUMMARY_CHUNK_TOKENS = 2500       # dimensione di ogni parte nel riassunto map-reduce
+SUMMARY_PARALLELISM = 2           # richieste concorrenti al backend durante /filesum
 
 # =====================
 # SYSTEM PROMPTS (PRO)
@@ -113,17 +201,46 @@ Evita frases innecesarias tipo "no puedo ejecutar": ve directo al grano."""
 # =====================
 # STATE
 # =====================
-mode = DEFAULT_MODE
-lang = DEFAULT_LANG
-history: List[str] = []
-last_answer: Optional[str] = None
-
-webmode = WEBMODE_DEFAULT
-last_web_sources: List[Tuple[str, str, str]] = []
-
-last_file_text: Optional[str] = None
-last_file_path: Optional[str] = None
-last_file_type: Optional[str] = None
+# pool con bilanciamento, health check e failover se ci sono più nodi (vedi backend_pool.py)
+backends = parse_backends(OLLAMA_BACKENDS)
+backend = (BackendPool(backends, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_KEEP_ALIVE) if backends
+           else OllamaClient(OLLAMA_HOST, OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT, OLLAMA_KEEP_ALIVE))
+# priorità: chat > /askfile > batch e /filesum, round robin tra sessioni (vedi scheduler.py)
+llm = FairScheduler(LLM_MAX_CONCURRENT * max(1, len(backends)), LLM_MAX_QUEUE, LLM_MAX_QUEUE_PER_SESSION,
+                    LLM_MAX_WAIT_S, LLM_AGING_S)
+ollama = ScheduledClient(backend, llm)
+# istogrammi per fase, contatori e cache hit per comando: /stats, /metrics del server e batch
+metrics = Metrics()
+tracer = Tracer(TRACE_DIR, TRACE_MIN_MS, PROFILE_TOP)
+# preload, keep-alive e rilascio dei modelli in uso (vedi model_keeper.py); con la CLI di Ollama niente
+models = ModelKeeper(backend, MODEL_KEEPALIVE_S if MODEL_PRELOAD and OLLAMA_BACKEND == "http" else 0)
+docx = LazyModule("docx")         # python-docx: solo per /docx
+response_cache = ResponseCache(CACHE_DIR, CACHE_MEM_ENTRIES, CACHE_DISK_MAX_BYTES)
+file_cache = ParsedFileCache(FILE_CACHE_DIR if CACHE_ENABLED else None, FILE_CACHE_MAX_BYTES, FILE_CACHE_HASH)
+web = WebClient(WEB_PAGE_CACHE_DIR if CACHE_ENABLED else None, WEB_PAGE_FRESH_S, WEB_PAGE_CACHE_MAX_BYTES,
+                max_download=WEB_MAX_DOWNLOAD_BYTES)
+search = SearchCache(FakeSearchProvider() if WEB_SEARCH_PROVIDER == "fake" else DDGSProvider(),
+                     WEB_SEARCH_TTL_S if CACHE_ENABLED else 0, WEB_SEARCH_STALE_S if CACHE_ENABLED else 0,
+                     WEB_SEARCH_CACHE_ENTRIES)
+# data fissata all'avvio: il system prompt resta identico per tutta la sessione
+SESSION_DATE = datetime.date.today().isoformat()
+
+def new_session(session_id: str = "cli", docs_dir: Optional[str] = DOCS_DIR) -> BotSession:
+    # stato per utente: memoria chat + corpus multi-documento per /askfile (BM25 + embedding);
+    # docs_dir=None -> corpus solo in memoria (server, batch)
+    docs = DocumentStore(DOCS_CORPUS if docs_dir else f"session-{session_id}", docs_dir,
+                         OllamaEmbedder(ollama, EMBED_MODEL, EMBED_BATCH))
+    if docs_dir:
+        docs.load()
+    return BotSession(session_id, MODEL, DEFAULT_MODE, DEFAULT_LANG,
+                      ChatSession(ollama, MEMORY_TOKEN_BUDGET, MEMORY_MAX_MESSAGES), docs,
+                      WEBMODE_DEFAULT, WEB_DEEP_DEFAULT)
+
+# sessione della CLI, creata al primo uso; server e batch creano la propria e la attivano con sessions.use()
+sessions = SessionContext(new_session)
+
+def current_session() -> BotSession:
+    return sessions.get()
 
 # =====================
 # LANG DETECT
@@ -144,25 +261,91 @@ def get_system_prompt(effective_lang: str, current_mode: str) -> str:
 # =====================
 # OLLAMA
 # =====================
-def run_ollama(prompt: str) -> str:
-    r = subprocess.run(
-        ["ollama", "run", MODEL],
-        input=prompt.encode("utf-8"),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        check=False,
+def stream_ollama(prompt: str) -> Iterator[str]:
+    s = current_session()
+    return stream_generate(ollama, s.model, prompt, s.last_stats, OLLAMA_BACKEND == "http")
+
+def run_ollama(prompt: str, cache_tag: Optional[str] = None) -> str:
+    s = current_session()
+    ttl = CACHE_POLICY.get(cache_tag) if CACHE_ENABLED and cache_tag else None
+    key = make_key(s.model, None, prompt) if ttl else None
+    if key:
+        hit = response_cache.get(key)
+        if hit is not None:
+            s.last_stats.clear()
+            s.last_stats["cache"] = "hit"
+            metrics.hit("response")
+            if s.stream_sink is not None:
+                s.stream_sink(hit)
+            return hit
+    # i token vanno al sink attivo (console) e intanto si accumula la risposta completa
+    t0 = time.perf_counter()
+    out = collect(stream_ollama(prompt), s.stream_sink)
+    metrics.record_llm(s.last_stats, len(prompt), time.perf_counter() - t0)
+    if not out:
+        return "[Nessuna risposta]"
+    if key and "error" not in s.last_stats and not out.startswith("[Errore Ollama]"):
+        response_cache.put(key, out, ttl)
+    return out
+
+def run_ollama_quiet(model: str, prompt: str, cache_tag: Optional[str] = None) -> str:
+    # variante senza streaming né stato di sessione, sicura nei thread (map-reduce)
+    ttl = CACHE_POLICY.get(cache_tag) if CACHE_ENABLED and cache_tag else None
+    key = make_key(model, None, prompt) if ttl else None
+    if key:
+        hit = response_cache.get(key)
+        if hit is not None:
+            metrics.hit("response")
+            return hit
+    try:
+        with metrics.timer("llm_map"):
+            out = ollama.generate(model, prompt) if OLLAMA_BACKEND == "http" else run_ollama_cli(model, prompt)
+    except OllamaUnavailable:
+        out = run_ollama_cli(model, prompt)
+    except OllamaError as e:
+        return f"[Errore Ollama] {e}"
+    if key and out and not out.startswith("[Errore Ollama]"):
+        response_cache.put(key, out, ttl)
+    return out
+
+def cache_command(arg: str, effective_lang: str) -> str:
+    if arg == "clear":
+        n = response_cache.clear() + file_cache.clear() + web.cache.clear() + search.clear()
+        return f"🧹 Cache svuotata ({n} voci)." if effective_lang == "it" else f"🧹 Caché vaciada ({n} entradas)."
+    if arg not in {"", "stats"}:
+        return "Uso: /cache stats | /cache clear"
+    st = response_cache.stats()
+    fc = file_cache.stats()
+    wc = web.stats()
+    sc = search.stats()
+    return (
+        f"🗄️ Cache: hit_rate={st['hit_rate']:.0%}, hit RAM={st['mem_hits']}, hit disco={st['disk_hits']}, "
+        f"miss={st['misses']}, byte_risparmiati={st['bytes_saved']}, voci_RAM={st['mem_entries']}, "
+        f"disco={st['disk_bytes']}/{CACHE_DISK_MAX_BYTES} byte, enabled={CACHE_ENABLED}\n"
+        f"📄 File: hit={fc['hits']}, miss={fc['misses']}, documenti={fc['entries']}, "
+        f"disco={fc['disk_bytes']}/{FILE_CACHE_MAX_BYTES} byte, analisi risparmiata={fc['load_s_saved']:.1f}s\n"
+        f"🌐 Pagine: fresche={wc['fresh_hits']}, rivalidate(304)={wc['revalidated']}, scaricate={wc['misses']}, "
+        f"byte_scaricati={wc['bytes_downloaded']}, disco={wc['disk_bytes']}/{WEB_PAGE_CACHE_MAX_BYTES} byte\n"
+        f"🔎 Ricerche: hit={sc['hits']}, hit_vecchi={sc['stale_hits']}, miss={sc['misses']}, "
+        f"unite={sc['coalesced']}, errori={sc['errors']}, voci={sc['entries']}"
     )
-    out = r.stdout.decode("utf-8", errors="ignore").strip()
-    err = r.stderr.decode("utf-8", errors="ignore").strip()
-    if not out and err:
-        return f"[Errore Ollama] {err}"
-    return out or "[Nessuna risposta]"
 
-def build_prompt(user_msg: str, system: str, effective_lang: str) -> str:
-    trimmed = history[-(MAX_TURNS * 2):]
-    context = "\n".join(trimmed)
-    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+def call_streaming(prefix: str, fn: Callable[..., str], *args: Any) -> str:
+    s = current_session()
+    printer = TokenPrinter(prefix)
+    s.stream_sink = printer if STREAM_OUTPUT else None
+    try:
+        out = fn(*args)
+    finally:
+        s.stream_sink = None
+    if printer.started:
+        print("\n")
+    else:
+        print(f"{prefix}{out}", "\n")
+    return out
 
+def build_system(system: str, effective_lang: str) -> str:
+    s = current_session()
     guardrails_it = (
         "Regola: i fatti dichiarati dall'utente sono fonte di verità. Non contraddirli.\n"
         "Regola: evita domande generiche se l'utente ha già descritto il problema.\n"
@@ -175,14 +358,21 @@ def build_prompt(user_msg: str, system: str, effective_lang: str) -> str:
 
     return (
         f"{system}\n"
-        f"Meta: mode={mode}, lang={effective_lang}, temp_hint={TEMPERATURE_HINT}\n"
+        f"Meta: mode={s.mode}, lang={effective_lang}, temp_hint={TEMPERATURE_HINT}\n"
         f"{guardrails}"
-        f"Data/Ora: {now}\n\n"
-        f"{context}\n"
-        f"Utente: {user_msg}\n"
-        f"Assistente:"
+        f"Data: {SESSION_DATE}\n"
     )
 
+def chat_turn(user_msg: str, system: str) -> str:
+    s = current_session()
+    s.chat.set_system(system)
+    prompt_chars = sum(len(m["content"]) for m in s.chat.payload()) + len(user_msg)
+    t0 = time.perf_counter()
+    tokens = s.chat.stream(s.model, user_msg, s.last_stats, OLLAMA_BACKEND == "http")
+    out = collect(tokens, s.stream_sink)
+    metrics.record_llm(s.last_stats, prompt_chars, time.perf_counter() - t0)
+    return out or "[Nessuna risposta]"
+
 # =====================
 # FILE READERS
 # =====================
@@ -195,57 +385,115 @@ def clip_text(text: str, max_chars: int) -> str:
         return text
     return text[:max_chars] + "\n…(testo tagliato per limite)…"
 
-def read_text_file(path: str) -> str:
-    size = os.path.getsize(path)
-    if size > FILE_READ_MAX_BYTES:
-        raise ValueError(f"File troppo grande ({size} bytes). Limite: {FILE_READ_MAX_BYTES} bytes.")
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
-    except UnicodeDecodeError:
-        with open(path, "r", encoding="latin-1", errors="ignore") as f:
-            return f.read()
-
-def read_pdf(path: str) -> str:
-    reader = PdfReader(path)
-    pages = reader.pages[:PDF_MAX_PAGES]
+def read_text_file(path: str, opts: Optional[Dict[str, str]] = None) -> str:
+    # con --tail/--since/--grep o oltre il limite: finestra via mmap, il file non viene caricato
+    if opts or os.path.getsize(path) > FILE_READ_MAX_BYTES:
+        return read_log(path, opts or {}, LOG_DEFAULT_TAIL, FILE_READ_MAX_BYTES)
+    with open(path, "rb") as f:
+        data = f.read()
+    return data.decode(detect_encoding(data[:SAMPLE_BYTES]), errors="replace")
+
+def pdf_progress(done: int, total: int) -> None:
+    if sys.stderr.isatty():
+        end = "\n" if done >= total else ""
+        print(f"\r📄 PDF: pagina {done}/{total}", end=end, file=sys.stderr, flush=True)
+
+def read_pdf(path: str) -> Tuple[str, List[Chunk]]:
+    # pagine divise in blocchi appena arrivano: in memoria resta solo il testo entro i
+    # budget di tempo e di byte, mai l'elenco completo delle pagine
+    stats: Dict[str, Any] = {}
     texts = []
-    for i, page in enumerate(pages, start=1):
-        try:
-            t = page.extract_text() or ""
-        except Exception:
-            t = ""
+    chunks: List[Chunk] = []
+    t0 = time.perf_counter()
+    for i, t in iter_pdf_pages(path, PDF_WORKERS, PDF_TIME_BUDGET_S, PDF_MAX_TEXT_BYTES, pdf_progress, stats):
+        # attesa di ogni pagina vista da qui (con più processi arrivano a blocchi)
+        now = time.perf_counter()
+        add_span("pdf.page", t0, now - t0, page=i, chars=len(t))
+        t0 = now
         if t.strip():
             texts.append(f"\n--- Pagina {i} ---\n{t}")
+            chunks.extend(chunk_pdf_page(i, t))
+    if stats.get("truncated"):
+        if sys.stderr.isatty():
+            print(file=sys.stderr)
+        texts.append(f"\n…(estrazione interrotta a pagina {stats['pages']}/{stats['total_pages']}: "
+                     f"limite di {stats['truncated']})…")
     if not texts:
-        return "(Nessun testo estratto: PDF potrebbe essere scansionato/immagine.)"
-    return "\n".join(texts)
+        text = "(Nessun testo estratto: PDF potrebbe essere scansionato/immagine.)"
+        return text, chunk_paragraphs(text)
+    return "\n".join(texts), chunks
 
 def read_docx(path: str) -> str:
-    doc = Document(path)
+    doc = docx.Document(path)
     paras = doc.paragraphs[:DOCX_MAX_PARAS]
     texts = [p.text for p in paras if p.text and p.text.strip()]
     return "\n".join(texts) if texts else "(Documento vuoto o testo non estratto.)"
 
-def load_file(path: str) -> tuple[str, str, str]:
+def load_file(path: str, opts: Optional[Dict[str, str]] = None) -> Tuple[str, str, str, Optional[List[Chunk]]]:
+    # i PDF arrivano già divisi in blocchi (pagina per pagina); gli altri si dividono dopo
     path = normalize_path(path)
     if not os.path.exists(path):
         raise FileNotFoundError(f"File non trovato: {path}")
     ext = os.path.splitext(path)[1].lower()
     if ext == ".pdf":
-        return read_pdf(path), "pdf", path
+        text, chunks = read_pdf(path)
+        return text, "pdf", path, chunks
     if ext == ".docx":
-        return read_docx(path), "docx", path
-    return read_text_file(path), "text", path
+        return read_docx(path), "docx", path, None
+    return read_text_file(path, opts), "text", path, None
+
+def ingest_file(path: str, opts: Dict[str, str]) -> Tuple[str, str, str, Dict[str, Any], bool]:
+    # /file: testo, blocchi ed embedding dalla cache se il file non è cambiato
+    s = current_session()
+    apath = normalize_path(path)
+    key = file_cache.key(apath, opts)
+    cached = file_cache.get(key, s.docs.embedder_name)
+    title = os.path.basename(apath)   # solo per la visualizzazione: la chiave nel corpus è il percorso
+    if cached is not None:
+        metrics.hit("file")
+        info = s.docs.add(apath, cached["text"], cached["type"], apath, cached["chunks"], cached["vectors"], title)
+        return cached["text"], cached["type"], apath, info, True
+    t0 = time.perf_counter()
+    with metrics.timer("file_parse"):
+        text, ftype, apath, chunks = load_file(path, opts)
+    if chunks is None:
+        with metrics.timer("chunking"):
+            chunks = chunk_document(text, ftype)
+    load_s = time.perf_counter() - t0
+    with metrics.timer("indexing"):
+        info = s.docs.add(apath, text, ftype, apath, chunks, title=title)
+    file_cache.put(key, text, ftype, chunks, load_s, s.docs.doc_vectors(apath), s.docs.embedder_name)
+    return text, ftype, apath, info, False
 
 # =====================
 # FILE SUMMARY / QA (PRO)
 # =====================
+def file_summary_content(effective_lang: str) -> Tuple[str, int]:
+    # documento intero in una sola parte: prompt diretto; altrimenti map-reduce sul testo completo
+    s = current_session()
+    parts = split_for_summary(s.last_file_text, s.last_file_type or "text", SUMMARY_CHUNK_TOKENS,
+                              s.chat.memory.estimator)
+    max_chars = int(SUMMARY_CHUNK_TOKENS * s.chat.memory.estimator.chars_per_token)
+    if len(parts) <= 1:
+        return clip_text(s.last_file_text, max_chars), 1
+
+    def summarize_part(label: str, body: str) -> str:
+        # gira nel pool del map-reduce: il contesto dello scheduler va rimesso a mano
+        with llm.context("batch", s.id):
+            return run_ollama_quiet(s.model, map_prompt(label, body, effective_lang), "/filesum:map")
+
+    # i thread del map-reduce scrivono nella traccia della richiesta
+    run_part = carry_trace(summarize_part)
+    partials = map_summaries(parts, run_part, SUMMARY_PARALLELISM, console_progress)
+    return reduce_partials(partials, run_part, max_chars, SUMMARY_PARALLELISM, console_progress), len(parts)
+
 def summarize_file(effective_lang: str) -> str:
-    if not last_file_text:
+    s = current_session()
+    if not s.last_file_text:
         return "Nessun file caricato." if effective_lang == "it" else "No hay archivo cargado."
 
     sys_guard = SYSTEM_FILE_GUARDRAILS_ES if effective_lang == "es" else SYSTEM_FILE_GUARDRAILS_IT
+    content, n_parts = file_summary_content(effective_lang)
 
     if effective_lang == "it":
         req = (
@@ -256,7 +504,9 @@ def summarize_file(effective_lang: str) -> str:
             "3) Dati/valori rilevanti (se presenti)\n"
             "4) Ambiguità o info mancanti (1-3 righe)\n"
         )
-        head = f"FILE ({last_file_type}): {last_file_path}"
+        head = f"FILE ({s.last_file_type}): {s.last_file_path}"
+        if n_parts > 1:
+            head += f"\n(contenuto = sintesi di {n_parts} parti del documento completo)"
     else:
         req = (
             "Resume de forma profesional y concisa.\n"
@@ -266,34 +516,54 @@ def summarize_file(effective_lang: str) -> str:
             "3) Datos/valores relevantes (si existen)\n"
             "4) Ambigüedades o info faltante (1-3 líneas)\n"
         )
-        head = f"ARCHIVO ({last_file_type}): {last_file_path}"
+        head = f"ARCHIVO ({s.last_file_type}): {s.last_file_path}"
+        if n_parts > 1:
+            head += f"\n(contenido = síntesis de {n_parts} partes del documento completo)"
 
     prompt = (
         f"{sys_guard}\n\n"
         f"{head}\n\n"
-        f"CONTENIDO:\n{clip_text(last_file_text, FILE_MAX_CHARS)}\n\n"
+        f"CONTENIDO:\n{content}\n\n"
         f"TAREA:\n{req}\n"
         f"RESPUESTA:"
     )
-    return run_ollama(prompt)
+    return run_ollama(prompt, "/filesum")
+
+def file_context(question: str) -> str:
+    # solo i blocchi pertinenti di tutti i documenti caricati, con citazione documento · posizione
+    s = current_session()
+    chunks = s.docs.search(question, RETRIEVAL_TOP_K)
+    if chunks:
+        return format_doc_chunks(chunks, s.docs.display_names())
+    return clip_text(s.last_file_text or "", FILE_MAX_CHARS)
+
+def files_head() -> str:
+    s = current_session()
+    names = s.docs.display_names()
+    if len(names) > 1:
+        return ", ".join(names.values())
+    return f"({s.last_file_type}) {s.last_file_path}" if s.last_file_path else ", ".join(names.values())
 
 def ask_file(question: str, effective_lang: str) -> str:
-    if not last_file_text:
+    s = current_session()
+    if not s.docs.chunks and not s.last_file_text:
         return "Nessun file caricato." if effective_lang == "it" else "No hay archivo cargado."
 
     sys_guard = SYSTEM_FILE_GUARDRAILS_ES if effective_lang == "es" else SYSTEM_FILE_GUARDRAILS_IT
+    with metrics.timer("retrieval"):
+        content = file_context(question)
 
     if effective_lang == "it":
         req = (
             "Rispondi usando SOLO informazioni presenti nel file.\n"
             "- Se l'informazione non c'è: scrivi 'Non presente nel file'.\n"
-            "- Se possibile, cita 1-3 estratti brevi dal file come evidenza.\n"
+            "- Se possibile, cita 1-3 estratti brevi dal file come evidenza, con la posizione tra [ ].\n"
             "- Risposta concisa e operativa.\n"
         )
-        head = f"FILE ({last_file_type}): {last_file_path}"
+        head = f"FILE: {files_head()}"
         prompt = (
             f"{sys_guard}\n\n{head}\n\n"
-            f"CONTENUTO:\n{clip_text(last_file_text, FILE_MAX_CHARS)}\n\n"
+            f"CONTENUTO:\n{content}\n\n"
             f"TAREA:\n{req}\n"
             f"DOMANDA: {question}\n"
             f"RISPOSTA:"
@@ -302,52 +572,66 @@ def ask_file(question: str, effective_lang: str) -> str:
         req = (
             "Responde usando SOLO la información del archivo.\n"
             "- Si no está: escribe 'No está en el archivo'.\n"
-            "- Si es posible, cita 1-3 extractos breves como evidencia.\n"
+            "- Si es posible, cita 1-3 extractos breves como evidencia, con la posición entre [ ].\n"
             "- Respuesta concisa y accionable.\n"
         )
-        head = f"ARCHIVO ({last_file_type}): {last_file_path}"
+        head = f"ARCHIVO: {files_head()}"
         prompt = (
             f"{sys_guard}\n\n{head}\n\n"
-            f"CONTENIDO:\n{clip_text(last_file_text, FILE_MAX_CHARS)}\n\n"
+            f"CONTENIDO:\n{content}\n\n"
             f"TAREA:\n{req}\n"
             f"PREGUNTA: {question}\n"
             f"RESPUESTA:"
         )
 
-    return run_ollama(prompt)
+    return run_ollama(prompt, "/askfile")
 
 # =====================
 # WEB: SEARCH + READ
 # =====================
 def web_search(query: str, max_results: int = WEB_TOP_K) -> List[Tuple[str, str, str]]:
-    results = []
-    with DDGS() as ddgs:
-        for r in ddgs.text(query, max_results=max_results):
-            title = (r.get("title") or "").strip()
-            url = (r.get("href") or "").strip()
-            snippet = (r.get("body") or "").strip()
-            if url:
-                results.append((title or url, url, snippet))
-    return results
-
-def fetch_url_text(url: str) -> str:
-    headers = {"User-Agent": "Mozilla/5.0 (BotIA; +web-read)"}
-    resp = requests.get(url, headers=headers, timeout=WEB_TIMEOUT)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
-    for tag in soup(["script", "style", "noscript"]):
-        tag.decompose()
-    text = soup.get_text(separator=" ", strip=True)
-    return clip_text(text, WEB_MAX_CHARS)
-
-def answer_with_sources(question: str, sources: List[Tuple[str, str, str]], effective_lang: str) -> str:
+    # cache TTL + coalescing delle query identiche (vedi search_cache.SearchCache)
+    with metrics.timer("web_search"):
+        return search.search(query, max_results)
+
+def fetch_url_text(url: str, timeout: float = WEB_TIMEOUT, max_chars: int = WEB_EXTRACT_CHARS) -> str:
+    # sessione condivisa + cache; solo il contenuto principale, download fermato appena ci sono max_chars
+    with metrics.timer("web_fetch"):
+        return clip_text(web.get_text(url, timeout, max_chars), max_chars)
+
+def deep_sources(results: List[Tuple[str, str, str]]) -> List[Tuple[str, str, str]]:
+    # legge in parallelo le pagine dei risultati; chi non arriva entro la scadenza tiene lo snippet
+    t0 = time.perf_counter()
+    pages = fetch_many([url for _t, url, _s in results],
+                       carry_trace(lambda url, timeout: fetch_url_text(url, min(timeout, WEB_TIMEOUT))),
+                       WEB_DEEP_DEADLINE_S, WEB_DEEP_PER_HOST)
+    out = []
+    for title, url, snippet in results:
+        text = pages.get(url, (None, None, 0.0))[0]
+        out.append((title, url, text if text and text.strip() else snippet))
+    if sys.stderr.isatty():
+        ok = sum(1 for text, _e, _s in pages.values() if text)
+        print(f"🌐 Pagine lette: {ok}/{len(results)} in {time.perf_counter() - t0:.1f}s", file=sys.stderr, flush=True)
+    return out
+
+def answer_with_sources(question: str, sources: List[Tuple[str, str, str]], effective_lang: str,
+                        cache_tag: Optional[str] = "/web") -> str:
+    s = current_session()
     sys_web = SYSTEM_WEB_ES if effective_lang == "es" else SYSTEM_WEB_IT
+    per_source = WEB_MAX_CHARS if len(sources) == 1 else WEB_DEEP_MAX_CHARS
+    est = s.chat.memory.estimator
     formatted = []
     for i, (title, url, snippet) in enumerate(sources, start=1):
-        formatted.append(f"[{i}] {title}\nURL: {url}\nEstratto: {snippet}\n")
+        # solo i passaggi pertinenti alla domanda: meno token e citazioni più precise
+        with metrics.timer("prompt_build"):
+            excerpt = select_passages(snippet, question, per_source)
+        if len(excerpt) < len(snippet) and sys.stderr.isatty():
+            before, after = est.count(snippet), est.count(excerpt)
+            print(f"✂️ [{i}] {before} → {after} tok (-{1 - after / before:.0%})", file=sys.stderr, flush=True)
+        formatted.append(f"[{i}] {title}\nURL: {url}\nEstratto: {excerpt}\n")
     sources_block = "\n".join(formatted) if formatted else "(Nessuna fonte)"
     prompt = f"{sys_web}\n\nDOMANDA: {question}\n\nFONTI:\n{sources_block}\n\nRISPOSTA (cita [1],[2],...):"
-    return run_ollama(prompt)
+    return run_ollama(prompt, cache_tag)
 
 # =====================
 # TEMPLATES
@@ -380,37 +664,69 @@ def checknet_template(effective_lang: str) -> str:
         "6) `ipconfig /flushdns`\n7) `netsh winsock reset` (riavvio)\n8) Proxy/VPN.\n"
     )
 
+# =====================
+# MODELLO
+# =====================
+def preload_model(model: str) -> bool:
+    if not (MODEL_PRELOAD and OLLAMA_BACKEND == "http"):
+        return False
+    models.preload(model)
+    return True
+
+def release_models() -> None:
+    if MODEL_RELEASE_ON_EXIT and OLLAMA_BACKEND == "http":
+        models.release()
+
+MODEL_STATES = {"loading": ("in caricamento", "cargando"), "loaded": ("caricato", "cargado"),
+                "error": ("errore", "error"), "unloaded": ("scaricato", "descargado"), "unknown": ("-", "-")}
+
+def model_state(model: str, effective_lang: str) -> str:
+    st = models.status(model)
+    label = MODEL_STATES[st["state"]][0 if effective_lang == "it" else 1]
+    return f"{label} ({st['load_s']:.2f}s)" if st["load_s"] is not None else label
+
 # =====================
 # COMMANDS
 # =====================
 def handle_command(cmd: str, effective_lang: str) -> str:
-    global mode, lang, history, MODEL, last_answer, webmode, last_web_sources
-    global last_file_text, last_file_path, last_file_type
+    s = current_session()
 
     parts = cmd.strip().split(maxsplit=1)
     c = parts[0].lower()
 
     if c == "/reset":
-        history.clear()
-        last_answer = None
-        last_web_sources = []
-        last_file_text = last_file_path = last_file_type = None
+        s.chat.reset()
+        s.last_answer = None
+        s.last_web_sources = []
+        s.last_file_text = s.last_file_path = s.last_file_type = None
+        s.docs.clear()
+        s.docs.save()
         return "🧠 Memoria azzerata." if effective_lang == "it" else "🧠 Memoria borrada."
 
     if c == "/sum":
-        turns = len(history) // 2
-        hasfile = "si" if last_file_text else "no"
-        return (f"📌 Stato: mode={mode}, lang={lang}, model={MODEL}, webmode={webmode}, file_caricato={hasfile}, turni={turns}/{MAX_TURNS}"
+        turns = s.chat.turns
+        mem = s.chat.budget_status()
+        kv = f"{s.chat.totals['prompt_eval']}/{s.chat.totals['reused']}"
+        hasfile = f"{len(s.docs.docs)} doc" if s.docs.docs else "no"
+        ttft = f"{s.last_stats['ttft_s']:.2f}s" if "ttft_s" in s.last_stats else "-"
+        loaded = model_state(s.model, effective_lang)
+        return (f"📌 Stato: mode={s.mode}, lang={s.lang}, model={s.model} [{loaded}], webmode={s.webmode}, file_caricato={hasfile}, turni={turns}, memoria={mem['used']}/{mem['budget']} tok, riassunto={'si' if mem['summary'] else 'no'}, ttft={ttft}, prompt_tok(valutati/riusati)={kv}"
                 if effective_lang == "it"
-                else f"📌 Estado: mode={mode}, lang={lang}, model={MODEL}, webmode={webmode}, archivo_cargado={hasfile}, turnos={turns}/{MAX_TURNS}")
+                else f"📌 Estado: mode={s.mode}, lang={s.lang}, model={s.model} [{loaded}], webmode={s.webmode}, archivo_cargado={hasfile}, turnos={turns}, memoria={mem['used']}/{mem['budget']} tok, resumen={'sí' if mem['summary'] else 'no'}, ttft={ttft}, prompt_tok(evaluados/reutilizados)={kv}")
+
+    if c == "/stats":
+        if len(parts) > 1 and parts[1].strip().lower() == "reset":
+            metrics.reset()
+            return "🧹 Statistiche azzerate." if effective_lang == "it" else "🧹 Estadísticas borradas."
+        return format_stats(metrics, effective_lang)
 
     if c == "/mode":
         if len(parts) < 2:
             return "Uso: /mode helpdesk | /mode docente"
         m = parts[1].strip().lower()
         if m in {"helpdesk", "docente"}:
-            mode = m
-            return f"✅ Modalità impostata: {mode}" if effective_lang == "it" else f"✅ Modo configurado: {mode}"
+            s.mode = m
+            return f"✅ Modalità impostata: {s.mode}" if effective_lang == "it" else f"✅ Modo configurado: {s.mode}"
         return "Valori validi: helpdesk, docente" if effective_lang == "it" else "Valores válidos: helpdesk, docente"
 
     if c == "/lang":
@@ -418,15 +734,22 @@ def handle_command(cmd: str, effective_lang: str) -> str:
             return "Uso: /lang auto | /lang it | /lang es"
         l = parts[1].strip().lower()
         if l in {"auto", "it", "es"}:
-            lang = l
-            return f"✅ Lingua impostata: {lang}" if effective_lang == "it" else f"✅ Idioma configurado: {lang}"
+            s.lang = l
+            return f"✅ Lingua impostata: {s.lang}" if effective_lang == "it" else f"✅ Idioma configurado: {s.lang}"
         return "Valori validi: auto, it, es" if effective_lang == "it" else "Valores válidos: auto, it, es"
 
     if c == "/model":
         if len(parts) < 2:
             return "Uso: /model llama3.2"
-        MODEL = parts[1].strip()
-        return f"✅ Modello impostato: {MODEL}" if effective_lang == "it" else f"✅ Modelo configurado: {MODEL}"
+        s.model = parts[1].strip()
+        models.use(s.id, s.model)
+        if preload_model(s.model):
+            return (f"✅ Modello impostato: {s.model} (caricamento in background)" if effective_lang == "it"
+                    else f"✅ Modelo configurado: {s.model} (cargando en segundo plano)")
+        return f"✅ Modello impostato: {s.model}" if effective_lang == "it" else f"✅ Modelo configurado: {s.model}"
+
+    if c == "/cache":
+        return cache_command(parts[1].strip().lower() if len(parts) > 1 else "", effective_lang)
 
     if c == "/ticket":
         return ticket_template(effective_lang)
@@ -435,7 +758,7 @@ def handle_command(cmd: str, effective_lang: str) -> str:
         return checknet_template(effective_lang)
 
     if c == "/translate":
-        if last_answer is None:
+        if s.last_answer is None:
             return "Non ho nulla da tradurre." if effective_lang == "it" else "No hay nada que traducir."
         target = parts[1].strip().lower() if len(parts) > 1 else ""
         if target not in {"it", "es"}:
@@ -443,45 +766,86 @@ def handle_command(cmd: str, effective_lang: str) -> str:
         sys_t = ("Traduce fedelmente mantenendo formattazione e tecnicismi."
                  if target == "it"
                  else "Traduce fielmente manteniendo formato y tecnicismos.")
-        return run_ollama(f"{sys_t}\n\nTESTO:\n{last_answer}\n\nTRADUZIONE:")
+        return run_ollama(f"{sys_t}\n\nTESTO:\n{s.last_answer}\n\nTRADUZIONE:", "/translate")
 
     # ---- FILE COMMANDS ----
     if c in {"/file", "/pdf", "/docx"}:
         if len(parts) < 2:
-            return "Uso: /file <path> | /pdf <path> | /docx <path>"
+            return "Uso: /file <path> [--tail N] [--since <data>] [--grep <regex>] | /pdf <path> | /docx <path>"
         try:
-            text, ftype, apath = load_file(parts[1])
+            path, opts = parse_file_args(parts[1])
+            text, ftype, apath, info, from_cache = ingest_file(path, opts)
         except Exception as e:
             return f"Errore lettura file: {e}" if effective_lang == "it" else f"Error leyendo archivo: {e}"
-        last_file_text, last_file_type, last_file_path = text, ftype, apath
-        base = f"✅ File caricato ({ftype}): {apath}\n" if effective_lang == "it" else f"✅ Archivo cargado ({ftype}): {apath}\n"
+        s.last_file_text, s.last_file_type, s.last_file_path = text, ftype, apath
+        n, ms = info["chunks"], s.docs.timings.get("bm25_build_ms", 0.0)
+        rate = s.docs.timings.get("embed_chunks_per_s", 0.0)
+        if effective_lang == "it":
+            emb = f"embedding {rate:.0f} blocchi/s" if s.docs.vectors is not None else "solo ricerca lessicale"
+            if from_cache:
+                emb = "⚡ dalla cache, analisi saltata" + (", embedding riusati" if info.get("embedded") else "")
+            base = f"✅ File caricato ({ftype}): {apath} [{n} blocchi, indice in {ms:.0f} ms, {emb}]\n"
+        else:
+            emb = f"embeddings {rate:.0f} bloques/s" if s.docs.vectors is not None else "solo búsqueda léxica"
+            if from_cache:
+                emb = "⚡ desde caché, análisis omitido" + (", embeddings reutilizados" if info.get("embedded") else "")
+            base = f"✅ Archivo cargado ({ftype}): {apath} [{n} bloques, índice en {ms:.0f} ms, {emb}]\n"
+        base += (f"📚 Corpus '{s.docs.name}': {len(s.docs.docs)} documenti.\n" if effective_lang == "it"
+                 else f"📚 Corpus '{s.docs.name}': {len(s.docs.docs)} documentos.\n")
         hint = "Ora puoi usare: /filesum oppure /askfile <domanda>." if effective_lang == "it" else "Ahora puedes usar: /filesum o /askfile <pregunta>."
         return base + hint
 
+    if c == "/docs":
+        if len(parts) > 1 and parts[1].strip().lower() == "clear":
+            s.docs.clear()
+            s.docs.save()
+            return "🧹 Corpus svuotato." if effective_lang == "it" else "🧹 Corpus vaciado."
+        if not s.docs.docs:
+            return "Nessun documento nel corpus." if effective_lang == "it" else "No hay documentos en el corpus."
+        names = s.docs.display_names()
+        lines = [f"- {names[key]} ({d['type']}, {d['chunks']} blocchi)" for key, d in s.docs.docs.items()]
+        return f"📚 Corpus '{s.docs.name}':\n" + "\n".join(lines)
+
+    if c == "/corpus":
+        if len(parts) < 2:
+            return f"Uso: /corpus <nome>  (attuale: {s.docs.name})"
+        s.docs.switch(parts[1].strip())
+        return (f"✅ Corpus '{s.docs.name}': {len(s.docs.docs)} documenti." if effective_lang == "it"
+                else f"✅ Corpus '{s.docs.name}': {len(s.docs.docs)} documentos.")
+
     if c == "/filesum":
-        return summarize_file(effective_lang)
+        with llm.context("batch"):
+            return summarize_file(effective_lang)
 
     if c == "/askfile":
         if len(parts) < 2:
             return "Uso: /askfile <domanda>" if effective_lang == "it" else "Uso: /askfile <pregunta>"
-        return ask_file(parts[1].strip(), effective_lang)
+        with llm.context("askfile"):
+            return ask_file(parts[1].strip(), effective_lang)
 
     # ---- WEB COMMANDS ----
     if c == "/webmode":
         if len(parts) < 2:
-            return "Uso: /webmode on | /webmode off"
+            return "Uso: /webmode on | /webmode deep | /webmode off"
         v = parts[1].strip().lower()
-        if v in {"on", "off"}:
-            webmode = (v == "on")
-            return f"✅ Webmode: {webmode}"
-        return "Valori validi: on, off" if effective_lang == "it" else "Valores válidos: on, off"
+        if v in {"on", "off", "deep"}:
+            s.webmode, s.webdeep = v != "off", v == "deep"
+            return f"✅ Webmode: {s.webmode} (deep={s.webdeep})"
+        return "Valori validi: on, deep, off" if effective_lang == "it" else "Valores válidos: on, deep, off"
 
     if c == "/web":
         if len(parts) < 2:
-            return "Uso: /web <query>" if effective_lang == "it" else "Uso: /web <consulta>"
+            return "Uso: /web [--deep] <query>" if effective_lang == "it" else "Uso: /web [--deep] <consulta>"
         q = parts[1].strip()
+        deep = s.webdeep
+        if q.startswith("--deep"):
+            q, deep = q[len("--deep"):].strip(), True
+        if not q:
+            return "Uso: /web [--deep] <query>" if effective_lang == "it" else "Uso: /web [--deep] <consulta>"
         results = web_search(q, WEB_TOP_K)
-        last_web_sources = results
+        if deep and results:
+            results = deep_sources(results)
+        s.last_web_sources = results
         if not results:
             return "Nessun risultato web trovato." if effective_lang == "it" else "No se encontraron resultados."
         return answer_with_sources(q, results, effective_lang)
@@ -495,62 +859,99 @@ def handle_command(cmd: str, effective_lang: str) -> str:
         except Exception as e:
             return f"Errore lettura URL: {e}"
         src = [("Pagina letta", url, text)]
-        last_web_sources = src
+        s.last_web_sources = src
         q = "Riassumi e spiega i punti principali della pagina." if effective_lang == "it" else "Resume y explica los puntos principales de la página."
-        return answer_with_sources(q, src, effective_lang)
+        return answer_with_sources(q, src, effective_lang, "/read")
 
-    return ("Comandi: /mode /lang /model /reset /sum /ticket /checknet /translate "
-            "/file /pdf /docx /filesum /askfile /web /read /webmode"
+    return ("Comandi: /mode /lang /model /reset /sum /stats /cache /ticket /checknet /translate "
+            "/file /pdf /docx /docs /corpus /filesum /askfile /web /read /webmode"
             if effective_lang == "it"
-            else "Comandos: /mode /lang /model /reset /sum /ticket /checknet /translate "
-                 "/file /pdf /docx /filesum /askfile /web /read /webmode")
+            else "Comandos: /mode /lang /model /reset /sum /stats /cache /ticket /checknet /translate "
+                 "/file /pdf /docx /docs /corpus /filesum /askfile /web /read /webmode")
 
 # =====================
-# MAIN
+# TURNO
 # =====================
-def main():
-    global last_answer
-
-    print("🤖 Bot WEB PRO (HELPDESK L2/L3 + DOCENTE) - Ollama + Internet")
-    print(f"Avvio: mode={mode} | lang={lang} | model={MODEL} | webmode={webmode}")
-    print("Comandi: /web <query> /read <url> /webmode on|off")
-    print("File: /file /pdf /docx /filesum /askfile")
-    print("Altro: /mode /lang /model /reset /sum /ticket /checknet /translate it|es  | exit\n")
-
-    while True:
-        user_msg = input("Tu: ").strip()
-        if user_msg.lower() in {"exit", "quit"}:
-            print("Ciao Ciao 👋")
-            break
-        if not user_msg:
-            continue
-
-        effective_lang = detect_lang(user_msg) if lang == "auto" else lang
-
+# etichette delle metriche: solo comandi noti, così i refusi non creano serie nuove
+COMMANDS = {"/reset", "/sum", "/stats", "/mode", "/lang", "/model", "/cache", "/ticket", "/checknet", "/translate",
+            "/file", "/pdf", "/docx", "/docs", "/corpus", "/filesum", "/askfile", "/webmode", "/web", "/read"}
+ERROR_PREFIXES = ("[Errore", "Errore ", "Error ")
+
+def command_label(user_msg: str) -> str:
+    if not user_msg.startswith("/"):
+        return "chat"
+    c = user_msg.split(maxsplit=1)[0].lower()
+    return c if c in COMMANDS else "other"
+
+def respond(user_msg: str, effective_lang: str) -> str:
+    # un turno completo (comando, ricerca web euristica o chat): condiviso da CLI, batch e server
+    s = current_session()
+    label = command_label(user_msg)
+    with llm.context("chat", s.id), metrics.track(label) as turn, tracer.request(label, session=s.id):
         if user_msg.startswith("/"):
-            print(handle_command(user_msg, effective_lang), "\n")
-            continue
+            answer = handle_command(user_msg, effective_lang)
+            turn["error"] = answer.startswith(ERROR_PREFIXES)
+            models.use(s.id, s.model)
+            return answer
 
+        answer = None
         # webmode euristico (opzionale)
-        if webmode and any(k in user_msg.lower() for k in ["cerca", "ultime", "latest", "oggi", "notizie", "prezzo", "versione", "documentazione"]):
+        if s.webmode and any(k in user_msg.lower() for k in ["cerca", "ultime", "latest", "oggi", "notizie", "prezzo", "versione", "documentazione"]):
             try:
                 results = web_search(user_msg, WEB_TOP_K)
+                if results and s.webdeep:
+                    results = deep_sources(results)
                 if results:
                     answer = answer_with_sources(user_msg, results, effective_lang)
-                    last_answer = answer
-                    print("\nBot:", answer, "\n")
-                    continue
             except Exception:
                 pass
 
-        system = get_system_prompt(effective_lang, mode)
-        history.append(f"Utente: {user_msg}")
-        prompt = build_prompt(user_msg, system, effective_lang)
-        answer = run_ollama(prompt)
-        history.append(f"Assistente: {answer}")
-        last_answer = answer
+        if answer is None:
+            system = get_system_prompt(effective_lang, s.mode)
+            answer = chat_turn(user_msg, build_system(system, effective_lang))
+        turn["error"] = "error" in s.last_stats
+        s.last_answer = answer
+        models.use(s.id, s.model, s.last_stats)
+        return answer
+
+# =====================
+# MAIN
+# =====================
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="BotIA console")
+    ap.add_argument("--trace", default=TRACE_DIR, help="cartella per le tracce delle richieste (JSON Chrome)")
+    ap.add_argument("--profile", type=int, default=PROFILE_TOP, metavar="N",
+                    help="cProfile + tracemalloc per le N richieste più lente (con --trace)")
+    args = ap.parse_args(argv)
+    tracer.configure(args.trace or ("traces" if args.profile else ""), profile_top=args.profile)
+    s = current_session()
 
-        print("\nBot:", answer, "\n")
+    print("🤖 Bot WEB PRO (HELPDESK L2/L3 + DOCENTE) - Ollama + Internet")
+    print(f"Avvio: mode={s.mode} | lang={s.lang} | model={s.model} | webmode={s.webmode}")
+    print("Comandi: /web [--deep] <query> /read <url> /webmode on|deep|off")
+    print("File: /file /pdf /docx /docs /corpus /filesum /askfile")
+    print("Altro: /mode /lang /model /reset /sum /stats /cache /ticket /checknet /translate it|es  | exit\n")
+
+    # il modello si carica mentre l'utente scrive la prima domanda
+    models.use(s.id, s.model)
+    preload_model(s.model)
+    if WARMUP_IMPORTS:
+        warm_up()
+
+    try:
+        while True:
+            user_msg = input("Tu: ").strip()
+            if user_msg.lower() in {"exit", "quit"}:
+                print("Ciao Ciao 👋")
+                break
+            if not user_msg:
+                continue
+
+            effective_lang = detect_lang(user_msg) if s.lang == "auto" else s.lang
+
+            call_streaming("" if user_msg.startswith("/") else "\nBot: ", respond, user_msg, effective_lang)
+    finally:
+        release_models()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,136 @@
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from memory import ConversationMemory, Message
+from ollama_client import OllamaClient, OllamaError, OllamaUnavailable, record_done, run_ollama_cli
+
+ROLE_LABELS = {"user": "Utente", "assistant": "Assistente", "system": "Sistema"}
+
+SUMMARY_PROMPT = """Aggiorna il riassunto di una conversazione di supporto tecnico.
+Mantieni: problema dell'utente, ambiente, passi già provati, esiti, decisioni prese, dati tecnici (errori, versioni, comandi).
+Scrivi max 12 righe, nella stessa lingua della conversazione. Niente preamboli.
+
+RIASSUNTO PRECEDENTE:
+{previous}
+
+NUOVI MESSAGGI:
+{messages}
+
+RIASSUNTO AGGIORNATO:"""
+
+def format_messages(messages: List[Message]) -> str:
+    return "\n".join(f"{ROLE_LABELS.get(m['role'], m['role'])}: {m['content']}" for m in messages)
+
+# =====================
+# CHAT SESSION
+# =====================
+class ChatSession:
+    # Messaggi con ruolo e storia append-only: il prefisso (system + turni precedenti)
+    # resta identico byte per byte tra un turno e l'altro, così Ollama riusa la KV cache
+    # e valuta solo il nuovo messaggio.
+    def __init__(self, client: OllamaClient, token_budget: int = 3000, max_messages: int = 200):
+        self.client = client
+        self.model: Optional[str] = None
+        self.system: Optional[str] = None
+        self.memory = ConversationMemory(token_budget, max_messages, summarizer=self._summarize)
+        self.totals = {"prompt_eval": 0, "reused": 0}
+        self._cached_tokens = 0
+        self._summary_version = 0
+
+    @property
+    def messages(self) -> List[Message]:
+        return list(self.memory.messages)
+
+    @property
+    def turns(self) -> int:
+        return self.memory.turns
+
+    def reset(self) -> None:
+        self.memory.clear()
+        self.totals = {"prompt_eval": 0, "reused": 0}
+        self._cached_tokens = 0
+
+    def set_system(self, text: str) -> None:
+        if text != self.system:
+            # cambia mode/lang: il prefisso non è più in cache
+            self.system = text
+            self._cached_tokens = 0
+
+    def _summarize(self, previous: str, messages: List[Message]) -> str:
+        # gira nel thread della memoria: niente streaming, niente statistiche condivise
+        prompt = SUMMARY_PROMPT.format(previous=previous or "(nessuno)", messages=format_messages(messages))
+        model = self.model or ""
+        try:
+            return self.client.generate(model, prompt)
+        except OllamaUnavailable:
+            return run_ollama_cli(model, prompt)
+        except OllamaError:
+            return previous
+
+    def payload(self) -> List[Message]:
+        msgs = [{"role": "system", "content": self.system}] if self.system else []
+        return msgs + self.memory.context()
+
+    def as_prompt(self) -> str:
+        # formato testuale per il fallback su `ollama run`
+        return f"{self.system or ''}\n\n" + format_messages(self.memory.context()) + "\nAssistente:"
+
+    def budget_status(self) -> Dict[str, Any]:
+        return {
+            "used": self.memory.tokens(),
+            "budget": self.memory.token_budget,
+            "summary": bool(self.memory.summary),
+            "chars_per_token": round(self.memory.estimator.chars_per_token, 2),
+        }
+
+    def stream(self, model: str, user_msg: str, stats: Dict[str, Any], use_http: bool = True) -> Iterator[str]:
+        stats.clear()
+        t0 = time.perf_counter()
+        self.model = model
+        self.memory.append("user", user_msg)
+        if self.memory.trim() or self.memory.summary_version != self._summary_version:
+            self._summary_version = self.memory.summary_version
+            self._cached_tokens = 0
+        reused = self._cached_tokens
+        payload = self.payload()
+        parts: List[str] = []
+        done: Dict[str, Any] = {}
+        try:
+            if not use_http:
+                raise OllamaUnavailable("backend cli")
+            for chunk in self.client.chat_stream(model, payload):
+                tok = (chunk.get("message") or {}).get("content") or ""
+                if tok:
+                    stats.setdefault("ttft_s", time.perf_counter() - t0)
+                    parts.append(tok)
+                    yield tok
+                if chunk.get("done"):
+                    done = chunk
+                    record_done(stats, chunk, t0)
+        except OllamaUnavailable:
+            if parts:
+                raise
+            stats["backend"] = "cli"
+            out = run_ollama_cli(model, self.as_prompt())
+            stats["ttft_s"] = stats["total_s"] = time.perf_counter() - t0
+            parts.append(out)
+            yield out
+        except OllamaError as e:
+            stats["error"] = str(e)
+            err = f"[Errore Ollama] {e}"
+            parts.append(err)
+            yield err
+        finally:
+            # anche se lo stream viene interrotto la storia resta alternata user/assistant
+            self.memory.append("assistant", "".join(parts))
+            if done:
+                evaluated = int(done.get("prompt_eval_count") or 0)
+                if reused == 0 and evaluated:
+                    # prompt valutato per intero: conteggio reale per calibrare la stima
+                    self.memory.estimator.calibrate(sum(len(m["content"]) for m in payload), evaluated)
+                stats["reused_tokens"] = reused
+                self.totals["prompt_eval"] += evaluated
+                self.totals["reused"] += reused
+                self._cached_tokens = reused + evaluated + int(done.get("eval_count") or 0)
+            else:
+                self._cached_tokens = 0
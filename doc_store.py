@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import re
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from lazy_import import LazyModule, available
+from ollama_client import OllamaClient, OllamaError
+from retrieval import BM25Index, Chunk, chunk_document, tokenize
+
+np = LazyModule("numpy")   # importato al primo uso; senza numpy resta solo la ricerca lessicale
+
+Embedder = Callable[[List[str]], List[List[float]]]
+# (documento, etichetta posizione, testo)
+DocChunk = Tuple[str, str, str]
+
+RRF_K = 60
+
+# =====================
+# EMBEDDERS
+# =====================
+class OllamaEmbedder:
+    def __init__(self, client: OllamaClient, model: str, batch_size: int = 32):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        out: List[List[float]] = []
+        for i in range(0, len(texts), self.batch_size):
+            out.extend(self.client.embed(self.model, texts[i:i + self.batch_size]))
+        return out
+
+class HashEmbedder:
+    # embedder locale deterministico (feature hashing): per test e benchmark senza server
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.model = f"hash-{dim}"
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        out = []
+        for t in texts:
+            v = [0.0] * self.dim
+            for tok in tokenize(t):
+                h = int.from_bytes(hashlib.md5(tok.encode("utf-8")).digest()[:4], "little")
+                v[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+            out.append(v)
+        return out
+
+# =====================
+# DOCUMENT STORE
+# =====================
+def safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name).strip("._") or "default"
+
+class DocumentStore:
+    # Più documenti nello stesso corpus: blocchi + indice BM25 + matrice di embedding
+    # (float32, normalizzata) salvata su disco come <corpus>.npy / <corpus>.json.
+    def __init__(self, name: str = "default", directory: Optional[str] = None,
+                 embedder: Optional[Embedder] = None):
+        self.name = safe_name(name)
+        self.directory = directory
+        self.embedder = embedder
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.chunks: List[DocChunk] = []
+        self.vectors = None   # np.ndarray (n_chunks, dim) oppure None
+        self.index: Optional[BM25Index] = None
+        self.timings: Dict[str, float] = {}
+        self.embed_error: Optional[str] = None
+
+    @property
+    def embedder_name(self) -> str:
+        return getattr(self.embedder, "model", "") if self.embedder is not None else ""
+
+    def _paths(self) -> Tuple[str, str]:
+        base = os.path.join(self.directory or "", self.name)
+        return base + ".json", base + ".npy"
+
+    def clear(self) -> None:
+        self.docs.clear()
+        self.chunks = []
+        self.vectors = None
+        self.index = None
+
+    def switch(self, name: str) -> bool:
+        self.clear()
+        self.name = safe_name(name)
+        return self.load()
+
+    # ---- embedding ----
+    def _embed(self, texts: List[str], record: bool = True):
+        if not available(np) or self.embedder is None or not texts:
+            return None
+        t0 = time.perf_counter()
+        try:
+            raw = self.embedder(texts)
+        except (OllamaError, OSError, ValueError) as e:
+            self.embed_error = str(e)
+            return None
+        if len(raw) != len(texts) or not raw or not raw[0]:
+            self.embed_error = "embedding vuoti"
+            return None
+        m = np.asarray(raw, dtype=np.float32)
+        norms = np.linalg.norm(m, axis=1, keepdims=True)
+        m /= np.where(norms == 0, 1.0, norms)
+        dt = time.perf_counter() - t0
+        if record:
+            self.timings["embed_s"] = dt
+            self.timings["embed_chunks_per_s"] = len(texts) / dt if dt > 0 else 0.0
+        else:
+            self.timings["query_embed_ms"] = dt * 1000
+        self.embed_error = None
+        return m
+
+    def _append_vectors(self, new, n_new: int) -> None:
+        if not available(np):
+            return
+        old_n = len(self.chunks) - n_new
+        if new is None and self.vectors is None:
+            return
+        dim = new.shape[1] if new is not None else self.vectors.shape[1]
+        if new is None:
+            new = np.zeros((n_new, dim), dtype=np.float32)
+        if self.vectors is None or self.vectors.shape[1] != dim:
+            # nessuna matrice o cambio di modello di embedding (i vecchi vettori non sono
+            # confrontabili): i blocchi già presenti si ricalcolano col modello attuale
+            old = self._embed([f"{label}\n{body}" for _d, label, body in self.chunks[:old_n]]) if old_n else None
+            reembedded = old is not None and old.shape[1] == dim
+            if not reembedded:
+                old = np.zeros((old_n, dim), dtype=np.float32)
+            for d in self.docs.values():
+                d["embedded"] = reembedded
+            self.vectors = np.vstack([old, new])
+        else:
+            self.vectors = np.vstack([self.vectors, new])
+
+    # ---- documenti ----
+    def add(self, name: str, text: str, ftype: str, path: str = "",
+            chunks: Optional[List[Chunk]] = None, vectors: Any = None, title: Optional[str] = None) -> Dict[str, Any]:
+        # name: chiave del documento (per i file il percorso assoluto, così due README.md
+        # di cartelle diverse non si sovrascrivono); title: nome mostrato nei prompt e in /docs.
+        # vectors: embedding già calcolati (cache dei file) per gli stessi blocchi
+        if name in self.docs:
+            self.remove(name)
+        chunks = chunks if chunks is not None else chunk_document(text, ftype)
+        self.chunks.extend((name, label, body) for label, body in chunks)
+        if vectors is None or len(vectors) != len(chunks):
+            vectors = self._embed([f"{label}\n{body}" for label, body in chunks])
+        self._append_vectors(vectors, len(chunks))
+        self.docs[name] = {"name": title or name, "path": path, "type": ftype, "chunks": len(chunks),
+                           "chars": len(text), "embedded": vectors is not None}
+        self._reindex()
+        self.save()
+        return self.docs[name]
+
+    def remove(self, name: str) -> None:
+        keep = [i for i, c in enumerate(self.chunks) if c[0] != name]
+        self.chunks = [self.chunks[i] for i in keep]
+        if self.vectors is not None:
+            self.vectors = self.vectors[keep]
+        self.docs.pop(name, None)
+        self._reindex()
+
+    def display_names(self) -> Dict[str, str]:
+        # chiave -> nome breve; il percorso completo solo se due documenti si chiamano uguale
+        short = {key: d.get("name") or key for key, d in self.docs.items()}
+        counts = Counter(short.values())
+        return {key: n if counts[n] == 1 else key for key, n in short.items()}
+
+    def doc_vectors(self, name: str) -> Any:
+        if self.vectors is None or not self.docs.get(name, {}).get("embedded"):
+            return None
+        return self.vectors[[i for i, c in enumerate(self.chunks) if c[0] == name]]
+
+    def _reindex(self) -> None:
+        names = self.display_names()
+        self.index = (BM25Index([(f"{names.get(doc, doc)} {label}", body) for doc, label, body in self.chunks])
+                      if self.chunks else None)
+        if self.index is not None:
+            self.timings["bm25_build_ms"] = self.index.build_ms
+
+    # ---- ricerca ibrida ----
+    def search(self, query: str, k: int = 5, candidates: int = 30) -> List[DocChunk]:
+        if not self.chunks:
+            return []
+        t0 = time.perf_counter()
+        ranks: Dict[int, float] = {}
+        if self.index is not None:
+            for r, (_s, i) in enumerate(self.index.search(query, candidates)):
+                ranks[i] = ranks.get(i, 0.0) + 1.0 / (RRF_K + r + 1)
+        if self.vectors is not None and self.vectors.shape[0] == len(self.chunks):
+            q = self._embed([query], record=False)
+            if q is not None and q.shape[1] == self.vectors.shape[1]:
+                sims = self.vectors @ q[0]
+                n = min(candidates, len(sims))
+                top = np.argpartition(-sims, n - 1)[:n]
+                for r, i in enumerate(top[np.argsort(-sims[top])]):
+                    if sims[i] > 0:
+                        ranks[int(i)] = ranks.get(int(i), 0.0) + 1.0 / (RRF_K + r + 1)
+        best = sorted(ranks, key=lambda i: -ranks[i])[:k]
+        self.timings["last_query_ms"] = (time.perf_counter() - t0) * 1000
+        # in ordine di documento/posizione, più leggibile per il modello
+        return [self.chunks[i] for i in sorted(best)]
+
+    # ---- persistenza ----
+    def save(self) -> None:
+        if not self.directory:
+            return
+        meta_path, vec_path = self._paths()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            meta = {"docs": self.docs, "chunks": self.chunks, "embedder": self.embedder_name}
+            with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(meta_path + ".tmp", meta_path)
+            if available(np) and self.vectors is not None:
+                with open(vec_path + ".tmp", "wb") as f:
+                    np.save(f, self.vectors)
+                os.replace(vec_path + ".tmp", vec_path)
+            elif os.path.exists(vec_path):
+                os.remove(vec_path)
+        except OSError:
+            pass
+
+    def load(self) -> bool:
+        if not self.directory:
+            return False
+        meta_path, vec_path = self._paths()
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self.docs = meta.get("docs") or {}
+        self.chunks = [tuple(c) for c in meta.get("chunks") or []]
+        self.vectors = None
+        if available(np) and os.path.exists(vec_path) and meta.get("embedder") == self.embedder_name:
+            try:
+                v = np.load(vec_path)
+                if v.shape[0] == len(self.chunks):
+                    self.vectors = v
+            except (OSError, ValueError):
+                pass
+        if self.vectors is None:
+            # vettori di un altro modello o mancanti: nessun documento ha embedding validi
+            for d in self.docs.values():
+                d["embedded"] = False
+        self._reindex()
+        return True
+
+def format_doc_chunks(chunks: List[DocChunk], names: Optional[Dict[str, str]] = None) -> str:
+    names = names or {}
+    return "\n\n".join(f"[{names.get(doc, doc)} · {label}]\n{body}" for doc, label, body in chunks)
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from lazy_import import LazyModule, available
+
+np = LazyModule("numpy")   # importato al primo uso; senza numpy si mettono in cache solo testo e blocchi
+
+# =====================
+# CONFIG
+# =====================
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".botia_cache", "files")
+DEFAULT_MAX_BYTES = 500_000_000
+FORMAT_VERSION = 1
+HASH_BLOCK = 1024 * 1024
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# =====================
+# CACHE DOCUMENTI ANALIZZATI
+# =====================
+class ParsedFileCache:
+    # Testo estratto + blocchi (+ embedding) per file già caricati: un nuovo /file sullo
+    # stesso documento salta pypdf/python-docx. Chiave = percorso + dimensione + mtime
+    # (+ hash del contenuto se hash_content); formato compatto: JSON compresso con zlib
+    # e vettori .npy accanto. Eviction LRU (mtime = ultimo uso) sul totale dei byte.
+    def __init__(self, directory: Optional[str] = DEFAULT_CACHE_DIR,
+                 max_bytes: int = DEFAULT_MAX_BYTES, hash_content: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "load_s_saved": 0.0}
+
+    def key(self, path: str, opts: Optional[Dict[str, str]] = None) -> Optional[str]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        raw: Dict[str, Any] = {
+            "v": FORMAT_VERSION,
+            "path": os.path.normcase(os.path.abspath(path)),
+            "size": st.st_size,
+            "mtime": st.st_mtime_ns,
+            "opts": opts or {},
+        }
+        if self.hash_content:
+            try:
+                raw["sha256"] = file_digest(path)
+            except OSError:
+                return None
+        return hashlib.sha256(json.dumps(raw, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory or "", key[:2], key)
+        return base + ".json.z", base + ".npy"
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        files = []
+        if not self.directory or not os.path.isdir(self.directory):
+            return files
+        for root, _dirs, names in os.walk(self.directory):
+            for n in names:
+                p = os.path.join(root, n)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+        return files
+
+    # ---- API ----
+    def get(self, key: Optional[str], embedder_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        if not key or not self.directory:
+            return None
+        meta_path, vec_path = self._paths(key)
+        with self._lock:
+            try:
+                with open(meta_path, "rb") as f:
+                    entry = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+            except (OSError, ValueError, zlib.error):
+                self.counters["misses"] += 1
+                return None
+            entry["chunks"] = [tuple(c) for c in entry.get("chunks") or []]
+            entry["vectors"] = None
+            if available(np) and embedder_name and entry.get("embedder") == embedder_name and os.path.exists(vec_path):
+                try:
+                    v = np.load(vec_path)
+                    if v.shape[0] == len(entry["chunks"]):
+                        entry["vectors"] = v
+                    os.utime(vec_path)
+                except (OSError, ValueError):
+                    pass
+            try:
+                os.utime(meta_path)   # mtime = ultimo uso, per l'eviction LRU
+            except OSError:
+                pass
+            self.counters["hits"] += 1
+            self.counters["load_s_saved"] += entry.get("load_s", 0.0)
+            return entry
+
+    def put(self, key: Optional[str], text: str, ftype: str, chunks: List[Tuple[str, str]],
+            load_s: float = 0.0, vectors: Any = None, embedder_name: Optional[str] = None) -> None:
+        if not key or not self.directory:
+            return
+        meta_path, vec_path = self._paths(key)
+        entry = {"text": text, "type": ftype, "chunks": chunks, "load_s": load_s,
+                 "embedder": embedder_name if vectors is not None else None, "created": time.time()}
+        data = zlib.compress(json.dumps(entry, ensure_ascii=False).encode("utf-8"), 6)
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+                with open(meta_path + ".tmp", "wb") as f:
+                    f.write(data)
+                os.replace(meta_path + ".tmp", meta_path)
+                if available(np) and vectors is not None:
+                    with open(vec_path + ".tmp", "wb") as f:
+                        np.save(f, vectors)
+                    os.replace(vec_path + ".tmp", vec_path)
+                elif os.path.exists(vec_path):
+                    os.remove(vec_path)
+            except OSError:
+                return
+            self._evict()
+
+    def _evict(self) -> None:
+        # si scende al 90% del limite eliminando i file usati meno di recente
+        files = sorted(self._files())
+        total = sum(size for _m, size, _p in files)
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for _mtime, size, p in files:
+            if total <= target:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            total -= size
+            self.counters["evictions"] += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            n = 0
+            for _m, _size, p in self._files():
+                try:
+                    os.remove(p)
+                    n += p.endswith(".json.z")
+                except OSError:
+                    pass
+            return n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self.counters)
+            files = self._files()
+            c["entries"] = sum(1 for _m, _s, p in files if p.endswith(".json.z"))
+            c["disk_bytes"] = sum(size for _m, size, _p in files)
+            return c
@@ -0,0 +1,222 @@
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+# =====================
+# CONFIG
+# =====================
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "canvas"}
+BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd", "table", "tr", "td", "th",
+    "h1", "h2", "h3", "h4", "h5", "h6", "pre", "blockquote", "figure", "figcaption", "header", "footer",
+    "nav", "aside", "form", "br", "hr",
+}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+MAIN_TAGS = {"main", "article"}
+BOILER_TAGS = {"nav", "aside", "form", "button", "select", "menu", "dialog", "header", "footer"}
+# confronto su un token intero di class/id/role ("site-footer", "related-posts", "navigation"),
+# non su sottostringhe: classi di stato come "has-sidebar" o "social-enabled" non contano
+BOILER_RE = re.compile(
+    r"(?:(?:site|main|global|top|bottom|page|primary|secondary|mobile|header|footer|post|entry)[-_])?"
+    r"(?:nav|navbar|navigation|menu|footer|sidebar|cookies?|consent|gdpr|banner|breadcrumbs?|share|sharing|"
+    r"social|related|comments?|promo|advert|ads?|newsletter|subscribe|popup|modal|skip-link|toolbar|"
+    r"pagination|complementary|contentinfo)"
+    r"(?:[-_](?:bar|links?|list|wrap|wrapper|container|area|box|widget|menu|nav|notice|banner|buttons?|"
+    r"icons?|posts|section))?", re.IGNORECASE)
+MIN_BLOCK_CHARS = 25              # blocchi più corti (fuori da main/article) sono quasi sempre menu/etichette
+MAX_LINK_DENSITY = 0.5            # testo per metà dentro <a>: elenco di link, non contenuto
+MIN_MAIN_CHARS = 200              # sotto questa soglia main/article non basta da solo
+MIN_CONTENT_CHARS = 100           # meno testo tenuto di così: meglio tutto il testo della pagina
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+
+def sniff_charset(head: bytes) -> Optional[str]:
+    # <meta charset="..."> / http-equiv nei primi KB della pagina
+    m = META_CHARSET_RE.search(head[:4096])
+    return m.group(1).decode("ascii", "ignore").lower() if m else None
+
+# =====================
+# ESTRATTORE INCREMENTALE
+# =====================
+class HtmlTextExtractor(HTMLParser):
+    # Tokenizer della stdlib senza albero DOM: si alimenta a pezzi mentre la pagina
+    # arriva e si ferma appena ha raccolto max_chars di testo (done = True), così
+    # chi scarica può chiudere la connessione senza leggere il resto.
+    def __init__(self, max_chars: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts: List[str] = []
+        self.size = 0
+        self.done = False
+        self._skip = 0
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if tag in SKIP_TAGS:
+            self._skip += 1
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in SKIP_TAGS and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data: str) -> None:
+        if self._skip or self.done:
+            return
+        data = data.strip()
+        if not data:
+            return
+        self.parts.append(data)
+        self.size += len(data) + 1
+        if self.max_chars is not None and self.size > self.max_chars:
+            self.done = True
+
+    def feed(self, data: str) -> None:
+        if not self.done:
+            super().feed(data)
+
+    def text(self) -> str:
+        return " ".join(" ".join(self.parts).split())
+
+# =====================
+# CONTENUTO PRINCIPALE (stile readability)
+# =====================
+class ContentExtractor(HTMLParser):
+    # Come HtmlTextExtractor ma a blocchi: scarta menu, banner cookie, footer e liste di
+    # link (tag semantici, class/id/role, densità di link, lunghezza) e tiene il corpo
+    # dell'articolo. Solo i blocchi tenuti contano per max_chars, quindi lo stop anticipato
+    # non si esaurisce sulla navigazione iniziale. Se l'euristica tiene troppo poco, text()
+    # ripiega sul testo completo raccolto in parallelo da un HtmlTextExtractor.
+    def __init__(self, max_chars: Optional[int] = None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.blocks: List[Tuple[str, bool]] = []       # (testo, dentro main/article)
+        self.stats: Dict[str, int] = {"kept_chars": 0, "dropped_chars": 0}
+        self.done = False
+        self._stack: List[Tuple[str, bool, bool]] = []  # (tag, boilerplate, main)
+        self._buf: List[str] = []
+        self._link_chars = 0
+        self._in_link = 0
+        self._heading = 0
+        self._skip = 0
+        self._plain = HtmlTextExtractor(max_chars)
+
+    def _in_main(self) -> bool:
+        return any(m for _t, _b, m in self._stack)
+
+    def _is_boiler(self) -> bool:
+        # dall'elemento più interno verso l'esterno: un main/article sopra vale più del
+        # boilerplate ancora più in alto (<body class="sidebar"><main>...)
+        for _t, boiler, main in reversed(self._stack):
+            if boiler:
+                return True
+            if main:
+                return False
+        return False
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if tag in SKIP_TAGS:
+            self._skip += 1
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag == "a":
+            self._in_link += 1
+        if tag in HEADING_TAGS:
+            self._heading += 1
+        if tag in VOID_TAGS:
+            return
+        a = {k: v or "" for k, v in attrs}
+        marked = any(BOILER_RE.fullmatch(token)
+                     for token in " ".join((a.get("class", ""), a.get("id", ""), a.get("role", ""))).split())
+        boiler = tag in BOILER_TAGS or marked or a.get("aria-hidden") == "true" or "hidden" in a
+        if tag in {"header", "footer"} and self._in_main() and not marked:
+            boiler = False   # intestazione dell'articolo, non del sito
+        main = tag in MAIN_TAGS or a.get("role") == "main"
+        self._stack.append((tag, boiler, main))
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in SKIP_TAGS:
+            if self._skip:
+                self._skip -= 1
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag == "a" and self._in_link:
+            self._in_link -= 1
+        if tag in HEADING_TAGS and self._heading:
+            self._heading -= 1
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                del self._stack[i:]
+                break
+
+    def handle_data(self, data: str) -> None:
+        if self._skip or self.done:
+            return
+        self._plain.handle_data(data)
+        if not data.strip():
+            return
+        self._buf.append(data)
+        if self._in_link:
+            self._link_chars += len(data.strip())
+
+    def _flush(self) -> None:
+        text = " ".join(" ".join(self._buf).split())
+        links, self._buf, self._link_chars = self._link_chars, [], 0
+        if not text:
+            return
+        in_main = self._in_main()
+        keep = not self._is_boiler() and links / len(text) <= MAX_LINK_DENSITY
+        if keep and len(text) < MIN_BLOCK_CHARS and not self._heading and not in_main:
+            keep = False
+        if not keep:
+            self.stats["dropped_chars"] += len(text)
+            return
+        self.blocks.append((text, in_main))
+        self.stats["kept_chars"] += len(text) + 1
+        if self.max_chars is not None and self.stats["kept_chars"] > self.max_chars:
+            self.done = True
+
+    def feed(self, data: str) -> None:
+        if not self.done:
+            super().feed(data)
+
+    def close(self) -> None:
+        super().close()
+        self._flush()
+
+    def text(self) -> str:
+        # se la pagina dichiara main/article con abbastanza testo, si tiene solo quello
+        main = [t for t, m in self.blocks if m]
+        if sum(len(t) for t in main) >= MIN_MAIN_CHARS:
+            return "\n".join(main)
+        kept = "\n".join(t for t, _m in self.blocks)
+        if len(kept) < MIN_CONTENT_CHARS:
+            plain = self._plain.text()
+            if len(plain) > len(kept):
+                return plain
+        return kept
+
+def extract_content(html: str, max_chars: Optional[int] = None, piece: int = 64 * 1024) -> str:
+    p = ContentExtractor(max_chars)
+    for i in range(0, len(html), piece):
+        p.feed(html[i:i + piece])
+        if p.done:
+            break
+    p.close()
+    return p.text()
+
+def extract_text(html: str, max_chars: Optional[int] = None, piece: int = 64 * 1024) -> str:
+    p = HtmlTextExtractor(max_chars)
+    for i in range(0, len(html), piece):
+        p.feed(html[i:i + piece])
+        if p.done:
+            break
+    return p.text()
+
+def soup_text(html: str) -> str:
+    # percorso storico (albero BeautifulSoup completo), tenuto per confronto nei benchmark
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    return soup.get_text(separator=" ", strip=True)
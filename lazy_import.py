@@ -0,0 +1,50 @@
+import importlib
+import threading
+from typing import Any, List, Optional
+
+# moduli pesanti dichiarati con LazyModule: warm_up() li può caricare in anticipo
+_registry: List["LazyModule"] = []
+
+class LazyModule:
+    # Segnaposto di un modulo: l'import vero avviene al primo attributo usato, così
+    # l'avvio non paga pypdf, python-docx, requests, numpy... se il comando che li
+    # usa non viene mai chiamato. Solo attributi "_": tutto il resto è del modulo vero
+    # (np.load, np.save...); per sapere se è installato si usa available(modulo).
+    def __init__(self, name: str, warm: bool = True):
+        self._name = name
+        self._module: Optional[Any] = None
+        self._missing = False
+        if warm:
+            _registry.append(self)
+
+    def _load(self) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)   # thread-safe: lock per modulo
+        return self._module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._name} ({'caricato' if self._module is not None else 'non caricato'})>"
+
+def available(m: LazyModule) -> bool:
+    # al posto del vecchio "try: import ... except ImportError": importa se serve
+    if m._module is None and not m._missing:
+        try:
+            m._load()
+        except ImportError:
+            m._missing = True
+    return not m._missing
+
+def warm_up(delay_s: float = 0.0) -> threading.Thread:
+    # import in background dopo che il prompt è comparso: il primo /pdf o /web non aspetta
+    def run() -> None:
+        if delay_s:
+            threading.Event().wait(delay_s)
+        for m in list(_registry):
+            available(m)
+
+    t = threading.Thread(target=run, name="warm-up", daemon=True)
+    t.start()
+    return t
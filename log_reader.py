@@ -0,0 +1,320 @@
+import codecs
+import collections
+import datetime
+import mmap
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# =====================
+# CONFIG
+# =====================
+SAMPLE_BYTES = 64 * 1024
+BLOCK_BYTES = 4 * 1024 * 1024
+DEFAULT_TAIL = 500              # righe mostrate se il file supera il limite e non ci sono opzioni
+MAX_WINDOW_CHARS = 200_000      # testo massimo restituito per una finestra
+MAX_GREP_MATCHES = 2000
+
+OPTION_RE = re.compile(r"""\s--(tail|since|grep)\s+("([^"]*)"|'([^']*)'|(\d{4}-\d{2}-\d{2}[ T]\d{1,2}:\d{2}(?::\d{2})?)|(\S+))""")
+TS_PATTERNS = [
+    (re.compile(r"(\d{4})-(\d{2})-(\d{2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?"), ("y", "m", "d")),
+    (re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})(?:[ ,]+(\d{1,2}):(\d{2})(?::(\d{2}))?)?"), ("d", "m", "y")),
+]
+
+# =====================
+# OPZIONI /file
+# =====================
+def parse_file_args(arg: str) -> Tuple[str, Dict[str, str]]:
+    # "/file C:\\logs\\app.log --tail 200 --grep \"timeout|refused\""
+    m = OPTION_RE.search(arg)
+    if not m:
+        return arg.strip(), {}
+    path, rest = arg[:m.start()].strip(), arg[m.start():]
+    opts = {}
+    for o in OPTION_RE.finditer(rest):
+        opts[o.group(1)] = next(g for g in o.groups()[2:] if g is not None)
+    return path, opts
+
+def parse_timestamp(text: str) -> Optional[datetime.datetime]:
+    for rx, order in TS_PATTERNS:
+        m = rx.search(text)
+        if not m:
+            continue
+        parts = dict(zip(order, m.groups()[:3]))
+        h, mi, sec = (int(g) if g else 0 for g in m.groups()[3:6])
+        try:
+            return datetime.datetime(int(parts["y"]), int(parts["m"]), int(parts["d"]), h, mi, sec)
+        except ValueError:
+            continue
+    return None
+
+# =====================
+# ENCODING
+# =====================
+def detect_encoding(sample: bytes) -> str:
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith(codecs.BOM_UTF16_LE):
+        return "utf-16-le"
+    if sample.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16-be"
+    if len(sample) >= 4:
+        # UTF-16 senza BOM (export eventi Windows): metà dei byte sono zeri
+        even, odd = sample[0::2], sample[1::2]
+        if odd.count(0) > len(odd) * 0.4 and even.count(0) < len(even) * 0.1:
+            return "utf-16-le"
+        if even.count(0) > len(even) * 0.4 and odd.count(0) < len(odd) * 0.1:
+            return "utf-16-be"
+    try:
+        sample.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # il campione può tagliare un carattere multibyte a metà
+        if e.start >= len(sample) - 3:
+            return "utf-8"
+    return "cp1252"
+
+def _unit(encoding: str) -> int:
+    return 2 if encoding.startswith("utf-16") else 1
+
+def _bom_len(mm: mmap.mmap, encoding: str) -> int:
+    if encoding == "utf-8-sig":
+        return 3
+    if encoding.startswith("utf-16") and mm[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        return 2
+    return 0
+
+def _codec(encoding: str) -> str:
+    return "utf-8" if encoding == "utf-8-sig" else encoding
+
+# =====================
+# LOG READER (mmap)
+# =====================
+class LogReader:
+    # Il file è mappato in memoria e mai letto per intero: si decodifica solo la finestra
+    # selezionata (tail/since/grep), quindi la memoria resta piatta anche con log da GB.
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._f = open(path, "rb")
+        self.mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        sample = self.mm[:SAMPLE_BYTES] if self.mm is not None else b""
+        self.encoding = detect_encoding(sample)
+        self.unit = _unit(self.encoding)
+        self.nl = "\n".encode(_codec(self.encoding))
+        self.start = _bom_len(self.mm, self.encoding) if self.mm is not None else 0
+
+    def close(self) -> None:
+        if self.mm is not None:
+            self.mm.close()
+        self._f.close()
+
+    def __enter__(self) -> "LogReader":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def decode(self, data: bytes) -> str:
+        return data.decode(_codec(self.encoding), errors="replace")
+
+    # ---- navigazione per righe ----
+    def _find_nl(self, pos: int, end: int) -> int:
+        while True:
+            i = self.mm.find(self.nl, pos, end)
+            if i < 0 or (i - self.start) % self.unit == 0:
+                return i
+            pos = i + 1
+
+    def _rfind_nl(self, start: int, end: int) -> int:
+        while True:
+            i = self.mm.rfind(self.nl, start, end)
+            if i < 0 or (i - self.start) % self.unit == 0:
+                return i
+            end = i + len(self.nl) - 1
+
+    def line_start(self, pos: int) -> int:
+        # inizio della riga che contiene pos
+        if pos <= self.start:
+            return self.start
+        i = self._rfind_nl(self.start, pos)
+        return self.start if i < 0 else i + len(self.nl)
+
+    def next_line(self, pos: int) -> int:
+        i = self._find_nl(pos, self.size)
+        return self.size if i < 0 else i + len(self.nl)
+
+    def tail_offset(self, n: int, end: Optional[int] = None) -> int:
+        end = self.size if end is None else end
+        pos = end
+        # un eventuale a capo finale non conta come riga
+        if pos - len(self.nl) >= self.start and self.mm[pos - len(self.nl):pos] == self.nl:
+            pos -= len(self.nl)
+        for _ in range(n):
+            i = self._rfind_nl(self.start, pos)
+            if i < 0:
+                return self.start
+            pos = i
+        return pos + len(self.nl)
+
+    def line_number(self, offset: int) -> int:
+        # conteggio a blocchi: tempo lineare, memoria costante
+        n = 1
+        pos = self.start
+        while pos < offset:
+            end = min(offset, pos + BLOCK_BYTES)
+            n += self.mm[pos:end].count(self.nl) if self.unit == 1 else self.decode(self.mm[pos:end]).count("\n")
+            pos = end
+        return n
+
+    def since_offset(self, since: datetime.datetime, probe_lines: int = 20) -> int:
+        # ricerca binaria sugli offset, assumendo log in ordine cronologico
+        lo, hi = self.start, self.size
+        while hi - lo > 4096:
+            mid = self.line_start(lo + (hi - lo) // 2)
+            if mid <= lo:
+                mid = self.next_line(lo + (hi - lo) // 2)
+            if mid >= hi:
+                break
+            ts = None
+            pos = mid
+            for _ in range(probe_lines):
+                if pos >= self.size:
+                    break
+                nxt = self.next_line(pos)
+                ts = parse_timestamp(self.decode(self.mm[pos:nxt]))
+                if ts is not None:
+                    break
+                pos = nxt
+            if ts is None or ts >= since:
+                hi = mid
+            else:
+                lo = pos if pos > lo else self.next_line(lo)
+        # ultimo tratto lineare
+        pos = self.line_start(lo)
+        while pos < self.size:
+            nxt = self.next_line(pos)
+            ts = parse_timestamp(self.decode(self.mm[pos:nxt]))
+            if ts is not None and ts >= since:
+                return pos
+            pos = nxt
+        return self.size
+
+    def iter_blocks(self, start: int, end: int) -> Iterator[Tuple[int, str]]:
+        # testo decodificato a blocchi allineati a fine riga; "\r\n" diventa "\n" (stesso
+        # numero di righe) così "$" nelle regex funziona anche sui log Windows
+        pos = start
+        while pos < end:
+            block_end = min(end, pos + BLOCK_BYTES)
+            if block_end < end:
+                cut = self._rfind_nl(pos, block_end)
+                block_end = cut + len(self.nl) if cut >= pos else self.next_line(block_end)
+            text = self.decode(self.mm[pos:block_end])
+            yield pos, text.replace("\r\n", "\n") if "\r" in text else text
+            pos = block_end
+
+    def grep(self, rx: "re.Pattern[str]", start: int, end: int) -> Iterator[Tuple[int, str]]:
+        # (numero di riga, riga) per le righe con un'occorrenza: la regex gira sul blocco
+        # intero e gli offset delle occorrenze si riportano alle righe. Righe divise solo
+        # su "\n", come line_number() (splitlines spezzerebbe anche su \x0b, \u2028...)
+        lineno = self.line_number(start)
+        for _pos, text in self.iter_blocks(start, end):
+            at, at_line = 0, lineno
+            m = rx.search(text)
+            while m is not None:
+                ls = text.rfind("\n", 0, m.start()) + 1
+                le = text.find("\n", m.start())
+                le = len(text) if le < 0 else le
+                line = text[ls:le]
+                # un'occorrenza che scavalca la riga non conta: si riverifica sulla riga sola
+                if m.end() <= le or rx.search(line):
+                    at_line += text.count("\n", at, ls)
+                    at = ls
+                    yield at_line, line
+                if le >= len(text):
+                    break
+                m = rx.search(text, le + 1)
+            lineno += text.count("\n")
+
+    def window(self, tail: Optional[int] = None, since: Optional[datetime.datetime] = None,
+               grep: Optional[str] = None, max_chars: int = MAX_WINDOW_CHARS,
+               max_matches: int = MAX_GREP_MATCHES) -> Tuple[str, Dict[str, Any]]:
+        info: Dict[str, Any] = {"encoding": self.encoding, "size": self.size, "truncated": False}
+        if self.mm is None:
+            return "", info
+        start, end = self.start, self.size
+        if since is not None:
+            start = self.since_offset(since)
+        if grep is None:
+            if tail is not None:
+                start = max(start, self.tail_offset(tail, end))
+            info["first_line"] = self.line_number(start)
+            data = self.mm[start:end]
+            if len(data) > max_chars * 4:
+                # finestra enorme: si tengono le righe finali
+                cut = self.line_start(end - max_chars * 4 + 1)
+                data, info["truncated"] = self.mm[cut:end], True
+                info["first_line"] = self.line_number(cut)
+            text = self.decode(data)
+            if len(text) > max_chars:
+                # taglio a caratteri riallineato all'inizio della riga successiva, così
+                # first_line corrisponde alla prima riga mostrata
+                skip = len(text) - max_chars
+                if text[skip - 1] != "\n":
+                    nl = text.find("\n", skip)
+                    if 0 <= nl < len(text) - 1:
+                        skip = nl + 1
+                info["first_line"] += text.count("\n", 0, skip)
+                text, info["truncated"] = text[skip:], True
+            return text, info
+
+        rx = re.compile(grep, re.IGNORECASE | re.MULTILINE)
+        found: List[Tuple[int, str]] = []
+        if tail is not None:
+            # con --tail interessano le ultime occorrenze: si scorre tutto tenendone al massimo tail
+            last: "collections.deque[Tuple[int, str]]" = collections.deque(maxlen=max(1, min(tail, max_matches)))
+            total = 0
+            for hit in self.grep(rx, start, end):
+                last.append(hit)
+                total += 1
+            found = list(last) if tail else []
+            info["truncated"] = total > tail and len(found) < tail
+        else:
+            used = 0
+            for lineno, line in self.grep(rx, start, end):
+                found.append((lineno, line))
+                used += len(line) + 8
+                if len(found) >= max_matches or used > max_chars:
+                    info["truncated"] = True
+                    break
+        matches = [f"L{lineno}: {line}" for lineno, line in found]
+        used = sum(len(m) + 1 for m in matches)
+        while used > max_chars and len(matches) > 1:
+            # tetto di caratteri: con --tail si perdono le occorrenze più vecchie
+            used -= len(matches.pop(0)) + 1
+            info["truncated"] = True
+        info["matches"] = len(matches)
+        return "\n".join(matches), info
+
+def read_log(path: str, opts: Dict[str, str], default_tail: int = DEFAULT_TAIL,
+             max_chars: int = MAX_WINDOW_CHARS) -> str:
+    tail = int(opts["tail"]) if opts.get("tail") else None
+    since = None
+    if opts.get("since"):
+        since = parse_timestamp(opts["since"])
+        if since is None:
+            raise ValueError(f"Timestamp non valido per --since: {opts['since']}")
+    grep = opts.get("grep")
+    if tail is None and since is None and grep is None:
+        tail = default_tail
+    with LogReader(path) as r:
+        text, info = r.window(tail, since, grep, max_chars)
+    sel = ", ".join(f"{k}={v}" for k, v in opts.items()) or f"tail={tail}"
+    head = f"(finestra log: {sel}; encoding {info['encoding']}; file {info['size'] / 1_000_000:.1f} MB"
+    if "first_line" in info:
+        head += f"; dalla riga {info['first_line']}"
+    if "matches" in info:
+        head += f"; {info['matches']} righe trovate"
+    if info["truncated"]:
+        head += "; finestra tagliata"
+    return head + ")\n" + text
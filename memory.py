@@ -0,0 +1,132 @@
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+Message = Dict[str, str]
+Summarizer = Callable[[str, List[Message]], str]
+
+# =====================
+# TOKEN ESTIMATE
+# =====================
+class TokenEstimator:
+    # Nessun tokenizer locale: stima caratteri/token, ricalibrata con i conteggi
+    # reali restituiti da Ollama (prompt_eval_count) quando il prompt è valutato per intero.
+    def __init__(self, chars_per_token: float = 4.0, alpha: float = 0.3):
+        self.chars_per_token = chars_per_token
+        self.alpha = alpha
+
+    def count(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + 1 if text else 0
+
+    def count_messages(self, messages: List[Message]) -> int:
+        # ~4 token di overhead per messaggio (ruolo + separatori del template)
+        return sum(self.count(m["content"]) + 4 for m in messages)
+
+    def calibrate(self, chars: int, tokens: int) -> None:
+        if chars <= 0 or tokens <= 0:
+            return
+        ratio = min(8.0, max(1.5, chars / tokens))
+        self.chars_per_token += self.alpha * (ratio - self.chars_per_token)
+
+# =====================
+# CONVERSATION MEMORY
+# =====================
+class ConversationMemory:
+    # I turni più recenti restano verbatim entro il budget; quelli più vecchi
+    # vengono compressi in un riassunto cumulativo aggiornato in background.
+    def __init__(
+        self,
+        token_budget: int,
+        max_messages: int = 200,
+        summarizer: Optional[Summarizer] = None,
+        estimator: Optional[TokenEstimator] = None,
+        low_watermark: float = 0.6,
+    ):
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.estimator = estimator or TokenEstimator()
+        self.low_watermark = low_watermark
+        self.messages: Deque[Message] = deque(maxlen=max_messages)
+        self.summary = ""
+        self.summary_version = 0
+        self._pending: List[Message] = []
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def turns(self) -> int:
+        return sum(1 for m in self.messages if m["role"] == "user")
+
+    def tokens(self) -> int:
+        return self.estimator.count_messages(list(self.messages)) + self.estimator.count(self.summary)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.messages.clear()
+            self._pending.clear()
+            self.summary = ""
+            self.summary_version += 1
+
+    def append(self, role: str, content: str) -> None:
+        if len(self.messages) == self.messages.maxlen:
+            self._evict(1)
+        self.messages.append({"role": role, "content": content})
+
+    def context(self) -> List[Message]:
+        if not self.summary:
+            return list(self.messages)
+        head = {"role": "system", "content": f"Riassunto della conversazione precedente:\n{self.summary}"}
+        return [head] + list(self.messages)
+
+    def trim(self) -> bool:
+        # si scende sotto la soglia bassa in un colpo solo: il prefisso dei messaggi
+        # cambia di rado e la KV cache del modello resta utile per più turni
+        if self.tokens() <= self.token_budget:
+            return False
+        target = int(self.token_budget * self.low_watermark)
+        n = 0
+        msgs = list(self.messages)
+        used = self.tokens()
+        # l'ultimo messaggio utente resta sempre
+        while n < len(msgs) - 1 and used > target:
+            used -= self.estimator.count(msgs[n]["content"]) + 4
+            n += 1
+        # non lasciare una risposta orfana in testa
+        while n < len(msgs) - 1 and msgs[n]["role"] != "user":
+            n += 1
+        self._evict(n)
+        return n > 0
+
+    def _evict(self, n: int) -> None:
+        evicted = [self.messages.popleft() for _ in range(min(n, len(self.messages)))]
+        if not evicted or self.summarizer is None:
+            return
+        with self._lock:
+            self._pending.extend(evicted)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._summarize_pending, daemon=True)
+                self._worker.start()
+
+    def _summarize_pending(self) -> None:
+        while True:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                previous, version = self.summary, self.summary_version
+                if not batch:
+                    self._worker = None
+                    return
+            try:
+                new_summary = self.summarizer(previous, batch).strip()
+            except Exception:
+                new_summary = ""
+            with self._lock:
+                # scartato se nel frattempo c'è stato un /reset
+                if new_summary and self.summary_version == version:
+                    self.summary = new_summary
+                    self.summary_version += 1
+
+    def wait_summary(self, timeout: Optional[float] = None) -> None:
+        with self._lock:
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
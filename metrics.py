@@ -0,0 +1,272 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from tracing import add_llm_spans, span
+
+# =====================
+# CONFIG
+# =====================
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160, 320)
+
+# nome -> (tipo, descrizione, bucket)
+METRICS: Dict[str, Tuple[str, str, Tuple[float, ...]]] = {
+    "botia_request_seconds": ("histogram", "Durata di un turno (comando o chat)", TIME_BUCKETS),
+    "botia_stage_seconds": ("histogram", "Durata per fase: parsing file, ricerca web, download, prompt, modello", TIME_BUCKETS),
+    "botia_ttft_seconds": ("histogram", "Tempo al primo token del modello", TIME_BUCKETS),
+    "botia_tokens_per_second": ("histogram", "Velocità di generazione del modello", RATE_BUCKETS),
+    "botia_prompt_chars": ("histogram", "Dimensione del prompt in caratteri", SIZE_BUCKETS),
+    "botia_prompt_tokens": ("histogram", "Token del prompt valutati dal modello", SIZE_BUCKETS),
+    "botia_requests_total": ("counter", "Turni per comando", ()),
+    "botia_errors_total": ("counter", "Turni finiti in errore per comando", ()),
+    "botia_cache_hits_total": ("counter", "Risposte servite dalla cache per comando e tipo di cache", ()),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# comando del turno in corso: le metriche registrate più in basso (cache, modello) lo ereditano
+_command: contextvars.ContextVar = contextvars.ContextVar("botia_command", default="-")
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    esc = [(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in esc) + "}"
+
+def _fmt_value(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+# =====================
+# REGISTRO
+# =====================
+class Metrics:
+    # Istogrammi a bucket fissi e contatori in memoria, un solo lock: registrare costa
+    # una bisect e un incremento, quindi si può lasciare sempre acceso. Esporta in
+    # formato Prometheus (server, batch) e come riepilogo leggibile (/stats).
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist: Dict[Tuple[str, Labels], List[float]] = {}   # [conteggi per bucket..., +Inf, somma]
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self.started = time.time()
+
+    # ---- registrazione ----
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        buckets = METRICS[name][2]
+        key = (name, _labels(labels))
+        i = bisect.bisect_left(buckets, value)
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = [0.0] * (len(buckets) + 2)
+            h[i] += 1
+            h[-1] += value
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        # ogni fase misurata è anche uno span della traccia della richiesta (se attiva)
+        with span(stage):
+            t0 = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe("botia_stage_seconds", time.perf_counter() - t0, stage=stage)
+
+    @contextmanager
+    def track(self, command: str) -> Iterator[Dict[str, Any]]:
+        # un turno: durata, conteggio ed errori (eccezione o rec["error"] = True dal chiamante)
+        token = _command.set(command)
+        rec: Dict[str, Any] = {"error": False}
+        t0 = time.perf_counter()
+        try:
+            yield rec
+        except Exception:
+            rec["error"] = True
+            raise
+        finally:
+            _command.reset(token)
+            self.observe("botia_request_seconds", time.perf_counter() - t0, command=command)
+            self.inc("botia_requests_total", command=command)
+            if rec["error"]:
+                self.inc("botia_errors_total", command=command)
+
+    def hit(self, cache: str) -> None:
+        self.inc("botia_cache_hits_total", command=_command.get(), cache=cache)
+
+    def record_llm(self, stats: Dict[str, Any], prompt_chars: int, elapsed_s: float) -> None:
+        # una chiamata al modello, dalle statistiche che Ollama restituisce a fine stream
+        self.observe("botia_stage_seconds", elapsed_s, stage="llm")
+        add_llm_spans(elapsed_s, stats, prompt_chars=prompt_chars)
+        self.observe("botia_prompt_chars", prompt_chars)
+        if "ttft_s" in stats:
+            self.observe("botia_ttft_seconds", stats["ttft_s"])
+        if stats.get("tokens_per_s"):
+            self.observe("botia_tokens_per_second", stats["tokens_per_s"])
+        if stats.get("prompt_eval_count"):
+            self.observe("botia_prompt_tokens", stats["prompt_eval_count"])
+
+    def reset(self) -> None:
+        with self._lock:
+            self._hist.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+    # ---- aggregazione tra processi (batch) ----
+    def drain(self) -> Dict[str, Any]:
+        with self._lock:
+            data = {"hist": [(n, list(l), h) for (n, l), h in self._hist.items()],
+                    "counters": [(n, list(l), v) for (n, l), v in self._counters.items()]}
+            self._hist = {}
+            self._counters = {}
+        return data
+
+    def merge(self, data: Optional[Dict[str, Any]]) -> None:
+        if not data:
+            return
+        with self._lock:
+            for name, labels, h in data["hist"]:
+                key = (name, tuple(tuple(x) for x in labels))
+                cur = self._hist.setdefault(key, [0.0] * len(h))
+                for i, v in enumerate(h):
+                    cur[i] += v
+            for name, labels, v in data["counters"]:
+                key = (name, tuple(tuple(x) for x in labels))
+                self._counters[key] = self._counters.get(key, 0.0) + v
+
+    # ---- lettura ----
+    def count(self, name: str, **match: Any) -> int:
+        # somma di un contatore sulle serie che hanno (almeno) queste etichette
+        want = set(_labels(match))
+        with self._lock:
+            return int(sum(v for (n, l), v in self._counters.items() if n == name and want <= set(l)))
+
+    @staticmethod
+    def _quantile(buckets: Tuple[float, ...], h: List[float], q: float) -> float:
+        # come histogram_quantile di Prometheus: interpolazione lineare dentro il bucket
+        total = sum(h[:-1])
+        if not total:
+            return 0.0
+        rank, seen = q * total, 0.0
+        for i, n in enumerate(h[:-1]):
+            if seen + n >= rank and n:
+                lo = buckets[i - 1] if i > 0 else 0.0
+                hi = buckets[i] if i < len(buckets) else buckets[-1]
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return buckets[-1]
+
+    def summary(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"uptime_s": round(time.time() - self.started), "histograms": {}, "counters": {}}
+        with self._lock:
+            hist = {k: list(v) for k, v in self._hist.items()}
+            counters = dict(self._counters)
+        for (name, labels), h in hist.items():
+            buckets = METRICS[name][2]
+            n = sum(h[:-1])
+            out["histograms"].setdefault(name, {})[",".join(v for _k, v in labels) or "-"] = {
+                "count": int(n), "avg": h[-1] / n if n else 0.0,
+                "p50": self._quantile(buckets, h, 0.5), "p95": self._quantile(buckets, h, 0.95)}
+        for (name, labels), v in counters.items():
+            out["counters"].setdefault(name, {})[",".join(v2 for _k, v2 in labels) or "-"] = int(v)
+        return out
+
+    def prometheus(self, gauges: Optional[List[Tuple[str, str, Dict[str, Any], float]]] = None) -> str:
+        # formato testo 0.0.4; gauges = [(nome, descrizione, etichette, valore)] dal chiamante
+        with self._lock:
+            hist = {k: list(v) for k, v in self._hist.items()}
+            counters = dict(self._counters)
+        lines: List[str] = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            series = sorted((l, h) for (n, l), h in (hist.items() if kind == "histogram" else counters.items())
+                            if n == name)
+            if not series:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, val in series:
+                if kind == "counter":
+                    lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(val)}")
+                    continue
+                cum = 0.0
+                for i, le in enumerate(buckets):
+                    cum += val[i]
+                    lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', _fmt_value(le)))} {_fmt_value(cum)}")
+                cum += val[len(buckets)]
+                lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {_fmt_value(cum)}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(val[-1])}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {_fmt_value(cum)}")
+        seen = set()
+        for name, help_text, labels, value in gauges or []:
+            if name not in seen:
+                seen.add(name)
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+            lines.append(f"{name}{_fmt_labels(_labels(labels))} {_fmt_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# =====================
+# RIEPILOGO (/stats)
+# =====================
+def _secs(v: float) -> str:
+    return f"{v * 1000:.0f}ms" if v < 1 else f"{v:.1f}s"
+
+def format_stats(metrics: Metrics, lang: str = "it") -> str:
+    it = lang == "it"
+    summary = metrics.summary()
+    h = summary["histograms"]
+    req = h.get("botia_request_seconds", {})
+    if not req:
+        return "📊 Nessuna statistica ancora." if it else "📊 Aún no hay estadísticas."
+    lines = [f"📊 Statistiche (ultimi {summary['uptime_s']}s)" if it else f"📊 Estadísticas (últimos {summary['uptime_s']}s)"]
+    for cmd, st in sorted(req.items(), key=lambda kv: -kv[1]["count"]):
+        errors = metrics.count("botia_errors_total", command=cmd)
+        cache = metrics.count("botia_cache_hits_total", command=cmd)
+        lines.append(f"- {cmd}: n={st['count']} p50={_secs(st['p50'])} p95={_secs(st['p95'])} "
+                     f"{'errori' if it else 'errores'}={errors} cache={cache}")
+    stages = h.get("botia_stage_seconds", {})
+    if stages:
+        lines.append("⏱️ " + ("Fasi" if it else "Fases") + ": " + " | ".join(
+            f"{k} n={v['count']} p50={_secs(v['p50'])} p95={_secs(v['p95'])}" for k, v in sorted(stages.items())))
+    model = []
+    for name, label, fmt in (("botia_ttft_seconds", "TTFT", _secs),
+                             ("botia_tokens_per_second", "tok/s", lambda v: f"{v:.0f}"),
+                             ("botia_prompt_tokens", "prompt tok", lambda v: f"{v:.0f}"),
+                             ("botia_prompt_chars", "prompt car" if it else "prompt car.", lambda v: f"{v:.0f}")):
+        st = h.get(name, {}).get("-")
+        if st:
+            model.append(f"{label} p50={fmt(st['p50'])} p95={fmt(st['p95'])}")
+    if model:
+        lines.append("🤖 " + ("Modello" if it else "Modelo") + ": " + " | ".join(model))
+    return "\n".join(lines)
+
+def serve_metrics(metrics: Metrics, port: int, host: str = "127.0.0.1") -> Any:
+    # endpoint /metrics minimo in un thread (batch); il server asyncio ha il suo
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            body = metrics.prometheus().encode("utf-8") if self.path == "/metrics" else b"not found\n"
+            self.send_response(200 if self.path == "/metrics" else 404)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    srv = ThreadingHTTPServer((host, port), Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
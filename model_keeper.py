@@ -0,0 +1,124 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ollama_client import OllamaError
+
+# =====================
+# CONFIG
+# =====================
+KEEPALIVE_INTERVAL_S = 240.0      # ping ben dentro il keep_alive di Ollama ("10m")
+IDLE_S = 1800.0                   # sessione senza turni da più di così: il suo modello può scadere
+RELOAD_MIN_S = 0.1                # load_duration sotto questa soglia = modello già in memoria
+
+class ModelKeeper:
+    # Tiene caldi in Ollama i modelli delle sessioni attive.
+    # - preload(model): caricamento in background (generate senza prompt), così la prima
+    #   domanda dopo l'avvio o dopo /model non paga il load; il tempo misurato va in /sum;
+    # - keep-alive: ogni interval_s un ping rinnova il keep_alive dei modelli usati da
+    #   sessioni con un turno negli ultimi idle_s, altrimenti Ollama li scarica tra una
+    #   domanda e l'altra;
+    # - release(): keep_alive=0 per i modelli caricati da qui, all'uscita.
+    def __init__(self, client: Any, interval_s: float = KEEPALIVE_INTERVAL_S, idle_s: float = IDLE_S):
+        self.client = client          # OllamaClient o BackendPool, senza scheduler: il load non genera token
+        self.interval_s = interval_s
+        self.idle_s = idle_s
+        self._lock = threading.Lock()
+        self._models: Dict[str, Dict[str, Any]] = {}        # modello -> stato, tempo di caricamento, errore
+        self._sessions: Dict[str, Tuple[str, float]] = {}   # sessione -> (modello, ultimo turno)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- sessioni ----
+    def use(self, session_id: str, model: str, stats: Optional[Dict[str, Any]] = None) -> None:
+        # a ogni turno e a ogni /model; con le statistiche di una chiamata al modello
+        # si registra anche un caricamento avvenuto dentro la richiesta (modello scaduto)
+        with self._lock:
+            self._sessions[session_id] = (model, time.time())
+            if stats and "load_duration" in stats and "error" not in stats \
+                    and self._models.get(model, {}).get("state") != "loading":
+                self._loaded(model, stats["load_duration"] / 1e9, keep_measure=True)
+        self._start()
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def active_models(self) -> List[str]:
+        limit = time.time() - self.idle_s
+        with self._lock:
+            return sorted({model for model, last in self._sessions.values() if last >= limit})
+
+    # ---- caricamento ----
+    def preload(self, model: str) -> Optional[threading.Thread]:
+        with self._lock:
+            st = self._models.get(model)
+            if st is not None and st["state"] == "loading":
+                return None
+            self._models[model] = dict(st or {}, state="loading", error=None)
+        t = threading.Thread(target=self._load, args=(model,), name=f"preload-{model}", daemon=True)
+        t.start()
+        self._start()
+        return t
+
+    def _load(self, model: str, ping: bool = False) -> None:
+        t0 = time.perf_counter()
+        try:
+            data = self.client.load(model)
+        except OllamaError as e:
+            with self._lock:
+                st = self._models.setdefault(model, {})
+                st.update(state="error", error=str(e))
+            return
+        elapsed = time.perf_counter() - t0
+        # load_duration di Ollama se c'è (solo il caricamento), altrimenti il tempo visto da qui
+        load_s = data.get("load_duration", 0) / 1e9 if data.get("load_duration") else elapsed
+        with self._lock:
+            self._loaded(model, load_s, keep_measure=ping)
+
+    def _loaded(self, model: str, load_s: float, keep_measure: bool) -> None:
+        # con keep_measure un modello già caldo tiene il tempo di caricamento misurato prima
+        # (un ping o un turno costano pochi ms); sotto lock
+        st = self._models.setdefault(model, {})
+        if not keep_measure or st.get("state") != "loaded" or load_s >= RELOAD_MIN_S:
+            st["load_s"] = load_s
+        st.update(state="loaded", error=None)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None or self._stop.is_set() or self.interval_s <= 0:
+                return
+            self._thread = threading.Thread(target=self._loop, name="keep-alive", daemon=True)
+        self._thread.start()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            for model in self.active_models():
+                with self._lock:
+                    loading = self._models.get(model, {}).get("state") == "loading"
+                if not loading:
+                    self._load(model, ping=True)
+
+    def release(self) -> None:
+        self._stop.set()
+        with self._lock:
+            models = [m for m, st in self._models.items() if st.get("state") in ("loading", "loaded")]
+        for model in models:
+            try:
+                self.client.unload(model)
+            except OllamaError:
+                continue     # Ollama già spento o irraggiungibile: scadrà da solo col keep_alive
+            with self._lock:
+                self._models[model]["state"] = "unloaded"
+
+    # ---- stato ----
+    def status(self, model: str) -> Dict[str, Any]:
+        with self._lock:
+            st = dict(self._models.get(model) or {})
+        return {"state": st.get("state", "unknown"), "load_s": st.get("load_s"), "error": st.get("error")}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {m: {"state": st.get("state"), "load_s": round(st["load_s"], 3) if st.get("load_s") is not None else None}
+                      for m, st in self._models.items()}
+        return {"models": models, "active": self.active_models()}
@@ -0,0 +1,308 @@
+import http.client
+import json
+import socket
+import subprocess
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# =====================
+# CONFIG
+# =====================
+DEFAULT_HOST = "http://127.0.0.1:11434"
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 300.0
+DEFAULT_KEEP_ALIVE = "10m"
+
+# =====================
+# ERRORS
+# =====================
+class OllamaError(Exception):
+    pass
+
+class OllamaUnavailable(OllamaError):
+    # server non raggiungibile: il chiamante può ripiegare sulla CLI
+    pass
+
+class OllamaHTTPError(OllamaError):
+    # risposta HTTP di errore (modello mancante, server sovraccarico...): lo status serve al pool
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+# =====================
+# HELPERS
+# =====================
+def normalize_host(host: str) -> str:
+    host = (host or "").strip() or DEFAULT_HOST
+    if "://" not in host:
+        host = "http://" + host
+    u = urllib.parse.urlsplit(host)
+    hostname = u.hostname or "127.0.0.1"
+    if hostname == "0.0.0.0":
+        hostname = "127.0.0.1"
+    port = u.port or 11434
+    return f"{u.scheme}://{hostname}:{port}"
+
+def run_ollama_cli(model: str, prompt: str) -> str:
+    try:
+        r = subprocess.run(
+            ["ollama", "run", model],
+            input=prompt.encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False,
+        )
+    except FileNotFoundError:
+        return "[Errore Ollama] comando 'ollama' non trovato."
+    out = r.stdout.decode("utf-8", errors="ignore").strip()
+    err = r.stderr.decode("utf-8", errors="ignore").strip()
+    if not out and err:
+        return f"[Errore Ollama] {err}"
+    return out or "[Nessuna risposta]"
+
+def record_done(stats: Dict[str, Any], chunk: Dict[str, Any], started: float) -> None:
+    stats["total_s"] = time.perf_counter() - started
+    for k in ("prompt_eval_count", "eval_count", "prompt_eval_duration", "eval_duration", "load_duration"):
+        if k in chunk:
+            stats[k] = chunk[k]
+    if chunk.get("eval_count") and chunk.get("eval_duration"):
+        stats["tokens_per_s"] = chunk["eval_count"] / (chunk["eval_duration"] / 1e9)
+
+class TokenPrinter:
+    # sink per lo streaming in console: stampa il prefisso solo al primo token
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self.started = False
+
+    def __call__(self, token: str) -> None:
+        if not self.started:
+            self.started = True
+            token = token.lstrip()
+            print(self.prefix, end="", flush=True)
+        print(token, end="", flush=True)
+
+# =====================
+# HTTP CLIENT
+# =====================
+class OllamaClient:
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE,
+    ):
+        self.host = normalize_host(host)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keep_alive = keep_alive
+        u = urllib.parse.urlsplit(self.host)
+        self._scheme = u.scheme
+        self._netloc = (u.hostname, u.port)
+        # una connessione persistente per thread (http.client non è thread-safe)
+        self._local = threading.local()
+
+    # ---- connessione ----
+    def _new_conn(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+        conn = cls(self._netloc[0], self._netloc[1], timeout=self.connect_timeout)
+        try:
+            conn.connect()
+        except OSError as e:
+            conn.close()
+            raise OllamaUnavailable(f"Ollama non raggiungibile su {self.host}: {e}") from e
+        conn.sock.settimeout(self.read_timeout)
+        return conn
+
+    def _get_conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn.sock is None:
+            conn = self._new_conn()
+            self._local.conn = conn
+        return conn
+
+    def _drop_conn(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self._local.conn = None
+
+    def close(self) -> None:
+        self._drop_conn()
+
+    def _open(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> http.client.HTTPResponse:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        # un solo retry: la connessione in pool può essere stata chiusa dal server
+        for attempt in (1, 2):
+            reused = getattr(self._local, "conn", None) is not None
+            conn = self._get_conn()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+            except socket.timeout as e:
+                self._drop_conn()
+                raise OllamaError(f"timeout dopo {self.read_timeout}s") from e
+            except (http.client.HTTPException, OSError) as e:
+                self._drop_conn()
+                if attempt == 1 and reused:
+                    continue
+                raise OllamaUnavailable(f"Ollama non raggiungibile su {self.host}: {e}") from e
+            if resp.status >= 400:
+                detail = resp.read().decode("utf-8", errors="ignore")
+                try:
+                    detail = json.loads(detail).get("error", detail)
+                except (ValueError, AttributeError):
+                    pass
+                raise OllamaHTTPError(f"HTTP {resp.status}: {detail}".strip(), resp.status)
+            return resp
+        raise OllamaUnavailable(f"Ollama non raggiungibile su {self.host}")
+
+    def _request_json(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        resp = self._open(method, path, payload)
+        raw = resp.read()
+        if resp.getheader("Connection", "").lower() == "close":
+            self._drop_conn()
+        try:
+            return json.loads(raw.decode("utf-8")) if raw else {}
+        except ValueError as e:
+            raise OllamaError(f"risposta non valida: {raw[:200]!r}") from e
+
+    def _stream_json(self, path: str, payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        resp = self._open("POST", path, payload)
+        finished = False
+        try:
+            while True:
+                try:
+                    line = resp.readline()
+                except socket.timeout as e:
+                    raise OllamaError(f"timeout dopo {self.read_timeout}s") from e
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line.decode("utf-8"))
+                except ValueError as e:
+                    raise OllamaError(f"risposta non valida: {line[:200]!r}") from e
+                if chunk.get("error"):
+                    raise OllamaError(str(chunk["error"]))
+                yield chunk
+                if chunk.get("done"):
+                    resp.read()
+                    finished = True
+                    break
+        finally:
+            # stream interrotto a metà: la connessione non è più riutilizzabile
+            if not finished or resp.getheader("Connection", "").lower() == "close":
+                self._drop_conn()
+
+    def _payload(self, model: str, options: Optional[Dict[str, Any]], stream: bool = False,
+                 **extra: Any) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {"model": model, "stream": stream}
+        if options:
+            payload["options"] = options
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        payload.update({k: v for k, v in extra.items() if v is not None})
+        return payload
+
+    # ---- API ----
+    def generate_raw(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                     context: Optional[List[int]] = None) -> Dict[str, Any]:
+        return self._request_json("POST", "/api/generate", self._payload(model, options, prompt=prompt, context=context))
+
+    def generate(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        return (self.generate_raw(model, prompt, options).get("response") or "").strip()
+
+    def chat_raw(self, model: str, messages: List[Dict[str, str]],
+                 options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return self._request_json("POST", "/api/chat", self._payload(model, options, messages=messages))
+
+    def chat(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> str:
+        data = self.chat_raw(model, messages, options)
+        return ((data.get("message") or {}).get("content") or "").strip()
+
+    def generate_stream(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                        context: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        payload = self._payload(model, options, stream=True, prompt=prompt, context=context)
+        return self._stream_json("/api/generate", payload)
+
+    def chat_stream(self, model: str, messages: List[Dict[str, str]],
+                    options: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        return self._stream_json("/api/chat", self._payload(model, options, stream=True, messages=messages))
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        payload: Dict[str, Any] = {"model": model, "input": texts}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        try:
+            return self._request_json("POST", "/api/embed", payload).get("embeddings") or []
+        except OllamaHTTPError as e:
+            if e.status != 404:
+                raise
+        # server più vecchi: solo /api/embeddings, un testo per chiamata
+        return [self._request_json("POST", "/api/embeddings", {"model": model, "prompt": t}).get("embedding") or []
+                for t in texts]
+
+    def is_available(self) -> bool:
+        try:
+            self._request_json("GET", "/api/version")
+            return True
+        except OllamaError:
+            return False
+
+    def list_models(self) -> List[str]:
+        # modelli installati (/api/tags)
+        return [m.get("name") or m.get("model") or "" for m in self._request_json("GET", "/api/tags").get("models") or []]
+
+    def running_models(self) -> List[str]:
+        # modelli già caricati in memoria (/api/ps)
+        return [m.get("name") or m.get("model") or "" for m in self._request_json("GET", "/api/ps").get("models") or []]
+
+    def load(self, model: str) -> Dict[str, Any]:
+        # generate senza prompt: Ollama carica il modello (o rinnova il suo keep_alive) e basta
+        return self._request_json("POST", "/api/generate", self._payload(model, None))
+
+    def unload(self, model: str) -> Dict[str, Any]:
+        return self._request_json("POST", "/api/generate", {"model": model, "keep_alive": 0})
+
+# =====================
+# STREAMING
+# =====================
+def stream_generate(client: OllamaClient, model: str, prompt: str, stats: Dict[str, Any],
+                    use_http: bool = True, options: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+    stats.clear()
+    t0 = time.perf_counter()
+    if use_http:
+        try:
+            for chunk in client.generate_stream(model, prompt, options):
+                tok = chunk.get("response") or ""
+                if tok:
+                    stats.setdefault("ttft_s", time.perf_counter() - t0)
+                    yield tok
+                if chunk.get("done"):
+                    record_done(stats, chunk, t0)
+            return
+        except OllamaUnavailable:
+            if "ttft_s" in stats:
+                raise
+            stats["backend"] = "cli"
+        except OllamaError as e:
+            stats["error"] = str(e)
+            yield f"[Errore Ollama] {e}"
+            return
+    out = run_ollama_cli(model, prompt)
+    stats["ttft_s"] = stats["total_s"] = time.perf_counter() - t0
+    yield out
+
+def collect(tokens: Iterator[str], sink: Optional[Callable[[str], None]] = None) -> str:
+    parts = []
+    for tok in tokens:
+        parts.append(tok)
+        if sink is not None:
+            sink(tok)
+    return "".join(parts).strip()
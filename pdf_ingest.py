@@ -0,0 +1,128 @@
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from lazy_import import LazyModule
+
+pypdf = LazyModule("pypdf")   # importato al primo PDF, anche nei processi del pool
+
+# =====================
+# CONFIG
+# =====================
+BATCH_PAGES = 8            # pagine per task del pool
+PARALLEL_MIN_PAGES = 24    # sotto questa soglia il costo di avvio dei processi non conviene
+
+Progress = Callable[[int, int], None]
+
+# =====================
+# WORKER
+# =====================
+def _page_text(reader: Any, i: int) -> str:
+    try:
+        return reader.pages[i].extract_text() or ""
+    except Exception:
+        return ""
+
+def _extract_range(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    # eseguito nei processi del pool: ogni worker apre il PDF per conto suo
+    reader = pypdf.PdfReader(path)
+    return [(i + 1, _page_text(reader, i)) for i in range(start, end)]
+
+def _stop_pool(pool: Any) -> None:
+    # uscita anticipata (budget finito o chi legge smette): i task già partiti
+    # continuerebbero a estrarre pagine in background su tutti i core, quindi si
+    # terminano i processi invece di aspettarli
+    terminate = getattr(pool, "terminate_workers", None)   # Python 3.14+
+    if terminate is not None:
+        terminate()
+        return
+    procs = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for p in procs:
+        if p.is_alive():
+            p.terminate()
+
+def count_pages(path: str) -> int:
+    return len(pypdf.PdfReader(path).pages)
+
+# =====================
+# STREAM DI PAGINE
+# =====================
+def iter_pdf_pages(
+    path: str,
+    workers: Optional[int] = None,
+    time_budget_s: Optional[float] = None,
+    max_text_bytes: Optional[int] = None,
+    progress: Optional[Progress] = None,
+    stats: Optional[Dict[str, Any]] = None,
+    batch_pages: int = BATCH_PAGES,
+) -> Iterator[Tuple[int, str]]:
+    # Restituisce (numero pagina, testo) in ordine, appena disponibili: chi consuma
+    # può iniziare a lavorare prima che l'ultima pagina sia estratta.
+    # Al posto del vecchio limite fisso di pagine c'è un budget di tempo e di testo.
+    t0 = time.perf_counter()
+    stats = stats if stats is not None else {}
+    total = count_pages(path)
+    stats.update({"total_pages": total, "pages": 0, "text_bytes": 0, "truncated": None})
+    ranges = [(s, min(s + batch_pages, total)) for s in range(0, total, batch_pages)]
+    deadline = t0 + time_budget_s if time_budget_s else None
+
+    def accept(text: str) -> bool:
+        stats["pages"] += 1
+        stats["text_bytes"] += len(text.encode("utf-8"))
+        stats["elapsed_s"] = time.perf_counter() - t0
+        if progress is not None:
+            progress(stats["pages"], total)
+        if max_text_bytes and stats["text_bytes"] >= max_text_bytes:
+            stats["truncated"] = "memoria"
+            return False
+        if deadline and time.perf_counter() >= deadline:
+            stats["truncated"] = "tempo"
+            return False
+        return True
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or total < PARALLEL_MIN_PAGES:
+        # una pagina alla volta: budget controllato dopo ogni pagina
+        reader = pypdf.PdfReader(path)
+        for i in range(total):
+            text = _page_text(reader, i)
+            yield i + 1, text
+            if not accept(text):
+                return
+        return
+
+    # multiprocessing solo per i PDF grandi, non all'avvio del bot; "spawn" perché il bot ha
+    # thread attivi (scheduler, keep-alive, health check) e un fork li copierebbe a metà
+    from concurrent.futures import ProcessPoolExecutor
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pending: Deque = deque()
+    next_range = 0
+    finished = False
+    try:
+        while next_range < len(ranges) or pending:
+            # finestra scorrevole: al massimo 2 task per worker in volo
+            while next_range < len(ranges) and len(pending) < workers * 2:
+                s, e = ranges[next_range]
+                pending.append(pool.submit(_extract_range, path, s, e))
+                next_range += 1
+            fut = pending.popleft()
+            timeout = max(0.0, deadline - time.perf_counter()) if deadline else None
+            try:
+                pages = fut.result(timeout=timeout)
+            except FutureTimeout:
+                stats["truncated"] = "tempo"
+                return
+            for page in pages:
+                yield page
+                if not accept(page[1]):
+                    return
+        finished = True
+    finally:
+        if finished:
+            pool.shutdown(wait=False)
+        else:
+            _stop_pool(pool)
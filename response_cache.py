@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# =====================
+# CONFIG
+# =====================
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".botia_cache", "responses")
+DEFAULT_MEM_ENTRIES = 256
+DEFAULT_DISK_MAX_BYTES = 50_000_000
+DEFAULT_TTL_S = 7 * 24 * 3600
+
+def make_key(model: str, options: Optional[Dict[str, Any]], prompt: str) -> str:
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    raw = json.dumps({"model": model, "options": options or {}, "prompt": digest}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# =====================
+# CACHE (RAM LRU + DISCO)
+# =====================
+class ResponseCache:
+    def __init__(
+        self,
+        directory: Optional[str] = DEFAULT_CACHE_DIR,
+        mem_entries: int = DEFAULT_MEM_ENTRIES,
+        disk_max_bytes: int = DEFAULT_DISK_MAX_BYTES,
+        default_ttl: float = DEFAULT_TTL_S,
+    ):
+        self.directory = directory
+        self.mem_entries = mem_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.default_ttl = default_ttl
+        self._mem: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()   # key -> (scadenza, testo)
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+        self.counters = {"mem_hits": 0, "disk_hits": 0, "misses": 0, "bytes_saved": 0, "evictions": 0}
+
+    # ---- disco ----
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory or "", key[:2], key + ".json")
+
+    def _disk_files(self) -> List[Tuple[float, int, str]]:
+        files = []
+        if not self.directory or not os.path.isdir(self.directory):
+            return files
+        for root, _dirs, names in os.walk(self.directory):
+            for n in names:
+                p = os.path.join(root, n)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+        return files
+
+    def _disk_total(self) -> int:
+        if self._disk_bytes is None:
+            self._disk_bytes = sum(size for _m, size, _p in self._disk_files())
+        return self._disk_bytes
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, str]]:
+        if not self.directory:
+            return None
+        p = self._path(key)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        expires = entry.get("expires", 0)
+        if expires < time.time():
+            self._disk_remove(p)
+            return None
+        try:
+            os.utime(p)   # mtime = ultimo uso, per l'eviction LRU
+        except OSError:
+            pass
+        return expires, entry.get("value") or ""
+
+    def _disk_put(self, key: str, value: str, expires: float) -> None:
+        if not self.directory:
+            return
+        p = self._path(key)
+        data = json.dumps({"expires": expires, "value": value}, ensure_ascii=False).encode("utf-8")
+        try:
+            old = os.path.getsize(p) if os.path.exists(p) else 0
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+            tmp = p + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, p)
+        except OSError:
+            return
+        self._disk_bytes = self._disk_total() + len(data) - old
+        if self._disk_bytes > self.disk_max_bytes:
+            self._disk_evict()
+
+    def _disk_remove(self, p: str) -> None:
+        try:
+            size = os.path.getsize(p)
+            os.remove(p)
+        except OSError:
+            return
+        if self._disk_bytes is not None:
+            self._disk_bytes -= size
+
+    def _disk_evict(self) -> None:
+        # si scende al 90% del limite eliminando i file usati meno di recente
+        files = sorted(self._disk_files())
+        total = sum(size for _m, size, _p in files)
+        target = int(self.disk_max_bytes * 0.9)
+        for _mtime, size, p in files:
+            if total <= target:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            total -= size
+            self.counters["evictions"] += 1
+        self._disk_bytes = total
+
+    # ---- API ----
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                expires, value = hit
+                if expires >= time.time():
+                    self._mem.move_to_end(key)
+                    self.counters["mem_hits"] += 1
+                    self.counters["bytes_saved"] += len(value.encode("utf-8"))
+                    return value
+                del self._mem[key]
+            entry = self._disk_get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            expires, value = entry
+            self.counters["disk_hits"] += 1
+            self.counters["bytes_saved"] += len(value.encode("utf-8"))
+            self._mem_put(key, value, expires)
+            return value
+
+    def _mem_put(self, key: str, value: str, expires: float) -> None:
+        self._mem[key] = (expires, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_entries:
+            self._mem.popitem(last=False)
+
+    def put(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        expires = time.time() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._mem_put(key, value, expires)
+            self._disk_put(key, value, expires)
+
+    def clear(self) -> int:
+        with self._lock:
+            # una voce in memoria è quasi sempre anche su disco: si contano le chiavi distinte
+            keys = set(self._mem)
+            self._mem.clear()
+            for _m, _size, p in self._disk_files():
+                try:
+                    os.remove(p)
+                    keys.add(os.path.basename(p).split(".", 1)[0])   # anche un .tmp rimasto
+                except OSError:
+                    pass
+            n = len(keys)
+            self._disk_bytes = 0
+            for k in self.counters:
+                self.counters[k] = 0
+            return n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self.counters)
+            lookups = c["mem_hits"] + c["disk_hits"] + c["misses"]
+            c["hit_rate"] = (c["mem_hits"] + c["disk_hits"]) / lookups if lookups else 0.0
+            c["mem_entries"] = len(self._mem)
+            c["disk_bytes"] = self._disk_total()
+            return c
@@ -0,0 +1,190 @@
+import math
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# (etichetta posizione, testo) es. ("Pagina 20", "...")
+Chunk = Tuple[str, str]
+
+# =====================
+# CONFIG
+# =====================
+CHUNK_CHARS = 1200
+LOG_WINDOW_LINES = 40
+LOG_OVERLAP_LINES = 5
+
+STOPWORDS = {
+    # it
+    "il", "lo", "la", "i", "gli", "le", "un", "una", "uno", "di", "da", "in", "con", "su", "per", "tra",
+    "fra", "e", "o", "che", "non", "del", "della", "dei", "delle", "al", "alla", "nel", "nella", "come",
+    "cosa", "quale", "quali", "sono", "è",
+    # es
+    "el", "los", "las", "unos", "unas", "de", "del", "en", "con", "por", "para", "y", "que", "no",
+    "al", "se", "es", "son", "cómo", "qué", "cuál",
+    # en
+    "the", "a", "an", "of", "to", "and", "or", "is", "are", "on", "for", "with",
+}
+
+PAGE_MARK = re.compile(r"^--- Pagina (\d+) ---$", re.MULTILINE)
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+# =====================
+# CHUNKING
+# =====================
+def _pack(label: str, paras: List[str], max_chars: int) -> List[Chunk]:
+    chunks: List[Chunk] = []
+    buf: List[str] = []
+    size = 0
+    for p in paras:
+        while len(p) > max_chars:
+            # paragrafo enorme (es. pagina senza a capo): taglio netto
+            if buf:
+                chunks.append((label, "\n".join(buf)))
+                buf, size = [], 0
+            chunks.append((label, p[:max_chars]))
+            p = p[max_chars:]
+        if buf and size + len(p) > max_chars:
+            chunks.append((label, "\n".join(buf)))
+            buf, size = [], 0
+        buf.append(p)
+        size += len(p) + 1
+    if buf:
+        chunks.append((label, "\n".join(buf)))
+    return chunks
+
+def chunk_pdf_page(page: int, text: str, max_chars: int = CHUNK_CHARS) -> List[Chunk]:
+    # una pagina alla volta, mentre read_pdf la riceve dal pool
+    paras = [p.strip() for p in text.split("\n") if p.strip()]
+    return _pack(f"Pagina {page}", paras, max_chars)
+
+def chunk_pdf_text(text: str, max_chars: int = CHUNK_CHARS) -> List[Chunk]:
+    # read_pdf separa le pagine con "--- Pagina N ---"
+    chunks: List[Chunk] = []
+    marks = list(PAGE_MARK.finditer(text))
+    for i, m in enumerate(marks):
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(text)
+        chunks.extend(chunk_pdf_page(int(m.group(1)), text[m.end():end], max_chars))
+    return chunks or chunk_paragraphs(text, max_chars)
+
+def chunk_paragraphs(text: str, max_chars: int = CHUNK_CHARS) -> List[Chunk]:
+    chunks: List[Chunk] = []
+    paras = [p.strip() for p in text.split("\n") if p.strip()]
+    start = 1
+    for _label, body in _pack("", paras, max_chars):
+        n = body.count("\n") + 1
+        chunks.append((f"Par. {start}-{start + n - 1}", body))
+        start += n
+    return chunks
+
+def chunk_lines(text: str, window: int = LOG_WINDOW_LINES, overlap: int = LOG_OVERLAP_LINES,
+                max_chars: int = CHUNK_CHARS) -> List[Chunk]:
+    lines = text.splitlines()
+    chunks: List[Chunk] = []
+    step = max(1, window - overlap)
+    for start in range(0, len(lines), step):
+        block = lines[start:start + window]
+        body = "\n".join(block).strip()
+        if body:
+            chunks.append((f"Righe {start + 1}-{start + len(block)}", body[:max_chars * 2]))
+        if start + window >= len(lines):
+            break
+    return chunks
+
+def chunk_document(text: str, ftype: str) -> List[Chunk]:
+    if ftype == "pdf":
+        return chunk_pdf_text(text)
+    if ftype == "docx":
+        return chunk_paragraphs(text)
+    return chunk_lines(text)
+
+# =====================
+# BM25
+# =====================
+class BM25Index:
+    def __init__(self, chunks: List[Chunk], k1: float = 1.5, b: float = 0.75):
+        t0 = time.perf_counter()
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}   # termine -> [(chunk, tf)]
+        self.lengths: List[int] = []
+        for i, (label, body) in enumerate(chunks):
+            tf = Counter(tokenize(f"{label} {body}"))
+            self.lengths.append(sum(tf.values()))
+            for term, n in tf.items():
+                self.postings.setdefault(term, []).append((i, n))
+        n_docs = len(chunks) or 1
+        self.avgdl = (sum(self.lengths) / n_docs) or 1.0
+        self.idf = {
+            term: math.log(1 + (n_docs - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+        self.build_ms = (time.perf_counter() - t0) * 1000
+        self.last_query_ms = 0.0
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[float, int]]:
+        t0 = time.perf_counter()
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, tf in self.postings[term]:
+                norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * self.lengths[i] / self.avgdl))
+                scores[i] = scores.get(i, 0.0) + idf * norm
+        top = sorted(((s, i) for i, s in scores.items()), reverse=True)[:k]
+        self.last_query_ms = (time.perf_counter() - t0) * 1000
+        return top
+
+    def top_chunks(self, query: str, k: int = 5) -> List[Chunk]:
+        # restituiti in ordine di documento, più leggibili per il modello
+        hits = sorted(i for _s, i in self.search(query, k))
+        return [self.chunks[i] for i in hits]
+
+# =====================
+# PASSAGGI (pagine web)
+# =====================
+def _split_words(text: str, max_chars: int) -> List[str]:
+    # come il taglio netto di _pack, ma su uno spazio: i passaggi non iniziano a metà parola
+    out: List[str] = []
+    while len(text) > max_chars:
+        cut = text.rfind(" ", 0, max_chars)
+        cut = cut if cut > max_chars // 2 else max_chars
+        out.append(text[:cut])
+        text = text[cut:].lstrip()
+    out.append(text)
+    return out
+
+def select_passages(text: str, query: str, max_chars: int, passage_chars: int = 400,
+                    min_rel: float = 0.3) -> str:
+    # tiene i passaggi pertinenti alla domanda (BM25, almeno min_rel del migliore) entro
+    # max_chars, in ordine di pagina; senza termini in comune si usa l'inizio della pagina
+    if len(text) <= max_chars:
+        return text
+    paras = [piece for p in text.split("\n") if p.strip() for piece in _split_words(p.strip(), passage_chars)]
+    passages = [body for _label, body in _pack("", paras, passage_chars)]
+    index = BM25Index([("", p) for p in passages])
+    hits = index.search(query, len(passages))
+    ranked = [i for s, i in hits if s > 0 and s >= hits[0][0] * min_rel]
+    chosen: List[int] = []
+    used = 0
+    for i in ranked or range(len(passages)):
+        if used + len(passages[i]) + 2 > max_chars:
+            continue
+        chosen.append(i)
+        used += len(passages[i]) + 2
+    out: List[str] = []
+    prev = -1
+    for i in sorted(chosen):
+        if prev >= 0 and i != prev + 1:
+            out.append("…")
+        out.append(passages[i])
+        prev = i
+    return "\n".join(out)
+
+def format_chunks(chunks: List[Chunk]) -> str:
+    return "\n\n".join(f"[{label}]\n{body}" for label, body in chunks)
@@ -0,0 +1,256 @@
+import contextvars
+import math
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from ollama_client import OllamaError
+from tracing import span
+
+# =====================
+# CONFIG
+# =====================
+# classi di priorità, dalla più urgente: chat interattiva > /askfile > batch e riassunti
+PRIORITY_CLASSES = ("chat", "askfile", "batch")
+DEFAULT_CLASS = "batch"           # chiamate senza contesto (riassunti della memoria in background)
+WAIT_SAMPLES = 1000               # attese recenti tenute per p50/p95
+
+class SchedulerFull(OllamaError):
+    # coda piena o attesa scaduta: errore chiaro, niente ripiego sulla CLI (aggirerebbe il limite)
+    pass
+
+# (classe, proprietario) della chiamata in corso nel thread/task
+_context: contextvars.ContextVar = contextvars.ContextVar("botia_llm_context", default=(DEFAULT_CLASS, "-"))
+
+class _Waiter:
+    __slots__ = ("cls", "owner", "enqueued", "event", "granted")
+
+    def __init__(self, cls: str, owner: str):
+        self.cls = cls
+        self.owner = owner
+        self.enqueued = time.perf_counter()
+        self.event = threading.Event()
+        self.granted = False
+
+# =====================
+# SCHEDULER
+# =====================
+class FairScheduler:
+    # Al massimo max_concurrent chiamate al modello insieme; le altre aspettano in coda.
+    # - priorità stretta tra classi, con invecchiamento: ogni aging_s di attesa una
+    #   richiesta sale di una classe, così il batch non resta fermo per sempre;
+    # - dentro una classe, round robin tra proprietari (sessioni): chi manda 20 blocchi
+    #   di /filesum non passa davanti a chi ne manda uno;
+    # - le classi sotto "chat" non occupano tutti i posti (reserve_chat), così una
+    #   domanda interattiva trova sempre uno slot libero a breve;
+    # - coda limitata (totale e per proprietario) e attesa massima: oltre si rifiuta
+    #   subito con SchedulerFull invece di far crescere la latenza di tutti.
+    def __init__(self, max_concurrent: int = 2, max_queue: int = 64, max_queue_per_owner: int = 8,
+                 max_wait_s: float = 120.0, aging_s: float = 30.0, reserve_chat: int = 1):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.max_queue_per_owner = max_queue_per_owner
+        self.max_wait_s = max_wait_s
+        self.aging_s = aging_s
+        # posti usabili da ogni classe: la chat tutti, le altre lasciano libera la riserva
+        self.class_limit = {c: self.max_concurrent if c == "chat" else max(1, self.max_concurrent - reserve_chat)
+                            for c in PRIORITY_CLASSES}
+        self._lock = threading.Lock()
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {c: OrderedDict() for c in PRIORITY_CLASSES}
+        self._owner_queued: Dict[str, int] = {}
+        self._queued = 0
+        self._running = 0
+        self._class_running = {c: 0 for c in PRIORITY_CLASSES}
+        self._waits: Dict[str, Deque[float]] = {c: deque(maxlen=WAIT_SAMPLES) for c in PRIORITY_CLASSES}
+        self._counters = {c: {"granted": 0, "rejected": 0, "timeouts": 0} for c in PRIORITY_CLASSES}
+        self._max_wait = {c: 0.0 for c in PRIORITY_CLASSES}
+
+    # ---- contesto ----
+    @contextmanager
+    def context(self, cls: str, owner: Optional[str] = None) -> Iterator[None]:
+        # i contesti annidati possono solo abbassare la priorità: un /askfile dentro un
+        # record batch resta batch
+        cur_cls, cur_owner = _context.get()
+        if cls not in PRIORITY_CLASSES:
+            raise ValueError(f"classe di priorità sconosciuta: {cls}")
+        if cur_cls != DEFAULT_CLASS or cur_owner != "-":
+            cls = max(cls, cur_cls, key=PRIORITY_CLASSES.index)
+        token = _context.set((cls, owner or cur_owner))
+        try:
+            yield
+        finally:
+            _context.reset(token)
+
+    # ---- slot ----
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        cls, owner = _context.get()
+        with span("llm.queue", cls=cls):
+            self.acquire(cls, owner)
+        try:
+            yield
+        finally:
+            self.release(cls)
+
+    def acquire(self, cls: str, owner: str) -> float:
+        with self._lock:
+            if self._queued == 0 and self._can_run(cls):
+                self._start(cls, 0.0)
+                return 0.0
+            if self._queued >= self.max_queue or self._owner_queued.get(owner, 0) >= self.max_queue_per_owner:
+                self._counters[cls]["rejected"] += 1
+                raise SchedulerFull(f"modello occupato: coda piena ({self._queued} richieste in attesa), riprova tra poco")
+            w = _Waiter(cls, owner)
+            self._queues[cls].setdefault(owner, deque()).append(w)
+            self._owner_queued[owner] = self._owner_queued.get(owner, 0) + 1
+            self._queued += 1
+            # può esserci un posto libero per questa classe anche con altre classi in coda
+            self._dispatch()
+        if not w.event.wait(self.max_wait_s):
+            with self._lock:
+                if not w.granted:
+                    self._remove(w)
+                    self._counters[cls]["timeouts"] += 1
+                    raise SchedulerFull(f"modello occupato: attesa oltre {self.max_wait_s:.0f}s, riprova tra poco")
+        return time.perf_counter() - w.enqueued
+
+    def release(self, cls: str) -> None:
+        with self._lock:
+            self._running -= 1
+            self._class_running[cls] -= 1
+            self._dispatch()
+
+    def _can_run(self, cls: str) -> bool:
+        return self._running < self.max_concurrent and self._class_running[cls] < self.class_limit[cls]
+
+    def _start(self, cls: str, waited: float) -> None:
+        self._running += 1
+        self._class_running[cls] += 1
+        self._counters[cls]["granted"] += 1
+        self._waits[cls].append(waited)
+        self._max_wait[cls] = max(self._max_wait[cls], waited)
+
+    def _remove(self, w: _Waiter) -> None:
+        q = self._queues[w.cls].get(w.owner)
+        if q is not None and w in q:
+            q.remove(w)
+            if not q:
+                del self._queues[w.cls][w.owner]
+            self._queued -= 1
+            self._owner_queued[w.owner] -= 1
+            if not self._owner_queued[w.owner]:
+                del self._owner_queued[w.owner]
+
+    def _pick(self) -> Optional[_Waiter]:
+        # testa della coda di ogni classe (primo proprietario del giro); vince la priorità
+        # effettiva (classe meno invecchiamento), a parità la classe più alta
+        now = time.perf_counter()
+        best: Optional[Tuple[float, int, _Waiter]] = None
+        for rank, cls in enumerate(PRIORITY_CLASSES):
+            owners = self._queues[cls]
+            if not owners or not self._can_run(cls):
+                continue
+            w = next(iter(owners.values()))[0]
+            eff = rank - (now - w.enqueued) / self.aging_s if self.aging_s > 0 else rank
+            if best is None or (eff, rank) < best[:2]:
+                best = (eff, rank, w)
+        return best[2] if best else None
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_concurrent:
+            w = self._pick()
+            if w is None:
+                return
+            owners = self._queues[w.cls]
+            owners[w.owner].popleft()
+            # round robin: il proprietario servito torna in fondo al giro
+            if owners[w.owner]:
+                owners.move_to_end(w.owner)
+            else:
+                del owners[w.owner]
+            self._queued -= 1
+            self._owner_queued[w.owner] -= 1
+            if not self._owner_queued[w.owner]:
+                del self._owner_queued[w.owner]
+            w.granted = True
+            self._start(w.cls, time.perf_counter() - w.enqueued)
+            w.event.set()
+
+    def saturated(self) -> bool:
+        with self._lock:
+            return self._queued >= self.max_queue
+
+    # ---- metriche ----
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            classes = {}
+            for cls in PRIORITY_CLASSES:
+                waits = sorted(self._waits[cls])
+                classes[cls] = dict(
+                    self._counters[cls],
+                    queued=sum(len(q) for q in self._queues[cls].values()),
+                    running=self._class_running[cls],
+                    wait_p50_ms=round(statistics.median(waits) * 1000, 1) if waits else 0.0,
+                    wait_p95_ms=round(waits[math.ceil(0.95 * len(waits)) - 1] * 1000, 1) if waits else 0.0,
+                    wait_max_ms=round(self._max_wait[cls] * 1000, 1),
+                )
+            return {"max_concurrent": self.max_concurrent, "running": self._running,
+                    "queued": self._queued, "classes": classes}
+
+# =====================
+# CLIENT CON SCHEDULER
+# =====================
+class ScheduledClient:
+    # Stessa interfaccia di OllamaClient: ogni chiamata al modello prende uno slot dello
+    # scheduler (classe e proprietario dal contesto). Negli stream lo slot resta occupato
+    # finché l'ultimo token è stato letto.
+    def __init__(self, client: Any, scheduler: FairScheduler):
+        self.client = client
+        self.scheduler = scheduler
+
+    def __getattr__(self, name: str) -> Any:
+        # host, keep_alive, timeouts... del client sottostante
+        return getattr(self.client, name)
+
+    def _stream(self, it_factory, *args: Any) -> Iterator[Dict[str, Any]]:
+        with self.scheduler.slot():
+            yield from it_factory(*args)
+
+    def generate_raw(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                     context: Optional[List[int]] = None) -> Dict[str, Any]:
+        with self.scheduler.slot():
+            return self.client.generate_raw(model, prompt, options, context)
+
+    def generate(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+        with self.scheduler.slot():
+            return self.client.generate(model, prompt, options)
+
+    def chat_raw(self, model: str, messages: List[Dict[str, str]],
+                 options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        with self.scheduler.slot():
+            return self.client.chat_raw(model, messages, options)
+
+    def chat(self, model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> str:
+        with self.scheduler.slot():
+            return self.client.chat(model, messages, options)
+
+    def generate_stream(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None,
+                        context: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        return self._stream(self.client.generate_stream, model, prompt, options, context)
+
+    def chat_stream(self, model: str, messages: List[Dict[str, str]],
+                    options: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        return self._stream(self.client.chat_stream, model, messages, options)
+
+    def embed(self, model: str, texts: List[str]) -> List[List[float]]:
+        with span("embed", texts=len(texts)), self.scheduler.slot():
+            return self.client.embed(model, texts)
+
+    def is_available(self) -> bool:
+        return self.client.is_available()
+
+    def close(self) -> None:
+        self.client.close()
@@ -0,0 +1,146 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+from lazy_import import LazyModule
+
+duckduckgo_search = LazyModule("duckduckgo_search")   # importato alla prima ricerca reale
+
+# =====================
+# CONFIG
+# =====================
+DEFAULT_TTL_S = 1800
+DEFAULT_STALE_S = 6 * 3600
+DEFAULT_ENTRIES = 256
+
+# (titolo, url, snippet)
+SearchResult = Tuple[str, str, str]
+# (query, max_results) -> risultati
+SearchProvider = Callable[[str, int], List[SearchResult]]
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def normalize_query(query: str) -> str:
+    # "ultime versione Outlook" e "versione ultime outlook" -> stessa chiave
+    return " ".join(sorted(set(WORD_RE.findall(query.lower()))))
+
+# =====================
+# PROVIDER
+# =====================
+class DDGSProvider:
+    name = "ddgs"
+
+    def __call__(self, query: str, max_results: int) -> List[SearchResult]:
+        results = []
+        with duckduckgo_search.DDGS() as ddgs:
+            for r in ddgs.text(query, max_results=max_results):
+                title = (r.get("title") or "").strip()
+                url = (r.get("href") or "").strip()
+                snippet = (r.get("body") or "").strip()
+                if url:
+                    results.append((title or url, url, snippet))
+        return results
+
+class FakeSearchProvider:
+    # provider locale per prove e benchmark: risultati deterministici, latenza configurabile
+    name = "fake"
+
+    def __init__(self, base_url: str = "http://127.0.0.1:8000", latency_s: float = 0.0):
+        self.base_url = base_url.rstrip("/")
+        self.latency_s = latency_s
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, query: str, max_results: int) -> List[SearchResult]:
+        with self._lock:
+            self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        slug = "-".join(WORD_RE.findall(query.lower())) or "q"
+        return [(f"{query} ({i})", f"{self.base_url}/{slug}/{i}", f"Risultato {i} per: {query}")
+                for i in range(1, max_results + 1)]
+
+# =====================
+# CACHE + COALESCING
+# =====================
+class SearchCache:
+    # TTL sulla query normalizzata; richieste identiche concorrenti condividono una sola
+    # chiamata al provider; dopo il TTL (entro stale_s) si risponde subito col risultato
+    # vecchio e si aggiorna in background (stale-while-revalidate).
+    def __init__(self, provider: SearchProvider, ttl_s: float = DEFAULT_TTL_S,
+                 stale_s: float = DEFAULT_STALE_S, max_entries: int = DEFAULT_ENTRIES):
+        self.provider = provider
+        self.ttl_s = ttl_s
+        self.stale_s = stale_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, List[SearchResult]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], Future] = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0, "errors": 0}
+
+    def _start(self, key: Tuple[str, int], query: str) -> Tuple[Future, bool]:
+        # con il lock: ritorna la richiesta in volo per key, creandola se manca
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.counters["coalesced"] += 1
+            return fut, False
+        fut = Future()
+        self._inflight[key] = fut
+        return fut, True
+
+    def _run(self, key: Tuple[str, int], query: str, fut: Future) -> None:
+        try:
+            results = self.provider(query, key[1])
+        except Exception as e:
+            with self._lock:
+                self.counters["errors"] += 1
+                self._inflight.pop(key, None)
+            fut.set_exception(e)
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._inflight.pop(key, None)
+        fut.set_result(results)
+
+    def search(self, query: str, max_results: int) -> List[SearchResult]:
+        key = (normalize_query(query), max_results)
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.time() - entry[0] if entry is not None else None
+            if entry is not None and age < self.ttl_s:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return list(entry[1])
+            if entry is not None and age < self.ttl_s + self.stale_s:
+                self.counters["stale_hits"] += 1
+                fut, owner = self._start(key, query)
+                if owner:
+                    self.counters["refreshes"] += 1
+                    threading.Thread(target=self._run, args=(key, query, fut), daemon=True).start()
+                return list(entry[1])
+            fut, owner = self._start(key, query)
+            if owner:
+                self.counters["misses"] += 1
+        if owner:
+            self._run(key, query, fut)
+        return list(fut.result())
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._entries)
+            self._entries.clear()
+            for k in self.counters:
+                self.counters[k] = 0
+            return n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self.counters)
+            c["entries"] = len(self._entries)
+            return c
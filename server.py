@@ -0,0 +1,457 @@
+"""Server HTTP multi-utente (asyncio): una sessione BotIA per persona, risposte in streaming.
+
+Uso:
+    py server.py [--bot bot|bot_web] [--host 127.0.0.1] [--port 8765] [--workers 8]
+                 [--idle 1800] [--max-sessions 200] [--max-mb 512] [--allow-files] [--allow-read]
+                 [--admin-token SEGRETO] [--trace tracce/ [--profile 5]]
+
+API:
+    POST   /api/chat            {"session": "id", "message": "testo o /comando", "stream": "sse"|"ndjson"|false}
+    GET    /api/sessions        elenco sessioni (id, modello, età, inattività, memoria stimata; admin)
+    DELETE /api/session/<id>    chiude una sessione
+    GET    /health
+    GET    /metrics             metriche Prometheus (istogrammi per fase e comando, code, sessioni)
+
+Senza "session" ne viene creata una nuova (id casuale generato dal server, restituito nel
+corpo e nell'header X-Session); un id che il server non ha emesso risponde 404.
+Con "stream": "sse" i token arrivano come text/event-stream (data: {"token": ...}, poi
+event: done); con "ndjson" come righe JSON in una risposta chunked. Le chiamate al bot
+girano in un pool di thread, una alla volta per sessione; tutte le sessioni condividono
+client Ollama, cache e scheduler (coda e attese in /health). I comandi che agiscono su
+tutto il server (/cache clear, /stats reset) e l'elenco delle sessioni richiedono l'header
+X-Admin-Token uguale a --admin-token (o BOTIA_ADMIN_TOKEN); senza token configurato sono
+disabilitati. /read (bot_web) scarica URL dalla rete del server: solo con --allow-read.
+"""
+import argparse
+import asyncio
+import hmac
+import importlib
+import json
+import os
+import sys
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend_pool import BackendPool
+from lazy_import import warm_up
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+MAX_SESSION_ID = 64
+FILE_COMMANDS = {"/file", "/pdf", "/docx"}   # leggono file sulla macchina del server
+READ_COMMANDS = {"/read"}                     # URL scelto dal client, scaricato dalla rete del server (intranet, Ollama)
+ADMIN_COMMANDS = {("/cache", "clear"), ("/stats", "reset")}   # globali: toccano tutte le sessioni
+REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+# =====================
+# SESSIONI
+# =====================
+class SessionManager:
+    # Sessioni in ordine LRU. Le inattive da più di idle_s vengono chiuse da un task
+    # periodico; oltre max_sessions o max_bytes (stima approx_bytes) si chiudono le
+    # meno recenti. Una sessione con un comando in corso non viene mai rimossa.
+    def __init__(self, bot: Any, idle_s: float, max_sessions: int, max_bytes: int):
+        self.bot = bot
+        self.idle_s = idle_s
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.sessions: "OrderedDict[str, Any]" = OrderedDict()
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self.sizes: Dict[str, int] = {}
+        self.evicted = {"idle": 0, "memory": 0, "count": 0}
+
+    def get(self, session_id: Optional[str]) -> Any:
+        # solo id emessi qui (casuali): un client non può scegliersi l'id né entrare in una
+        # sessione altrui indovinandolo
+        if session_id is None:
+            sid = uuid.uuid4().hex
+            # corpus solo in memoria: ogni utente ha il suo, nessun file condiviso su disco
+            s = self.bot.new_session(sid, None)
+            self.sessions[sid] = s
+            self.locks[sid] = asyncio.Lock()
+            self.sizes[sid] = 0
+            self.enforce_limits(keep=sid)
+        else:
+            sid = session_id
+            s = self.sessions.get(sid)
+            if s is None:
+                raise HttpError(404, "sessione inesistente o scaduta")
+        self.sessions.move_to_end(sid)
+        s.touch()
+        return s
+
+    def busy(self, sid: str) -> bool:
+        return self.locks[sid].locked()
+
+    def drop(self, sid: str) -> bool:
+        if sid not in self.sessions or self.busy(sid):
+            return False
+        del self.sessions[sid], self.locks[sid], self.sizes[sid]
+        self.bot.models.forget(sid)
+        return True
+
+    def update_size(self, s: Any) -> None:
+        if s.id in self.sizes:
+            self.sizes[s.id] = s.approx_bytes()
+
+    def total_bytes(self) -> int:
+        return sum(self.sizes.values())
+
+    def enforce_limits(self, keep: Optional[str] = None) -> None:
+        for sid in list(self.sessions):   # dalla meno recente
+            over_count = len(self.sessions) > self.max_sessions
+            over_mem = self.total_bytes() > self.max_bytes
+            if not (over_count or over_mem):
+                break
+            if sid != keep and self.drop(sid):
+                self.evicted["count" if over_count else "memory"] += 1
+
+    def evict_idle(self) -> None:
+        limit = time.time() - self.idle_s
+        for sid, s in list(self.sessions.items()):
+            if s.last_used < limit and self.drop(sid):
+                self.evicted["idle"] += 1
+
+    async def reaper(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, min(60.0, self.idle_s / 4)))
+            self.evict_idle()
+
+    def describe(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        return [{"id": sid, "model": s.model, "mode": s.mode, "lang": s.lang, "busy": self.busy(sid),
+                 "age_s": round(now - s.created), "idle_s": round(now - s.last_used),
+                 "approx_bytes": self.sizes.get(sid, 0)}
+                for sid, s in reversed(self.sessions.items())]
+
+# =====================
+# HTTP
+# =====================
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None   # connessione chiusa dal client
+    except asyncio.LimitOverrunError:
+        raise HttpError(413, "header troppo grandi")
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "richiesta non valida")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HttpError(400, "Content-Length non valido")
+    if length < 0:
+        raise HttpError(400, "Content-Length non valido")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "corpo troppo grande")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+def head_bytes(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}"] + [f"{k}: {v}" for k, v in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+async def send_json(writer: asyncio.StreamWriter, status: int, obj: Any, extra: Optional[Dict[str, str]] = None) -> None:
+    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/json; charset=utf-8", "Content-Length": str(len(data))}
+    headers.update(extra or {})
+    writer.write(head_bytes(status, headers) + data)
+    await writer.drain()
+
+class ChunkedWriter:
+    # Transfer-Encoding: chunked; drain() dopo ogni pezzo = contropressione verso il client
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+
+    async def write(self, text: str) -> None:
+        data = text.encode("utf-8")
+        if data:
+            self.writer.write(b"%x\r\n" % len(data) + data + b"\r\n")
+            await self.writer.drain()
+
+    async def close(self) -> None:
+        self.writer.write(b"0\r\n\r\n")
+        await self.writer.drain()
+
+# =====================
+# SERVER
+# =====================
+class BotServer:
+    def __init__(self, bot: Any, manager: SessionManager, workers: int, allow_files: bool, admin_token: str = "",
+                 allow_read: bool = False):
+        self.bot = bot
+        self.manager = manager
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="botia")
+        self.allow_files = allow_files
+        self.admin_token = admin_token
+        self.allow_read = allow_read
+        self.started = time.time()
+        self.requests = 0
+
+    def run_turn(self, s: Any, message: str, effective_lang: str, sink: Any) -> Tuple[str, Dict[str, Any]]:
+        # gira nel pool: la sessione è attiva solo in questo thread (contextvar)
+        with self.bot.sessions.use(s):
+            s.stream_sink = sink
+            try:
+                answer = self.bot.respond(message, effective_lang)
+            finally:
+                s.stream_sink = None
+        return answer, dict(s.last_stats)
+
+    def is_admin(self, headers: Dict[str, str]) -> bool:
+        token = headers.get("x-admin-token", "")
+        return bool(self.admin_token) and hmac.compare_digest(token.encode("utf-8"), self.admin_token.encode("utf-8"))
+
+    async def chat(self, writer: asyncio.StreamWriter, req: Dict[str, Any], headers: Dict[str, str]) -> None:
+        message = str(req.get("message") or "").strip()
+        if not message:
+            raise HttpError(400, "campo 'message' mancante")
+        words = message.lower().split()
+        if not self.allow_files and words[0] in FILE_COMMANDS:
+            raise HttpError(403, "comandi file disabilitati sul server (avvia con --allow-files)")
+        if not self.allow_read and words[0] in READ_COMMANDS:
+            raise HttpError(403, "/read disabilitato sul server (avvia con --allow-read)")
+        if tuple(words[:2]) in ADMIN_COMMANDS and not self.is_admin(headers):
+            raise HttpError(403, "comando globale riservato all'amministratore (header X-Admin-Token)")
+        sid = req.get("session")
+        if sid is not None and not (isinstance(sid, str) and 0 < len(sid) <= MAX_SESSION_ID):
+            raise HttpError(400, "'session' deve essere l'id restituito dal server")
+        stream = req.get("stream") or False
+        if stream is True:
+            stream = "sse"
+        if stream not in {False, "sse", "ndjson"}:
+            raise HttpError(400, "stream deve essere 'sse', 'ndjson' o false")
+
+        if self.bot.llm.saturated():
+            # coda del modello piena: meglio un 503 subito che un turno destinato a scadere
+            raise HttpError(503, "modello occupato, riprova tra poco")
+        s = self.manager.get(sid)
+        lock = self.manager.locks[s.id]
+        effective_lang = self.bot.detect_lang(message) if s.lang == "auto" else s.lang
+        loop = asyncio.get_running_loop()
+        queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        sink = (lambda tok: loop.call_soon_threadsafe(queue.put_nowait, tok)) if stream else None
+
+        async with lock:   # un comando alla volta per sessione, le altre sessioni vanno avanti
+            fut = loop.run_in_executor(self.pool, self.run_turn, s, message, effective_lang, sink)
+            fut.add_done_callback(lambda _f: loop.call_soon_threadsafe(queue.put_nowait, None))
+            try:
+                if stream:
+                    await self.stream_reply(writer, stream, s.id, queue, fut, effective_lang)
+                else:
+                    answer, stats = await fut
+                    await send_json(writer, 200, {"session": s.id, "answer": answer, "lang": effective_lang,
+                                                  "stats": stats}, {"X-Session": s.id})
+            finally:
+                if not fut.done():
+                    # client disconnesso: il turno finisce comunque, la sessione resta coerente
+                    await asyncio.wait([fut])
+                s.touch()
+                self.manager.update_size(s)
+        self.manager.enforce_limits(keep=s.id)
+
+    async def stream_reply(self, writer: asyncio.StreamWriter, kind: str, sid: str,
+                           queue: "asyncio.Queue[Optional[str]]", fut: "asyncio.Future", lang: str) -> None:
+        ctype = "text/event-stream; charset=utf-8" if kind == "sse" else "application/x-ndjson; charset=utf-8"
+        writer.write(head_bytes(200, {"Content-Type": ctype, "Transfer-Encoding": "chunked",
+                                      "Cache-Control": "no-cache", "X-Session": sid}))
+        out = ChunkedWriter(writer)
+
+        def event(obj: Dict[str, Any], name: str = "") -> str:
+            data = json.dumps(obj, ensure_ascii=False)
+            if kind == "ndjson":
+                return data + "\n"
+            return (f"event: {name}\n" if name else "") + f"data: {data}\n\n"
+
+        streamed = False
+        while True:
+            tok = await queue.get()
+            if tok is None:
+                break
+            streamed = True
+            # accorpa i token già arrivati: meno chunk e meno drain sotto carico
+            parts = [tok]
+            while not queue.empty():
+                nxt = queue.get_nowait()
+                if nxt is None:
+                    queue.put_nowait(None)
+                    break
+                parts.append(nxt)
+            await out.write(event({"token": "".join(parts)}))
+        try:
+            answer, stats = fut.result()
+        except Exception as e:
+            await out.write(event({"error": f"{e.__class__.__name__}: {e}"}, "error"))
+        else:
+            if not streamed:
+                await out.write(event({"token": answer}))   # comandi senza streaming (/sum, /docs, ...)
+            await out.write(event({"done": True, "session": sid, "answer": answer, "lang": lang, "stats": stats}, "done"))
+        await out.close()
+
+    def gauges(self) -> List[Tuple[str, str, Dict[str, Any], float]]:
+        llm = self.bot.llm.stats()
+        out = [("botia_sessions", "Sessioni aperte", {}, len(self.manager.sessions)),
+               ("botia_sessions_busy", "Sessioni con un turno in corso",
+                {}, sum(1 for sid in self.manager.sessions if self.manager.busy(sid))),
+               ("botia_sessions_bytes", "Memoria stimata delle sessioni", {}, self.manager.total_bytes())]
+        for cls, st in llm["classes"].items():
+            out.append(("botia_llm_queued", "Chiamate al modello in coda", {"class": cls}, st["queued"]))
+            out.append(("botia_llm_running", "Chiamate al modello in corso", {"class": cls}, st["running"]))
+        if isinstance(self.bot.backend, BackendPool):
+            for b in self.bot.backend.stats():
+                out.append(("botia_backend_inflight", "Richieste in corso per backend", {"host": b["host"]}, b["inflight"]))
+                out.append(("botia_backend_up", "Backend con circuito chiuso (1) o aperto (0)",
+                            {"host": b["host"]}, 0 if b["state"] == "open" else 1))
+        for model, st in self.bot.models.stats()["models"].items():
+            out.append(("botia_model_loaded", "Modello caricato in Ollama (1) o no (0)",
+                        {"model": model}, 1 if st["state"] == "loaded" else 0))
+            if st["load_s"] is not None:
+                out.append(("botia_model_load_seconds", "Ultimo tempo di caricamento misurato", {"model": model}, st["load_s"]))
+        return out
+
+    async def route(self, writer: asyncio.StreamWriter, method: str, path: str,
+                    headers: Dict[str, str], body: bytes) -> None:
+        if path == "/metrics":
+            data = self.bot.metrics.prometheus(self.gauges()).encode("utf-8")
+            writer.write(head_bytes(200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8",
+                                          "Content-Length": str(len(data))}) + data)
+            await writer.drain()
+            return
+        if path == "/health":
+            busy = sum(1 for sid in self.manager.sessions if self.manager.busy(sid))
+            out = {"ok": True, "uptime_s": round(time.time() - self.started),
+                   "sessions": len(self.manager.sessions), "busy": busy,
+                   "approx_bytes": self.manager.total_bytes(),
+                   "evicted": self.manager.evicted, "requests": self.requests,
+                   "llm": self.bot.llm.stats(), "models": self.bot.models.stats()}
+            if isinstance(self.bot.backend, BackendPool):
+                out["backends"] = self.bot.backend.stats()
+            await send_json(writer, 200, out)
+            return
+        if path == "/api/sessions":
+            if method != "GET":
+                raise HttpError(405, "usa GET")
+            if not self.is_admin(headers):
+                raise HttpError(403, "elenco sessioni riservato all'amministratore (header X-Admin-Token)")
+            await send_json(writer, 200, {"sessions": self.manager.describe()})
+            return
+        if path.startswith("/api/session/"):
+            if method != "DELETE":
+                raise HttpError(405, "usa DELETE")
+            sid = path.rsplit("/", 1)[1]
+            if sid not in self.manager.sessions:
+                raise HttpError(404, "sessione inesistente")
+            if not self.manager.drop(sid):
+                raise HttpError(409, "sessione occupata")
+            await send_json(writer, 200, {"deleted": sid})
+            return
+        if path == "/api/chat":
+            if method != "POST":
+                raise HttpError(405, "usa POST")
+            try:
+                req = json.loads(body or b"{}")
+            except ValueError:
+                raise HttpError(400, "JSON non valido")
+            if not isinstance(req, dict):
+                raise HttpError(400, "il corpo deve essere un oggetto JSON")
+            await self.chat(writer, req, headers)
+            return
+        raise HttpError(404, "percorso sconosciuto")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # HTTP/1.1 con keep-alive: più richieste sulla stessa connessione
+        try:
+            while True:
+                headers: Dict[str, str] = {}
+                try:
+                    parsed = await read_request(reader)
+                    if parsed is None:
+                        break
+                    method, path, headers, body = parsed
+                    self.requests += 1
+                    await self.route(writer, method, path, headers, body)
+                except HttpError as e:
+                    await send_json(writer, e.status, {"error": str(e)})
+                    if e.status in {400, 413}:
+                        break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    # errore nel bot (es. provider di ricerca giù): il client riceve comunque una risposta
+                    traceback.print_exc(file=sys.stderr)
+                    await send_json(writer, 500, {"error": f"{e.__class__.__name__}: {e}"})
+                    break
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(args: argparse.Namespace) -> None:
+    bot = importlib.import_module(args.bot)
+    # fuori da sessions.use() niente sessione CLI col corpus su disco: una sessione del server, in memoria
+    bot.sessions.set_default(lambda: bot.new_session("server", None))
+    if args.trace or args.profile:
+        bot.tracer.configure(args.trace or "traces", profile_top=args.profile)
+    manager = SessionManager(bot, args.idle, args.max_sessions, args.max_mb * 1024 * 1024)
+    app = BotServer(bot, manager, args.workers, args.allow_files, args.admin_token, args.allow_read)
+    server = await asyncio.start_server(app.handle, args.host, args.port, limit=MAX_HEADER_BYTES)
+    reaper = asyncio.create_task(manager.reaper())
+    # modello di default caldo da subito; i ping di keep-alive seguono le sessioni aperte
+    bot.models.idle_s = args.idle
+    bot.preload_model(bot.MODEL)
+    if bot.WARMUP_IMPORTS:
+        warm_up()    # pypdf, numpy, requests... pronti prima della prima richiesta che li usa
+    print(f"🤖 BotIA server ({args.bot}) su http://{args.host}:{args.port} | modello={bot.MODEL} | workers={args.workers}",
+          file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        reaper.cancel()
+        app.pool.shutdown(wait=False)
+        bot.release_models()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    ap = argparse.ArgumentParser(description="BotIA server HTTP multi-utente")
+    ap.add_argument("--bot", default="bot", choices=["bot", "bot_web"])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=8, help="thread per le chiamate al bot (turni in parallelo)")
+    ap.add_argument("--idle", type=float, default=1800, help="secondi di inattività prima di chiudere una sessione")
+    ap.add_argument("--max-sessions", type=int, default=200)
+    ap.add_argument("--max-mb", type=int, default=512, help="tetto di memoria stimata per tutte le sessioni")
+    ap.add_argument("--allow-files", action="store_true", help="abilita /file /pdf /docx (percorsi del server)")
+    ap.add_argument("--allow-read", action="store_true", help="abilita /read <url> (scarica dalla rete del server)")
+    ap.add_argument("--admin-token", default=os.environ.get("BOTIA_ADMIN_TOKEN", ""),
+                    help="token (header X-Admin-Token) per /cache clear e /stats reset; vuoto = disabilitati")
+    ap.add_argument("--trace", default="", help="cartella per le tracce delle richieste (JSON Chrome)")
+    ap.add_argument("--profile", type=int, default=0, metavar="N",
+                    help="cProfile + tracemalloc per le N richieste più lente")
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import backend_pool  # noqa: E402
+from backend_pool import BackendPool  # noqa: E402
+from fake_ollama import FakeOllama  # noqa: E402
+from ollama_client import OllamaError, OllamaHTTPError, OllamaUnavailable  # noqa: E402
+
+MODEL = "llama3.2"
+
+@pytest.fixture
+def nodes():
+    started = []
+
+    def make(**kw):
+        kw.setdefault("ttft_s", 0.0)
+        kw.setdefault("tokens_per_s", 0.0)
+        kw.setdefault("reply_tokens", 8)
+        srv = FakeOllama(**kw).start()
+        started.append(srv)
+        return srv
+    yield make
+    for srv in started:
+        srv.stop()
+
+def dead_url() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+def make_pool(*urls: str) -> BackendPool:
+    return BackendPool([(u, None) for u in urls], connect_timeout=1, read_timeout=5, health_interval_s=0)
+
+def by_host(pool: BackendPool):
+    return {st["host"]: st for st in pool.stats()}
+
+def test_failover_to_live_node(nodes):
+    live = nodes()
+    dead = dead_url()
+    pool = make_pool(dead, live.url)
+    assert pool.generate(MODEL, "ciao")
+    st = by_host(pool)
+    assert st[dead]["errors"] == 1 and st[live.url]["requests"] == 1 and st[live.url]["retries"] == 1
+
+def test_breaker_opens_then_half_open_trial_closes(nodes, monkeypatch):
+    monkeypatch.setattr(backend_pool, "COOLDOWN_S", 0.2)
+    flaky = nodes(fail_rate=1.0, fail_status=503)
+    pool = make_pool(flaky.url)
+    for _ in range(backend_pool.FAIL_THRESHOLD):
+        with pytest.raises(OllamaHTTPError):
+            pool.generate(MODEL, "ciao")
+    assert by_host(pool)[flaky.url]["state"] == "open"
+    assert by_host(pool)[flaky.url]["opened"] == 1
+    # circuito aperto: si rifiuta subito, il nodo non riceve richieste
+    with pytest.raises(OllamaUnavailable):
+        pool.generate(MODEL, "ciao")
+    assert flaky.counters["requests"] == backend_pool.FAIL_THRESHOLD
+
+    time.sleep(0.25)
+    assert by_host(pool)[flaky.url]["state"] == "half-open"
+    with pytest.raises(OllamaHTTPError):
+        pool.generate(MODEL, "ciao")                # prova fallita: di nuovo aperto
+    assert by_host(pool)[flaky.url]["state"] == "open"
+    assert by_host(pool)[flaky.url]["opened"] == 2
+
+    flaky.fail_rate = 0.0
+    time.sleep(0.25)
+    assert pool.generate(MODEL, "ciao")             # prova riuscita: chiuso
+    assert by_host(pool)[flaky.url]["state"] == "closed"
+    assert flaky.counters["requests"] == backend_pool.FAIL_THRESHOLD + 2
+
+def test_missing_model_routes_elsewhere_without_opening(nodes):
+    other = nodes(models=["qwen2.5:latest"])
+    live = nodes()
+    pool = make_pool(other.url, live.url)
+    for _ in range(backend_pool.FAIL_THRESHOLD + 1):
+        pool.generate(MODEL, "ciao")
+    st = by_host(pool)
+    # 404 una volta sola: poi il nodo è escluso per quel modello, ma non guasto
+    assert other.counters["requests"] == 0 and st[other.url]["errors"] == 1
+    assert st[other.url]["state"] == "closed"
+    assert st[live.url]["requests"] == backend_pool.FAIL_THRESHOLD + 1
+    with pytest.raises(OllamaError, match="404"):
+        make_pool(other.url).generate(MODEL, "ciao")
+
+def test_stream_retried_only_before_first_token(nodes):
+    # errore prima del primo token: lo stream riparte sull'altro nodo
+    broken = nodes(fail_rate=1.0, fail_status=503)
+    live = nodes()
+    pool = make_pool(broken.url, live.url)
+    chunks = list(pool.generate_stream(MODEL, "ciao"))
+    assert chunks[-1]["done"] and live.counters["requests"] == 1
+
+    # errore dopo alcuni token: nessun retry, chi legge ha già ricevuto una parte della risposta
+    cut = nodes(fail_after_tokens=3)
+    live2 = nodes()
+    pool = make_pool(cut.url, live2.url)
+    got = []
+    with pytest.raises(OllamaError, match="mid-stream"):
+        for chunk in pool.generate_stream(MODEL, "ciao"):
+            got.append(chunk["response"])
+    assert len(got) == 3
+    assert live2.counters["requests"] == 0
+    st = by_host(pool)[cut.url]
+    assert st["errors"] == 1 and st["inflight"] == 0
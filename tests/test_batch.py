@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+import threading
+import time
+import types
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from scheduler import FairScheduler  # noqa: E402
+
+REPLIES = {
+    "buona": "Riavvia Outlook in modalità provvisoria.",
+    "vuota": "",
+    "nessuna": "[Nessuna risposta]",
+    "ollama": "[Errore Ollama] connessione rifiutata",
+    "comando": "Errore nel file: formato non supportato",
+    "stats": "risposta parziale",
+}
+
+def make_bot(max_concurrent: int) -> types.ModuleType:
+    bot = types.ModuleType("fake_batch_bot")
+    bot.DEFAULT_MODE, bot.DEFAULT_LANG = "helpdesk", "it"
+    bot.ERROR_PREFIXES = ("[Errore", "Errore ", "Error ")
+    bot.llm = FairScheduler(max_concurrent, reserve_chat=0)
+    bot.metrics = Metrics()
+    bot.peak = 0
+    bot.forgotten = []
+    bot.released = 0
+    bot.models = SimpleNamespace(forget=bot.forgotten.append)
+
+    def release_models():
+        bot.released += 1
+    running = [0]
+    lock = threading.Lock()
+    current = threading.local()
+
+    def new_session(sid, _docs_dir):
+        return SimpleNamespace(id=sid, mode=None, lang=None, last_stats={}, last_file_text=None)
+
+    @contextmanager
+    def use(s):
+        current.s = s
+        yield s
+
+    def respond(msg, _lang):
+        if msg == "eccezione":
+            raise RuntimeError("backend giù")
+        with bot.llm.slot():
+            with lock:
+                running[0] += 1
+                bot.peak = max(bot.peak, running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+        if msg == "stats":
+            current.s.last_stats["error"] = "timeout a metà risposta"
+        return REPLIES[msg]
+
+    bot.new_session = new_session
+    bot.sessions = SimpleNamespace(use=use)
+    bot.detect_lang = lambda _msg: "it"
+    bot.respond = respond
+    bot.release_models = release_models
+    return bot
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    def go(messages, workers=1, max_concurrent=2):
+        bot = make_bot(max_concurrent)
+        monkeypatch.setitem(sys.modules, bot.__name__, bot)
+        src = tmp_path / "in.jsonl"
+        src.write_text("".join(json.dumps({"id": f"r{i}", "message": m}) + "\n" for i, m in enumerate(messages)),
+                       encoding="utf-8")
+        out = tmp_path / "out.jsonl"
+        stats = batch.run_batch(str(src), str(out), workers, bot.__name__, progress=False)
+        results = {r["id"]: r for r in map(json.loads, out.read_text(encoding="utf-8").splitlines())}
+        return stats, [results[f"r{i}"] for i in range(len(messages))], bot
+    return go
+
+def test_ok_false_on_every_error_path(run):
+    messages = ["buona", "vuota", "nessuna", "ollama", "comando", "stats", "eccezione"]
+    stats, results, _bot = run(messages)
+    assert [r["ok"] for r in results] == [True] + [False] * 6
+    assert all(r.get("error") for r in results[1:])
+    assert "RuntimeError" in results[-1]["error"]
+    assert stats["ok"] == 1 and stats["errors"] == 6
+
+def test_workers_share_one_concurrency_limit(run):
+    stats, results, bot = run(["buona"] * 24, workers=6, max_concurrent=2)
+    assert stats["ok"] == 24
+    assert bot.peak == 2
+
+def test_sessions_forgotten_and_models_released(run):
+    _stats, results, bot = run(["buona", "eccezione", "vuota"], workers=2)
+    assert sorted(bot.forgotten) == [f"batch-r{i}" for i in range(3)]
+    assert bot.released == 1
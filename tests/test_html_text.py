@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_text import extract_content  # noqa: E402
+
+PARAGRAPHS = [
+    "Il servizio di stampa si blocca quando lo spooler resta con lavori corrotti in coda dopo un riavvio improvviso.",
+    "Per risolvere, arresta il servizio Spooler, svuota la cartella dei lavori in sospeso e riavvia il servizio.",
+    "Se il problema si ripete, controlla il driver della stampante e aggiorna alla versione certificata dal produttore.",
+]
+
+def page(body_open: str, body_close: str = "</body>") -> str:
+    article = "".join(f"<p>{p}</p>" for p in PARAGRAPHS)
+    return (f"<html><head><title>Spooler</title></head>{body_open}"
+            f"<nav class='main-nav'><a href='/'>Home</a> <a href='/blog'>Blog</a> <a href='/contatti'>Contatti</a></nav>"
+            f"{article}"
+            f"<div class='site-footer'>© 2024 Esempio srl - tutti i diritti riservati - privacy - cookie</div>"
+            f"{body_close}</html>")
+
+@pytest.mark.parametrize("body_open,body_close", [
+    ("<body class='home has-sidebar'>", "</body>"),
+    ("<body class='single-post social-enabled'>", "</body>"),
+    ("<body class='related-posts-enabled'><main>", "</main></body>"),
+    ("<body><div class='content-with-related'>", "</div></body>"),
+])
+def test_state_classes_do_not_drop_the_page(body_open, body_close):
+    text = extract_content(page(body_open, body_close))
+    for p in PARAGRAPHS:
+        assert p in text
+    assert "Contatti" not in text
+    assert "diritti riservati" not in text
+
+def test_main_overrides_boilerplate_above_it():
+    html = "<body><div class='sidebar'><main>" + "".join(f"<p>{p}</p>" for p in PARAGRAPHS) + "</main></div></body>"
+    text = extract_content(html)
+    assert all(p in text for p in PARAGRAPHS)
+
+def test_boilerplate_inside_main_is_still_dropped():
+    html = ("<body><article>" + "".join(f"<p>{p}</p>" for p in PARAGRAPHS)
+            + "<div class='share-buttons'>Condividi questo articolo su tutti i social network</div></article></body>")
+    text = extract_content(html)
+    assert all(p in text for p in PARAGRAPHS)
+    assert "Condividi" not in text
+
+def test_falls_back_to_plain_text_when_nothing_is_kept():
+    html = "<body><div class='sidebar'><p>Testo breve ma unico della pagina.</p></div></body>"
+    assert extract_content(html) == "Testo breve ma unico della pagina."
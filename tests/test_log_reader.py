@@ -0,0 +1,40 @@
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_reader  # noqa: E402
+from log_reader import LogReader  # noqa: E402
+
+LINES = [f"2024-05-{1 + i // 1000:02d} 10:00:00 {'ERROR' if i % 7 == 0 else 'INFO'} riga {i + 1}\x0bfine" for i in range(5000)]
+
+@pytest.fixture
+def log_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_reader, "BLOCK_BYTES", 1000)   # molti blocchi anche su un file piccolo
+    path = tmp_path / "app.log"
+    path.write_bytes("\r\n".join(LINES).encode("utf-8") + b"\r\n")
+    return str(path)
+
+def test_char_cut_starts_on_reported_line(log_path):
+    with LogReader(log_path) as r:
+        text, info = r.window(since=log_reader.parse_timestamp("2024-05-03"), max_chars=5000)
+    assert info["truncated"]
+    first = text.split("\n", 1)[0].rstrip("\r")
+    assert first == LINES[info["first_line"] - 1]
+
+def test_grep_line_numbers_ignore_other_separators(log_path):
+    with LogReader(log_path) as r:
+        text, info = r.window(grep=r"error.*fine$", max_chars=10**6, max_matches=10**6)
+    expected = [f"L{i + 1}: {line}" for i, line in enumerate(LINES) if re.search(r"error.*fine$", line, re.I)]
+    assert text.split("\n") == expected
+    assert info["matches"] == len(expected)
+
+def test_grep_tail_keeps_last_matches(log_path):
+    with LogReader(log_path) as r:
+        text, info = r.window(tail=3, grep="ERROR", max_matches=2)
+    expected = [f"L{i + 1}: {line}" for i, line in enumerate(LINES) if "ERROR" in line][-2:]
+    assert text.split("\n") == expected
+    assert info["truncated"]
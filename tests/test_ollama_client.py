@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from fake_ollama import FakeOllama  # noqa: E402
+from ollama_client import OllamaClient, OllamaHTTPError  # noqa: E402
+
+MODEL = "nomic-embed-text"
+TEXTS = ["stampante offline", "reset password di dominio"]
+
+@pytest.fixture
+def fake():
+    started = []
+
+    def make(**kw):
+        srv = FakeOllama(ttft_s=0.0, **kw).start()
+        started.append(srv)
+        return srv
+    yield make
+    for srv in started:
+        srv.stop()
+
+def test_embed_uses_batch_endpoint(fake):
+    srv = fake()
+    vecs = OllamaClient(srv.url).embed(MODEL, TEXTS)
+    assert len(vecs) == 2 and len(vecs[0]) == srv.embed_dim
+    assert srv.counters["requests"] == 1
+
+def test_embed_falls_back_on_legacy_server(fake):
+    modern, legacy = fake(), fake(legacy_embed=True)
+    vecs = OllamaClient(legacy.url).embed(MODEL, TEXTS)
+    assert vecs == OllamaClient(modern.url).embed(MODEL, TEXTS)
+    assert legacy.counters["requests"] == len(TEXTS)     # un /api/embeddings per testo
+
+def test_embed_other_errors_do_not_fall_back(fake):
+    srv = fake(fail_rate=1.0, fail_status=503)
+    with pytest.raises(OllamaHTTPError) as e:
+        OllamaClient(srv.url).embed(MODEL, TEXTS)
+    assert e.value.status == 503
+    assert srv.counters["requests"] == 1
+
+def test_embed_missing_model_raises_404(fake):
+    srv = fake()
+    with pytest.raises(OllamaHTTPError) as e:
+        OllamaClient(srv.url).embed("modello-404", TEXTS)
+    assert e.value.status == 404
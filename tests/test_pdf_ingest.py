@@ -0,0 +1,51 @@
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import pdf_ingest  # noqa: E402
+from bench_suite import make_pdf  # noqa: E402
+from pdf_ingest import iter_pdf_pages  # noqa: E402
+
+pytest.importorskip("pypdf")
+
+@pytest.fixture(scope="module")
+def big_pdf(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("pdf") / "manuale.pdf")
+    make_pdf(path, 400, random.Random(3))
+    return path
+
+def wait_until(cond, timeout=5.0):
+    end = time.perf_counter() + timeout
+    while not cond():
+        assert time.perf_counter() < end, "condizione non raggiunta"
+        time.sleep(0.02)
+
+def test_sequential_budget_checked_per_page(big_pdf, monkeypatch):
+    calls = []
+    real = pdf_ingest._page_text
+    monkeypatch.setattr(pdf_ingest, "_page_text", lambda reader, i: calls.append(i) or real(reader, i))
+    stats = {}
+    pages = list(iter_pdf_pages(big_pdf, workers=1, time_budget_s=1e-9, stats=stats))
+    assert [n for n, _t in pages] == [1]
+    assert calls == [0]                 # nessuna pagina estratta oltre il budget
+    assert stats["truncated"] == "tempo"
+
+@pytest.mark.parametrize("budget", [{"time_budget_s": 0.05}, {"max_text_bytes": 1000}])
+def test_parallel_early_exit_stops_workers(big_pdf, budget):
+    stats = {}
+    pages = list(iter_pdf_pages(big_pdf, workers=2, batch_pages=200, stats=stats, **budget))
+    assert stats["truncated"] in {"tempo", "memoria"}
+    assert len(pages) < stats["total_pages"]
+    # i processi del pool non restano a estrarre le 200 pagine già assegnate
+    wait_until(lambda: not multiprocessing.active_children(), timeout=0.5)
+
+def test_parallel_matches_sequential(big_pdf):
+    assert list(iter_pdf_pages(big_pdf, workers=2)) == list(iter_pdf_pages(big_pdf, workers=1))
@@ -0,0 +1,15 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache, make_key  # noqa: E402
+
+def test_clear_counts_each_key_once(tmp_path):
+    cache = ResponseCache(str(tmp_path), 10, 10**6)
+    for i in range(3):
+        cache.put(make_key("m", None, f"domanda {i}"), f"risposta {i}")   # memoria + disco
+    other = ResponseCache(str(tmp_path), 10, 10**6)
+    other.put(make_key("m", None, "solo su disco per cache"), "x")
+    assert cache.clear() == 4
+    assert cache.clear() == 0
@@ -0,0 +1,116 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import FairScheduler, SchedulerFull  # noqa: E402
+
+def wait_until(cond, timeout=5.0):
+    end = time.perf_counter() + timeout
+    while not cond():
+        assert time.perf_counter() < end, "condizione non raggiunta"
+        time.sleep(0.001)
+
+class Queue:
+    # richieste in attesa su thread separati, accodate in un ordine noto; il test rilascia
+    # uno slot alla volta e registra chi lo ottiene
+    def __init__(self, sched):
+        self.sched = sched
+        self.order = []
+        self.threads = []
+
+    def add(self, cls, owner, label):
+        before = self.sched.stats()["queued"]
+
+        def run():
+            self.sched.acquire(cls, owner)
+            self.order.append((label, cls))
+        t = threading.Thread(target=run, daemon=True)
+        t.start()
+        self.threads.append(t)
+        wait_until(lambda: self.sched.stats()["queued"] == before + 1)
+
+    def drain(self, held_cls):
+        # rilascia lo slot tenuto dal test, poi quello di ogni richiesta servita
+        cls = held_cls
+        while len(self.order) < len(self.threads):
+            n = len(self.order)
+            self.sched.release(cls)
+            wait_until(lambda: len(self.order) == n + 1)
+            cls = self.order[-1][1]
+        self.sched.release(cls)
+        for t in self.threads:
+            t.join(1)
+        return [label for label, _cls in self.order]
+
+def test_priority_between_classes():
+    sched = FairScheduler(1, aging_s=0, reserve_chat=0)
+    sched.acquire("batch", "tester")
+    q = Queue(sched)
+    q.add("batch", "s1", "b1")
+    q.add("askfile", "s2", "a1")
+    q.add("chat", "s3", "c1")
+    q.add("batch", "s4", "b2")
+    assert q.drain("batch") == ["c1", "a1", "b1", "b2"]
+
+def test_round_robin_between_sessions():
+    sched = FairScheduler(1, aging_s=0, reserve_chat=0)
+    sched.acquire("chat", "tester")
+    q = Queue(sched)
+    for i in range(3):
+        q.add("chat", "A", f"A{i}")
+    q.add("chat", "B", "B0")
+    q.add("chat", "C", "C0")
+    assert q.drain("chat") == ["A0", "B0", "C0", "A1", "A2"]
+
+def test_reserved_slot_keeps_chat_moving():
+    sched = FairScheduler(2, aging_s=0, reserve_chat=1)
+    sched.acquire("batch", "tester")
+    q = Queue(sched)
+    q.add("batch", "s1", "b1")          # un posto libero, ma è la riserva della chat
+    assert q.order == []
+    granted = threading.Event()
+
+    def chat():
+        sched.acquire("chat", "s2")
+        granted.set()
+    threading.Thread(target=chat, daemon=True).start()
+    assert granted.wait(2)
+    assert sched.stats()["classes"]["batch"]["queued"] == 1
+    sched.release("chat")
+    assert q.order == []                # la chat ha liberato la riserva, non uno slot batch
+    assert q.drain("batch") == ["b1"]
+
+def test_aging_promotes_old_batch_request():
+    sched = FairScheduler(1, aging_s=0.05, reserve_chat=0)
+    sched.acquire("chat", "tester")
+    q = Queue(sched)
+    q.add("batch", "s1", "b1")
+    time.sleep(0.2)                     # 4 classi di invecchiamento: ora batte una chat appena arrivata
+    q.add("chat", "s2", "c1")
+    assert q.drain("chat") == ["b1", "c1"]
+
+def test_full_queue_and_wait_timeout_reject():
+    sched = FairScheduler(1, max_queue=2, max_queue_per_owner=1, max_wait_s=5, reserve_chat=0)
+    sched.acquire("chat", "tester")
+    q = Queue(sched)
+    q.add("chat", "A", "A0")
+    with pytest.raises(SchedulerFull):
+        sched.acquire("chat", "A")      # limite per proprietario
+    q.add("chat", "B", "B0")
+    with pytest.raises(SchedulerFull):
+        sched.acquire("chat", "C")      # limite totale
+    assert sched.saturated()
+    assert sched.stats()["classes"]["chat"]["rejected"] == 2
+    assert q.drain("chat") == ["A0", "B0"]
+
+    sched = FairScheduler(1, max_wait_s=0.05)
+    sched.acquire("chat", "tester")
+    with pytest.raises(SchedulerFull):
+        sched.acquire("batch", "s1")
+    st = sched.stats()
+    assert st["queued"] == 0 and st["classes"]["batch"]["timeouts"] == 1
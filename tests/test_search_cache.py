@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_cache import FakeSearchProvider, SearchCache  # noqa: E402
+
+class FlakyProvider(FakeSearchProvider):
+    # fallisce dalla chiamata fail_from in poi
+    def __init__(self, fail_from, latency_s=0.0):
+        super().__init__(latency_s=latency_s)
+        self.fail_from = fail_from
+
+    def __call__(self, query, max_results):
+        results = super().__call__(query, max_results)
+        if self.calls >= self.fail_from:
+            raise ConnectionError("rate limit del provider")
+        return results
+
+def wait_until(cond, timeout=5.0):
+    end = time.perf_counter() + timeout
+    while not cond():
+        assert time.perf_counter() < end, "condizione non raggiunta"
+        time.sleep(0.005)
+
+def test_identical_concurrent_queries_share_one_call():
+    provider = FakeSearchProvider(latency_s=0.2)
+    cache = SearchCache(provider)
+    queries = ["ultima versione Outlook", "versione ultima outlook", "Outlook, ultima versione!"] * 3
+    out = [None] * len(queries)
+
+    def run(i):
+        out[i] = cache.search(queries[i], 3)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(queries))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert provider.calls == 1
+    assert all(r == out[0] for r in out) and len(out[0]) == 3
+    st = cache.stats()
+    assert st["misses"] == 1 and st["coalesced"] == len(queries) - 1
+
+def test_ttl_expiry_without_stale_window():
+    provider = FakeSearchProvider()
+    cache = SearchCache(provider, ttl_s=0.1, stale_s=0)
+    cache.search("driver stampante", 3)
+    cache.search("stampante driver", 3)
+    assert provider.calls == 1 and cache.stats()["hits"] == 1
+    time.sleep(0.15)
+    cache.search("driver stampante", 3)
+    assert provider.calls == 2 and cache.stats()["misses"] == 2
+
+def test_stale_while_revalidate():
+    provider = FakeSearchProvider(latency_s=0.3)
+    cache = SearchCache(provider, ttl_s=0.1, stale_s=10)
+    first = cache.search("vpn lenta", 2)
+    time.sleep(0.15)
+    t0 = time.perf_counter()
+    assert cache.search("vpn lenta", 2) == first       # subito, senza aspettare il provider
+    assert time.perf_counter() - t0 < 0.1
+    cache.search("vpn lenta", 2)                        # aggiornamento già in volo: nessuna seconda chiamata
+    wait_until(lambda: provider.calls == 2 and not cache._inflight)
+    st = cache.stats()
+    assert st["stale_hits"] == 2 and st["refreshes"] == 1
+    cache.search("vpn lenta", 2)
+    assert cache.stats()["hits"] == 1 and provider.calls == 2
+
+def test_refresh_error_keeps_stale_result():
+    provider = FlakyProvider(fail_from=2)
+    cache = SearchCache(provider, ttl_s=0.05, stale_s=10)
+    first = cache.search("errore certificato", 2)
+    time.sleep(0.1)
+    assert cache.search("errore certificato", 2) == first
+    wait_until(lambda: cache.stats()["errors"] == 1 and not cache._inflight)
+    # il risultato vecchio resta servibile e la prossima richiesta riprova l'aggiornamento
+    assert cache.search("errore certificato", 2) == first
+    wait_until(lambda: cache.stats()["errors"] == 2 and not cache._inflight)
+    assert cache.stats()["refreshes"] == 2
+
+def test_miss_error_reaches_every_waiter():
+    provider = FlakyProvider(fail_from=1, latency_s=0.2)
+    cache = SearchCache(provider)
+    errors = []
+
+    def run():
+        try:
+            cache.search("proxy aziendale", 2)
+        except ConnectionError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(errors) == 4 and provider.calls == 1
+    assert cache.stats()["entries"] == 0 and not cache._inflight
+    with pytest.raises(ConnectionError):
+        cache.search("proxy aziendale", 2)              # niente errore in cache: si riprova
+    assert provider.calls == 2
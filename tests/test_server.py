@@ -0,0 +1,115 @@
+import asyncio
+import contextlib
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import server  # noqa: E402
+from server import BotServer, HttpError, SessionManager, read_request  # noqa: E402
+
+def parse(raw: bytes):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        return await read_request(reader)
+    return asyncio.run(run())
+
+@pytest.mark.parametrize("value,status", [("abc", 400), ("-5", 400), (str(server.MAX_BODY_BYTES + 1), 413)])
+def test_bad_content_length(value, status):
+    with pytest.raises(HttpError) as e:
+        parse(b"POST /api/chat HTTP/1.1\r\nContent-Length: " + value.encode() + b"\r\n\r\n{}")
+    assert e.value.status == status
+
+def test_body_read_with_valid_length():
+    assert parse(b"POST /api/chat HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}")[3] == b"{}"
+
+@pytest.mark.parametrize("message", ["/cache clear", "/stats  RESET"])
+def test_global_commands_need_admin_token(message):
+    # il controllo avviene prima di toccare bot e sessioni
+    for token, headers in [("", {"x-admin-token": ""}), ("segreto", {}), ("segreto", {"x-admin-token": "altro"})]:
+        app = BotServer(None, None, 1, False, token)
+        with pytest.raises(HttpError) as e:
+            asyncio.run(app.chat(None, {"message": message}, headers))
+        assert e.value.status == 403
+        app.pool.shutdown()
+
+class FakeBot:
+    # quanto basta a BotServer: respond() risponde con l'eco o solleva
+    def __init__(self):
+        self.llm = SimpleNamespace(saturated=lambda: False)
+        self.models = SimpleNamespace(forget=lambda sid: None)
+        self.sessions = SimpleNamespace(use=lambda s: contextlib.nullcontext(s))
+
+    def new_session(self, sid, _docs_dir):
+        return SimpleNamespace(id=sid, lang="it", last_stats={}, stream_sink=None, last_used=0.0,
+                               touch=lambda: None, approx_bytes=lambda: 0)
+
+    def detect_lang(self, _msg):
+        return "it"
+
+    def respond(self, message, _lang):
+        if message == "esplodi":
+            raise RuntimeError("provider di ricerca giù")
+        return "eco: " + message
+
+def exchange(requests, admin_token="tok"):
+    # avvia il server su una porta libera e manda le richieste in ordine (una connessione ciascuna)
+    async def run():
+        bot = FakeBot()
+        app = BotServer(bot, SessionManager(bot, 60, 10, 10**6), 2, False, admin_token)
+        srv = await asyncio.start_server(app.handle, "127.0.0.1", 0)
+        port = srv.sockets[0].getsockname()[1]
+        out = []
+        try:
+            for method, path, body, headers in requests:
+                if callable(body):
+                    body = body(out)
+                data = json.dumps(body).encode() if body is not None else b""
+                head = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(f"{method} {path} HTTP/1.1\r\nContent-Length: {len(data)}\r\n{head}"
+                             "Connection: close\r\n\r\n".encode() + data)
+                raw = await reader.read()
+                writer.close()
+                status = int(raw.split(b" ", 2)[1]) if raw else None
+                out.append((status, json.loads(raw.split(b"\r\n\r\n", 1)[1]) if raw else None))
+        finally:
+            srv.close()
+            app.pool.shutdown()
+        return out
+    return asyncio.run(run())
+
+def test_bot_exception_returns_500():
+    (status, body), = exchange([("POST", "/api/chat", {"message": "esplodi"}, {})])
+    assert status == 500
+    assert "provider di ricerca" in body["error"]
+
+@pytest.mark.parametrize("session", [{"a": 1}, ["x"], 5, "", "x" * (server.MAX_SESSION_ID + 1)])
+def test_invalid_session_is_400(session):
+    (status, _body), = exchange([("POST", "/api/chat", {"session": session, "message": "ciao"}, {})])
+    assert status == 400
+
+def test_only_server_issued_session_ids():
+    res = exchange([
+        ("POST", "/api/chat", {"message": "ciao"}, {}),
+        ("POST", "/api/chat", lambda out: {"session": out[0][1]["session"], "message": "ancora"}, {}),
+        ("POST", "/api/chat", {"session": "scelto-da-me", "message": "ciao"}, {}),
+    ])
+    assert res[0][0] == 200 and len(res[0][1]["session"]) == 32
+    assert res[1] == (200, dict(res[1][1], answer="eco: ancora"))
+    assert res[2][0] == 404
+
+def test_session_list_needs_admin_and_read_is_gated():
+    res = exchange([
+        ("GET", "/api/sessions", None, {}),
+        ("GET", "/api/sessions", None, {"X-Admin-Token": "sbagliato"}),
+        ("GET", "/api/sessions", None, {"X-Admin-Token": "tok"}),
+        ("POST", "/api/chat", {"message": "/read http://127.0.0.1:11434/api/tags"}, {}),
+    ])
+    assert [status for status, _body in res] == [403, 403, 200, 403]
@@ -0,0 +1,35 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from summarize import reduce_partials  # noqa: E402
+
+def echo(label, body):
+    return body                         # modello che non accorcia nulla
+
+def halve(label, body):
+    return "R:" + body[: len(body) // 2]
+
+def test_small_partials_untouched():
+    parts = [("pag. 1", "uno"), ("pag. 2", "due")]
+    assert reduce_partials(parts, echo, 1000) == "[pag. 1]\nuno\n\n[pag. 2]\ndue"
+
+def test_oversized_partials_are_resummarized_alone():
+    calls = []
+
+    def summarize(label, body):
+        calls.append(label)
+        return "breve " + label
+    parts = [(f"pag. {i}", "x" * 500) for i in range(4)]
+    out = reduce_partials(parts, summarize, 300)
+    assert len(out) <= 300
+    assert sorted(calls) == [f"pag. {i}" for i in range(4)]
+    assert "breve pag. 3" in out
+
+def test_block_stays_within_max_chars_when_summaries_do_not_shrink():
+    for parts in ([(f"pag. {i}", "x" * 500) for i in range(4)], [("pag. 1 → 90", "y" * 5000)]):
+        for summarize in (echo, halve):
+            out = reduce_partials(parts, summarize, 300)
+            assert 0 < len(out) <= 300
+            assert out.startswith("[pag.")
@@ -0,0 +1,70 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from page_server import PageServer  # noqa: E402
+from web_client import WebClient  # noqa: E402
+from web_fetch import fetch_many  # noqa: E402
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def make(**kw):
+        srv = PageServer(size_kb=200, **kw).start()
+        started.append(srv)
+        return srv
+    yield make
+    for srv in started:
+        srv.stop()
+
+def wait_until(cond, timeout=5.0):
+    end = time.perf_counter() + timeout
+    while not cond():
+        assert time.perf_counter() < end, "condizione non raggiunta"
+        time.sleep(0.01)
+
+def test_deadline_keeps_fast_pages_and_stops_downloads_in_flight(servers, tmp_path):
+    fast = servers()
+    slow = servers(latency_s=5.0)          # nessuna risposta entro la scadenza
+    drip = servers(drip_s=0.2)             # risposta subito, corpo a goccia per ~2.6s
+    web = WebClient(str(tmp_path))
+    urls = [f"{fast.url}/a", f"{fast.url}/b", f"{slow.url}/c", f"{drip.url}/d"]
+    t0 = time.perf_counter()
+    res = fetch_many(urls, lambda u, t: web.get_text(u, t, max_chars=10**7), deadline_s=0.6)
+    assert time.perf_counter() - t0 < 1.0
+    assert res[urls[0]][0] and res[urls[1]][0]
+    assert res[urls[2]][0] is None and res[urls[3]][0] is None
+    # il download a goccia si ferma da solo al primo pezzo dopo la scadenza, non a fine pagina
+    wait_until(lambda: web.stats()["deadline_aborts"] == 1, timeout=1.0)
+    web.close()
+
+def test_per_host_limit():
+    running = {}
+    peak = {}
+    lock = threading.Lock()
+
+    def fetch(url, timeout):
+        host = url.split("/")[2]
+        with lock:
+            running[host] = running.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), running[host])
+        time.sleep(0.05)
+        with lock:
+            running[host] -= 1
+        return url
+
+    urls = [f"http://{h}.test/{i}" for h in ("uno", "due") for i in range(6)]
+    t0 = time.perf_counter()
+    res = fetch_many(urls, fetch, deadline_s=5, per_host=2, workers=8)
+    assert all(text == url for url, (text, _err, _s) in res.items())
+    assert peak == {"uno.test": 2, "due.test": 2}
+    # 6 pagine per host, 2 alla volta: 3 turni da 50 ms, gli host in parallelo
+    assert time.perf_counter() - t0 < 0.3
@@ -0,0 +1,194 @@
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from lazy_import import LazyModule
+
+# =====================
+# CONFIG
+# =====================
+TRACEMALLOC_FRAMES = 10           # profondità dello stack salvata per ogni allocazione
+MEM_TOP_LINES = 30                # righe del riepilogo memoria per richiesta profilata
+
+# traccia della richiesta in corso: senza traccia attiva gli span non costano quasi nulla
+_trace: contextvars.ContextVar = contextvars.ContextVar("botia_trace", default=None)
+_seq = itertools.count(1)
+# servono solo con --profile: fuori dall'avvio e dal warm-up
+cProfile = LazyModule("cProfile", warm=False)
+tracemalloc = LazyModule("tracemalloc", warm=False)
+
+# =====================
+# TRACCIA
+# =====================
+class Trace:
+    # Una richiesta (turno): span annidati con inizio e durata, in µs dall'inizio della
+    # richiesta. Gli span di thread diversi finiscono su righe diverse del timeline.
+    def __init__(self, name: str, args: Dict[str, Any]):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(_seq)}"
+        self.name = name
+        self.args = args
+        self.t0 = time.perf_counter()
+        self.duration_s = 0.0
+        self.events: List[Dict[str, Any]] = []
+        self.threads: Dict[int, str] = {}
+
+    def add(self, name: str, start: float, duration_s: float, args: Optional[Dict[str, Any]] = None) -> None:
+        tid = threading.get_ident()
+        if tid not in self.threads:
+            self.threads[tid] = threading.current_thread().name
+        self.events.append({"name": name, "cat": "botia", "ph": "X", "pid": os.getpid(), "tid": tid,
+                            "ts": round((start - self.t0) * 1e6, 1), "dur": round(duration_s * 1e6, 1),
+                            "args": args or {}})
+
+    def chrome(self) -> Dict[str, Any]:
+        # formato Trace Event di Chrome: si apre con chrome://tracing o ui.perfetto.dev
+        meta = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in self.threads.items()]
+        return {"traceEvents": meta + sorted(self.events, key=lambda e: e["ts"]), "displayTimeUnit": "ms",
+                "otherData": dict(self.args, request=self.name, id=self.id, duration_ms=round(self.duration_s * 1000, 1))}
+
+@contextmanager
+def span(name: str, **args: Any) -> Iterator[Dict[str, Any]]:
+    # il dict restituito si può arricchire dentro il blocco (byte letti, righe, ...)
+    trace = _trace.get()
+    if trace is None:
+        yield args
+        return
+    t0 = time.perf_counter()
+    try:
+        yield args
+    finally:
+        trace.add(name, t0, time.perf_counter() - t0, args)
+
+def add_span(name: str, start: float, duration_s: float, **args: Any) -> None:
+    # span già misurato altrove (pagine di un PDF, fasi riportate da Ollama)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, start, duration_s, args)
+
+def add_llm_spans(elapsed_s: float, stats: Dict[str, Any], **args: Any) -> None:
+    # una chiamata al modello vista dal client: attesa del primo token (coda, caricamento,
+    # valutazione del prompt) e poi generazione; i tempi di Ollama vanno negli argomenti
+    trace = _trace.get()
+    if trace is None:
+        return
+    end = time.perf_counter()
+    start = end - elapsed_s
+    ttft = min(stats.get("ttft_s", elapsed_s), elapsed_s)
+    trace.add("llm", start, elapsed_s, dict(args, cache=stats.get("cache"), error=stats.get("error")))
+    trace.add("llm.prompt_eval", start, ttft, {
+        "prompt_tokens": stats.get("prompt_eval_count"), "reused_tokens": stats.get("reused_tokens"),
+        "prompt_eval_ms": round(stats.get("prompt_eval_duration", 0) / 1e6, 1),
+        "load_ms": round(stats.get("load_duration", 0) / 1e6, 1)})
+    trace.add("llm.generate", start + ttft, elapsed_s - ttft, {
+        "tokens": stats.get("eval_count"), "tokens_per_s": round(stats.get("tokens_per_s", 0.0), 1),
+        "eval_ms": round(stats.get("eval_duration", 0) / 1e6, 1)})
+
+def carry_trace(fn: Callable[..., Any]) -> Callable[..., Any]:
+    # i pool di thread non ereditano i contextvar: fn scrive nella traccia del chiamante
+    trace = _trace.get()
+    if trace is None:
+        return fn
+
+    def run(*args: Any, **kwargs: Any) -> Any:
+        token = _trace.set(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _trace.reset(token)
+    return run
+
+# =====================
+# TRACER / PROFILER
+# =====================
+class Tracer:
+    # Con una cartella impostata ogni richiesta diventa un file trace-<id>.json (solo se dura
+    # almeno min_ms). Con profile_top > 0 le richieste girano anche sotto cProfile e
+    # tracemalloc, e per le profile_top più lente restano profile-<id>.prof (pstats /
+    # snakeviz) e profile-<id>.mem.txt (allocazioni per riga): le altre vengono scartate.
+    def __init__(self, directory: str = "", min_ms: float = 0.0, profile_top: int = 0):
+        self.directory = ""
+        self.min_ms = min_ms
+        self.profile_top = 0
+        self._slowest: List[Tuple[float, str]] = []   # heap (durata, id) delle richieste profilate tenute
+        self._lock = threading.Lock()
+        self.configure(directory, min_ms, profile_top)
+
+    def configure(self, directory: str, min_ms: Optional[float] = None, profile_top: Optional[int] = None) -> None:
+        self.directory = directory or ""
+        if min_ms is not None:
+            self.min_ms = min_ms
+        if profile_top is not None:
+            self.profile_top = max(0, profile_top)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        if self.profile_top and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @contextmanager
+    def request(self, name: str, **args: Any) -> Iterator[Optional[Trace]]:
+        if not self.directory:
+            yield None
+            return
+        trace = Trace(name, args)
+        token = _trace.set(trace)
+        prof = None
+        if self.profile_top:
+            prof = cProfile.Profile()
+            try:
+                prof.enable()
+            except ValueError:
+                prof = None    # un altro profiler è già attivo (Python 3.12+: uno per processo)
+        try:
+            yield trace
+        finally:
+            if prof is not None:
+                prof.disable()
+            _trace.reset(token)
+            trace.duration_s = time.perf_counter() - trace.t0
+            trace.add(name, trace.t0, trace.duration_s, args)
+            try:
+                self._export(trace, prof)
+            except OSError:
+                pass       # una traccia persa non deve far fallire la risposta
+
+    def _export(self, trace: Trace, prof: Optional["cProfile.Profile"]) -> None:
+        stem = f"{trace.id}-{re.sub(r'[^A-Za-z0-9_-]+', '', trace.name) or 'req'}"
+        if trace.duration_s * 1000 >= self.min_ms:
+            with open(self._path(f"trace-{stem}.json"), "w", encoding="utf-8") as f:
+                json.dump(trace.chrome(), f, ensure_ascii=False)
+        if prof is None:
+            return
+        with self._lock:
+            if len(self._slowest) >= self.profile_top:
+                if trace.duration_s <= self._slowest[0][0]:
+                    return
+                _d, dropped = heapq.heappop(self._slowest)
+                for ext in (".prof", ".mem.txt"):
+                    try:
+                        os.remove(self._path(f"profile-{dropped}{ext}"))
+                    except OSError:
+                        pass
+            heapq.heappush(self._slowest, (trace.duration_s, stem))
+        current, peak = tracemalloc.get_traced_memory()
+        # senza le allocazioni degli strumenti stessi (profiler, import); si filtra dopo il
+        # raggruppamento per riga, molto più veloce che filtrare le singole tracce
+        skip = (tracemalloc.__file__, cProfile.__file__, "<frozen importlib._bootstrap")
+        top = [st for st in tracemalloc.take_snapshot().statistics("lineno")
+               if not st.traceback[0].filename.startswith(skip)][:MEM_TOP_LINES]
+        prof.dump_stats(self._path(f"profile-{stem}.prof"))
+        with open(self._path(f"profile-{stem}.mem.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{trace.name} {trace.duration_s * 1000:.0f}ms  memoria tracciata: "
+                    f"{current / 1e6:.1f} MB (picco processo {peak / 1e6:.1f} MB)\n\n")
+            f.write("\n".join(str(s) for s in top) + "\n")
+        tracemalloc.reset_peak()
@@ -0,0 +1,255 @@
+import codecs
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from html_text import ContentExtractor, sniff_charset
+from lazy_import import LazyModule, available
+from tracing import span
+
+# =====================
+# CONFIG
+# =====================
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".botia_cache", "pages")
+DEFAULT_FRESH_S = 3600
+DEFAULT_MAX_BYTES = 100_000_000
+DEFAULT_POOL_SIZE = 16
+DEFAULT_MAX_DOWNLOAD = 3_000_000     # byte letti al massimo per pagina
+DEFAULT_MAX_CHARS = 6000
+READ_CHUNK = 16 * 1024
+EXTRACTOR = "content-2"          # cambia quando cambia il testo estratto: le voci vecchie si riscaricano
+TEXT_TYPES = ("text/html", "application/xhtml+xml", "text/plain", "text/xml", "application/xml")
+USER_AGENT = "Mozilla/5.0 (BotIA; +web-read)"
+
+# importati alla prima pagina letta: /web e /read sono rari, l'avvio non li paga
+requests = LazyModule("requests")
+brotli = LazyModule("brotli")     # urllib3 decodifica "br" solo se è installato
+
+# =====================
+# CACHE PAGINE (DISCO)
+# =====================
+class PageCache:
+    # Testo già estratto + validatori HTTP (ETag / Last-Modified) per URL.
+    # Un file JSON per URL, eviction LRU sul totale dei byte come la cache risposte.
+    def __init__(self, directory: Optional[str] = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, url: str) -> str:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory or "", key[:2], key + ".json")
+
+    def _files(self) -> List[Tuple[float, int, str]]:
+        files = []
+        if not self.directory or not os.path.isdir(self.directory):
+            return files
+        for root, _dirs, names in os.walk(self.directory):
+            for n in names:
+                p = os.path.join(root, n)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+        return files
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        if not self.directory:
+            return None
+        p = self._path(url)
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(p)   # mtime = ultimo uso, per l'eviction LRU
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def put(self, url: str, entry: Dict[str, Any]) -> None:
+        if not self.directory:
+            return
+        p = self._path(url)
+        entry = dict(entry, url=url)
+        tmp = f"{p}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, p)
+        except OSError:
+            return
+        with self._lock:
+            self._evict()
+
+    def _evict(self) -> None:
+        files = sorted(self._files())
+        total = sum(size for _m, size, _p in files)
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        for _mtime, size, p in files:
+            if total <= target:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self) -> int:
+        n = 0
+        for _m, _size, p in self._files():
+            try:
+                os.remove(p)
+                n += 1
+            except OSError:
+                pass
+        return n
+
+    def disk_bytes(self) -> int:
+        return sum(size for _m, size, _p in self._files())
+
+# =====================
+# CLIENT HTTP CONDIVISO
+# =====================
+class WebClient:
+    # Una sola Session per tutto il processo: pool di connessioni keep-alive (niente
+    # DNS/TCP/TLS ripetuti), risposte compresse, cache del testo estratto con
+    # revalidazione condizionale (If-None-Match / If-Modified-Since).
+    def __init__(self, cache_dir: Optional[str] = DEFAULT_CACHE_DIR, fresh_s: float = DEFAULT_FRESH_S,
+                 max_bytes: int = DEFAULT_MAX_BYTES, pool_size: int = DEFAULT_POOL_SIZE,
+                 max_download: int = DEFAULT_MAX_DOWNLOAD):
+        self.fresh_s = fresh_s
+        self.max_download = max_download
+        self.cache = PageCache(cache_dir, max_bytes)
+        self.pool_size = pool_size
+        self._session: Any = None
+        self._lock = threading.Lock()
+        self.counters = {"fresh_hits": 0, "revalidated": 0, "misses": 0, "bytes_downloaded": 0, "early_stops": 0,
+                         "deadline_aborts": 0}
+
+    @property
+    def session(self) -> Any:
+        # creata alla prima richiesta (import di requests compreso)
+        with self._lock:
+            if self._session is None:
+                s = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                s.mount("http://", adapter)
+                s.mount("https://", adapter)
+                encoding = "gzip, deflate, br" if available(brotli) else "gzip, deflate"
+                s.headers.update({"User-Agent": USER_AGENT, "Accept-Encoding": encoding})
+                self._session = s
+            return self._session
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def _read_text(self, resp: "requests.Response", max_chars: int, deadline: float) -> Tuple[str, bool]:
+        # download a pezzi: decodifica + estrazione incrementali, stop appena c'è
+        # abbastanza testo o si supera il tetto di byte; oltre la scadenza si abbandona
+        ctype = resp.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if ctype and ctype not in TEXT_TYPES:
+            raise ValueError(f"Contenuto non testuale ({ctype})")
+        plain = ctype == "text/plain"
+        charset = requests.utils.get_encoding_from_headers(resp.headers) if "charset" in resp.headers.get("Content-Type", "").lower() else None
+        extractor = ContentExtractor(max_chars)
+        plain_parts: List[str] = []
+        decoder = None
+        read = 0
+        truncated = False
+        extract_s = 0.0
+        for chunk in resp.iter_content(READ_CHUNK):
+            if time.perf_counter() > deadline:
+                # il timeout di requests vale per singola lettura: una pagina che arriva a
+                # goccia lo rinnoverebbe all'infinito
+                self._count("bytes_downloaded", read)
+                self._count("deadline_aborts")
+                raise TimeoutError("download oltre la scadenza")
+            if decoder is None:
+                enc = charset or sniff_charset(chunk) or "utf-8"
+                try:
+                    decoder = codecs.getincrementaldecoder(enc)(errors="replace")
+                except LookupError:
+                    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            read += len(chunk)
+            piece = decoder.decode(chunk)
+            if plain:
+                plain_parts.append(piece)
+                done = sum(len(p) for p in plain_parts) > max_chars
+            else:
+                t0 = time.perf_counter()
+                extractor.feed(piece)
+                extract_s += time.perf_counter() - t0
+                done = extractor.done
+            if done or read >= self.max_download:
+                truncated = True
+                break
+        self._count("bytes_downloaded", read)
+        if truncated:
+            self._count("early_stops")
+        if plain:
+            return "".join(plain_parts)[:max_chars + 1], truncated
+        with span("html.extract", incremental_ms=round(extract_s * 1000, 1)):
+            extractor.close()
+            return extractor.text(), truncated
+
+    def get_text(self, url: str, timeout: float, max_chars: int = DEFAULT_MAX_CHARS) -> str:
+        # timeout = tempo totale per la pagina (connessione, risposta e corpo)
+        deadline = time.perf_counter() + timeout
+        entry = self.cache.get(url)
+        if entry is not None and entry.get("extractor") != EXTRACTOR:
+            entry = None
+        if entry is not None and entry.get("truncated") and entry.get("max_chars", 0) < max_chars:
+            entry = None   # in cache c'è solo un estratto più corto di quello richiesto
+        if entry is not None and time.time() - entry.get("fetched", 0) < self.fresh_s:
+            self._count("fresh_hits")
+            return entry["text"]
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        with span("http.fetch", url=url, conditional=bool(headers)) as sp:
+            resp = self.session.get(url, headers=headers, timeout=timeout, stream=True)
+            sp["status"] = resp.status_code
+        with resp:
+            if resp.status_code == 304 and entry is not None:
+                # pagina invariata: si rinnova la freschezza senza riscaricare né rianalizzare
+                self._count("revalidated")
+                entry["fetched"] = time.time()
+                self.cache.put(url, entry)
+                return entry["text"]
+            resp.raise_for_status()
+            self._count("misses")
+            # download ed estrazione sono intrecciati: il tempo di estrazione è negli argomenti
+            with span("http.body", url=url) as sp:
+                text, truncated = self._read_text(resp, max_chars, deadline)
+                sp.update(chars=len(text), truncated=truncated)
+            etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        self.cache.put(url, {
+            "text": text,
+            "truncated": truncated,
+            "extractor": EXTRACTOR,
+            "max_chars": max_chars,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched": time.time(),
+        })
+        return text
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self.counters)
+        c["disk_bytes"] = self.cache.disk_bytes()
+        return c
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
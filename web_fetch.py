@@ -0,0 +1,82 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# =====================
+# CONFIG
+# =====================
+DEFAULT_DEADLINE_S = 8.0
+DEFAULT_PER_HOST = 2
+DEFAULT_WORKERS = 8
+
+# (url, timeout) -> testo
+Fetcher = Callable[[str, float], str]
+# url -> (testo o None, errore o None, secondi)
+FetchResult = Tuple[Optional[str], Optional[str], float]
+
+def host_of(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+# =====================
+# FETCH CONCORRENTE
+# =====================
+def fetch_many(
+    urls: List[str],
+    fetch: Fetcher,
+    deadline_s: float = DEFAULT_DEADLINE_S,
+    per_host: int = DEFAULT_PER_HOST,
+    workers: int = DEFAULT_WORKERS,
+    timeout_s: Optional[float] = None,
+) -> Dict[str, FetchResult]:
+    # Scarica tutte le pagine in parallelo con una scadenza globale: si usa ciò che
+    # arriva in tempo, il resto viene annullato. Ogni fetch riceve come timeout il tempo
+    # che manca alla scadenza e lo rispetta per l'intero download (WebClient.get_text
+    # lo controlla tra un pezzo e l'altro), quindi i download in corso si fermano da soli
+    # e liberano il semaforo dell'host poco dopo la scadenza.
+    # Al massimo per_host richieste contemporanee verso lo stesso host.
+    t0 = time.perf_counter()
+    deadline = t0 + deadline_s
+    urls = list(dict.fromkeys(u for u in urls if u))
+    results: Dict[str, FetchResult] = {}
+    if not urls:
+        return results
+    limits: Dict[str, threading.BoundedSemaphore] = {}
+    for u in urls:
+        limits.setdefault(host_of(u), threading.BoundedSemaphore(max(1, per_host)))
+
+    def job(url: str) -> FetchResult:
+        started = time.perf_counter()
+        sem = limits[host_of(url)]
+        if not sem.acquire(timeout=max(0.0, deadline - started)):
+            return None, "scadenza", time.perf_counter() - started
+        try:
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                return None, "scadenza", time.perf_counter() - started
+            t = min(left, timeout_s) if timeout_s else left
+            return fetch(url, t), None, time.perf_counter() - started
+        except Exception as e:
+            return None, str(e) or e.__class__.__name__, time.perf_counter() - started
+        finally:
+            sem.release()
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(urls))))
+    futures = {pool.submit(job, u): u for u in urls}
+    pending = set(futures)
+    try:
+        while pending:
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                break
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            for fut in done:
+                results[futures[fut]] = fut.result()
+    finally:
+        for fut in pending:
+            fut.cancel()
+            results[futures[fut]] = (None, "scadenza", time.perf_counter() - t0)
+        # i fetch già partiti si fermano al loro timeout (= scadenza): non si aspetta
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results